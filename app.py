@@ -3,160 +3,295 @@ from dash import html, dcc, Output, Input, State
 from layouts.login import login_layout
 from layouts.register import register_layout
 from layouts.team import team_layout
-from layouts.home import home_layout, register_callbacks
-import paho.mqtt.client as mqtt
+from layouts.home import (
+    EXCEL_EXPORT_INTERVAL,
+    EXCEL_FILE_PATH,
+    home_layout,
+    register_callbacks,
+    backfill,
+    export_to_excel,
+    load_descriptions_from_excel,
+)
+from services.archive import ReportArchive
+from services.description_watcher import DescriptionWatcher
+from services.follower import DatabaseFollower
+from services.ingest import IngestPipeline
+from services.metrics import register_metrics_route
+from services.persistence import PersistenceScheduler, PersistenceWorker, ReportDatabase
+from services.report_store import ReportStore
+from services.thumbnails import ThumbnailCache
+from services.log import configure_logging
+import atexit
+import logging
+import os
 import threading
-import json
+
+logger = logging.getLogger(__name__)
+
+# MQTT setup - KERBTRACK_MQTT_BROKER overrides the public test broker
+BROKER = os.environ.get("KERBTRACK_MQTT_BROKER", "broker.hivemq.com")
+BROKER_PORT = int(os.environ.get("KERBTRACK_MQTT_PORT", "1883"))
+TOPIC = "test/kerbtrack/json_data"
+
+# "all" serves and ingests in one process; "web" only serves, following the
+# database a separate ingest_worker.py process writes
+ROLES = ("all", "web")
+ROLE = os.environ.get("KERBTRACK_ROLE", "all")
+
+# Seconds between reconnect attempts, doubling up to the maximum while the broker is down
+RECONNECT_MIN_DELAY = 1
+RECONNECT_MAX_DELAY = 60
 
 # Tailwind CSS
 external_scripts = ["https://cdn.tailwindcss.com"]
 
-app = dash.Dash(
-    __name__, external_scripts=external_scripts, suppress_callback_exceptions=True
-)
+# User
+fake_users = {"admin_test": "admintest123", "dalin": "1234", "umair": "umair123"}
 
-# Shared MQTT data store
-mqtt_data = []
 
-# MQTT setup
-broker = "broker.hivemq.com"
-topic = "test/kerbtrack/json_data"
+def start_mqtt(ingest_pipeline, broker=BROKER, port=BROKER_PORT, topic=TOPIC):
+    """Connect to the broker on paho's network thread, retrying with backoff
 
+    Nothing here blocks: the connection (and every reconnect) happens in the
+    background, and the topic is subscribed again each time it succeeds.
+    """
+    import paho.mqtt.client as mqtt
 
-def on_message(client, userdata, msg):
-    try:
-        data = json.loads(msg.payload.decode())
-        print("Received MQTT message:", data)
-        mqtt_data.append(data)
-        # REMOVED: if len(mqtt_data) > 30: mqtt_data.pop(0)
-        # Now it keeps all data without removing oldest
-    except Exception as e:
-        print("MQTT error:", e)
+    client = mqtt.Client()
+    client.on_message = ingest_pipeline.on_message
 
+    def on_connect(client, userdata, flags, rc):
+        if rc == 0:
+            logger.info("Connected to MQTT broker %s:%d", broker, port)
+            client.subscribe(topic)
+        else:
+            logger.warning("MQTT broker %s:%d refused the connection (rc %d)", broker, port, rc)
 
-mqtt_client = mqtt.Client()
-mqtt_client.on_message = on_message
-mqtt_client.connect(broker, 1883)
-mqtt_client.subscribe(topic)
+    def on_disconnect(client, userdata, rc):
+        if rc != 0:
+            logger.warning("Lost the MQTT broker connection (rc %d), reconnecting", rc)
 
+    client.on_connect = on_connect
+    client.on_disconnect = on_disconnect
+    client.reconnect_delay_set(RECONNECT_MIN_DELAY, RECONNECT_MAX_DELAY)
+    client.connect_async(broker, port)
+    client.loop_start()
+    return client
 
-def mqtt_loop():
-    mqtt_client.loop_forever()
 
+def register_page_callbacks(app):
+    # Login callback with redirect
+    @app.callback(
+        Output("login-state", "data"),
+        Output("login-message", "children"),
+        Output("url", "pathname"),  # Redirect to "/"
+        Input("login-button", "n_clicks"),
+        State("login-username", "value"),
+        State("login-password", "value"),
+        prevent_initial_call=True,
+        allow_duplicate=True,
+    )
 
-thread = threading.Thread(target=mqtt_loop)
-thread.daemon = True
-thread.start()
+    # login button
+    def handle_login(n_clicks, username, password):
+        # Check if username or password is empty or None
+        if not username or not password:
+            return (
+                {"logged_in": False, "user": None},
+                "Please enter username and password",
+                dash.no_update,
+            )
 
-# User
-fake_users = {"admin_test": "admintest123", "dalin": "1234", "umair": "umair123"}
+        # Check users
+        if username in fake_users and password == fake_users[username]:
+            return {"logged_in": True, "user": username}, "", "/"
+        else:
+            return (
+                {"logged_in": False, "user": None},
+                "Invalid username or password",
+                dash.no_update,
+            )
 
-# App layout
-app.layout = html.Div(
-    [
-        dcc.Location(id="url", refresh=False),  # Controls navigation
-        dcc.Store(
-            id="login-state",
-            data={"logged_in": False, "user": None},
-            storage_type="session",
-        ),
-        html.Div(id="page-content"),
-    ]
-)
+    # This is where your page routing callback goes:
+    @app.callback(
+        Output("page-content", "children"),
+        Input("url", "pathname"),
+        State("login-state", "data"),
+    )
+    def display_page(pathname, login_data):
+        logged_in = login_data.get("logged_in", False)
+        user = login_data.get("user", None)
 
+        if pathname == "/login" or pathname is None:
+            return login_layout
+        elif pathname == "/register":
+            return register_layout
+        elif pathname == "/team":
+            return team_layout
+        elif pathname == "/" and logged_in:
+            return html.Div(
+                [
+                    html.H1(
+                        f"Welcome, {user}!", className="text-xl font-bold text-center mt-4"
+                    ),
+                    home_layout(),
+                ]
+            )
+        elif pathname == "/" and not logged_in:
+            return dcc.Location(pathname="/login", id="redirect-login")
+        else:
+            return html.Div(
+                [
+                    html.H1(
+                        "404 - Page Not Found",
+                        className="text-red-500 text-2xl font-bold text-center mt-10",
+                    ),
+                    html.A(
+                        "Back to Home",
+                        href="/",
+                        className="block text-center mt-4 text-emerald-600 underline",
+                    ),
+                ]
+            )
 
-# Login callback with redirect
-@app.callback(
-    Output("login-state", "data"),
-    Output("login-message", "children"),
-    Output("url", "pathname"),  # Redirect to "/"
-    Input("login-button", "n_clicks"),
-    State("login-username", "value"),
-    State("login-password", "value"),
-    prevent_initial_call=True,
-    allow_duplicate=True,
-)
+    # mobile menu toggle
+    @app.callback(
+        Output("mobile-menu", "className"),
+        Input("menu-toggle", "n_clicks"),
+        State("mobile-menu", "className"),
+        prevent_initial_call=True,
+    )
+    def toggle_menu(n_clicks, current_class):
+        if "hidden" in current_class:
+            return current_class.replace("hidden", "").strip()
+        else:
+            return current_class + " hidden"
 
-# login button
-def handle_login(n_clicks, username, password):
-    # Check if username or password is empty or None
-    if not username or not password:
-        return (
-            {"logged_in": False, "user": None},
-            "Please enter username and password",
-            dash.no_update,
-        )
 
-    # Check users
-    if username in fake_users and password == fake_users[username]:
-        return {"logged_in": True, "user": username}, "", "/"
-    else:
-        return (
-            {"logged_in": False, "user": None},
-            "Invalid username or password",
-            dash.no_update,
-        )
+def create_app(broker=BROKER, port=BROKER_PORT, topic=TOPIC, role=ROLE):
+    """Build the dashboard, ready to serve as soon as this returns
 
+    role "all" runs everything in this process. The backfill from the
+    database (the Excel workbook on a first run) and the MQTT connection
+    run on a startup thread, so a large backfill or an unreachable broker
+    never holds up the web server. The broker is only
+    contacted once the backfill is done, so live reports always land on top
+    of the historic ones. broker=None leaves MQTT out.
 
-# This is where your page routing callback goes:
-@app.callback(
-    Output("page-content", "children"),
-    Input("url", "pathname"),
-    State("login-state", "data"),
-)
-def display_page(pathname, login_data):
-    logged_in = login_data.get("logged_in", False)
-    user = login_data.get("user", None)
-
-    if pathname == "/login" or pathname is None:
-        return login_layout
-    elif pathname == "/register":
-        return register_layout
-    elif pathname == "/team":
-        return team_layout
-    elif pathname == "/" and logged_in:
-        return html.Div(
-            [
-                html.H1(
-                    f"Welcome, {user}!", className="text-xl font-bold text-center mt-4"
-                ),
-                home_layout,
-            ]
-        )
-    elif pathname == "/" and not logged_in:
-        return dcc.Location(pathname="/login", id="redirect-login")
+    role "web" is for multi-worker deployments (see wsgi.py): no MQTT and no
+    writes, the store follows the database that ingest_worker.py fills.
+    """
+    if role not in ROLES:
+        raise ValueError(f"Unknown role {role!r}, expected one of {', '.join(ROLES)}")
+
+    configure_logging()
+
+    # Loaded before serving rather than on first use: plotly's JSON encoder
+    # uses pandas whenever it is in sys.modules, so a request encoded while
+    # another thread is halfway through importing it fails
+    import pandas  # noqa: F401
+
+    app = dash.Dash(
+        __name__, external_scripts=external_scripts, suppress_callback_exceptions=True
+    )
+    app.mqtt_client = None
+    app.startup_thread = None
+
+    report_database = ReportDatabase()
+
+    # Map popup and table images, fetched once and served from local disk
+    thumbnails = ThumbnailCache()
+
+    # Parquet history for exports; only the process that writes the database adds to it
+    report_archive = ReportArchive(report_database, excel_path=EXCEL_FILE_PATH)
+
+    if role == "web":
+        # The ingest process logs evictions, writes everything back and
+        # watches the workbook; reports and descriptions come from the
+        # database, numbered the same in every worker
+        report_store = ReportStore(eviction_path=None, epoch=report_database.epoch)
+        persistence_worker = None
+        description_watcher = None
+        follower = DatabaseFollower(report_database, report_store)
     else:
-        return html.Div(
-            [
-                html.H1(
-                    "404 - Page Not Found",
-                    className="text-red-500 text-2xl font-bold text-center mt-10",
-                ),
-                html.A(
-                    "Back to Home",
-                    href="/",
-                    className="block text-center mt-4 text-emerald-600 underline",
-                ),
-            ]
+        # Shared MQTT data store
+        report_store = ReportStore()
+
+        # Reloads descriptions from the workbook only when it changes on disk
+        description_watcher = DescriptionWatcher(EXCEL_FILE_PATH, load_descriptions_from_excel)
+
+        # Single writer for the database, exporting to Excel alongside
+        persistence_worker = PersistenceWorker(
+            report_database,
+            export=lambda: export_to_excel(report_database, description_watcher),
         )
+        persistence_worker.start()
 
+        # Decode and store MQTT payloads off the network thread, in batches
+        ingest_pipeline = IngestPipeline(report_store)
+        ingest_pipeline.start()
 
-# mobile menu toggle
-@app.callback(
-    Output("mobile-menu", "className"),
-    Input("menu-toggle", "n_clicks"),
-    State("mobile-menu", "className"),
-    prevent_initial_call=True,
-)
-def toggle_menu(n_clicks, current_class):
-    if "hidden" in current_class:
-        return current_class.replace("hidden", "").strip()
+        # atexit runs last-registered first, so this follows the final flush
+        # that register_callbacks sets up
+        atexit.register(report_archive.roll)
+
+    # App layout
+    app.layout = html.Div(
+        [
+            dcc.Location(id="url", refresh=False),  # Controls navigation
+            dcc.Store(
+                id="login-state",
+                data={"logged_in": False, "user": None},
+                storage_type="session",
+            ),
+            html.Div(id="page-content"),
+        ]
+    )
+
+    register_page_callbacks(app)
+
+    # Register MQTT-dependent callbacks (if any)
+    register_callbacks(
+        app,
+        report_store,
+        persistence_worker,
+        description_watcher,
+        thumbnails,
+        report_archive,
+    )
+
+    # Prometheus-style /metrics for ingest, persistence, the store and every callback
+    report_store.register_metrics()
+    thumbnails.register_metrics()
+    if role == "web":
+        follower.register_metrics()
     else:
-        return current_class + " hidden"
+        persistence_worker.register_metrics()
+        ingest_pipeline.register_metrics()
+        report_archive.register_metrics()
+    register_metrics_route(app)
+
+    # Expiry, database writes and exports run on their own clock, not on browser polls
+    PersistenceScheduler(
+        report_store, persistence_worker, export_interval=EXCEL_EXPORT_INTERVAL
+    ).start()
+
+    if role == "web":
+        follower.start()
+        return app
+
+    description_watcher.start()
+
+    def startup():
+        backfill(report_store, report_database)
+        if broker:
+            app.mqtt_client = start_mqtt(ingest_pipeline, broker, port, topic)
+        report_archive.start()
 
+    app.startup_thread = threading.Thread(target=startup, name="startup", daemon=True)
+    app.startup_thread.start()
+    return app
 
-# Register MQTT-dependent callbacks (if any)
-register_callbacks(app, mqtt_data)
 
 if __name__ == "__main__":
-    app.run(debug=True)
+    create_app().run(debug=True)
@@ -0,0 +1,34 @@
+// Live updates pushed from the server over /events (Server-Sent Events).
+// Every event carries the same delta the fallback interval callback returns,
+// handed to Dash with set_props so the cursor callback applies it.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    live: {
+        connect: function(cursor) {
+            if (window.kerbtrackEvents || typeof EventSource === "undefined"
+                || !window.dash_clientside.set_props) {
+                return window.dash_clientside.no_update;
+            }
+            cursor = cursor || {};
+            const id = [cursor.epoch || "", cursor.seq || 0].join(".");
+            const source = new EventSource("/events?cursor=" + encodeURIComponent(id));
+            window.kerbtrackEvents = source;
+
+            source.addEventListener("reports", function(event) {
+                if (!document.getElementById("mqtt-table")) {
+                    // Left the home page - it connects again when it comes back
+                    source.close();
+                    window.kerbtrackEvents = null;
+                    return;
+                }
+                window.dash_clientside.set_props("mqtt-delta", {data: JSON.parse(event.data)});
+            });
+            source.onerror = function() {
+                if (source.readyState === EventSource.CLOSED) {
+                    // Refused (e.g. too many streams): polling carries on, retry later
+                    window.kerbtrackEvents = null;
+                }
+            };
+            return "connected";
+        }
+    }
+});
@@ -0,0 +1,171 @@
+"""Local stand-in for the camera image host
+
+Run from the repository root:
+
+    python benchmarks/image_host.py --port 8060 [--delay 0.2] [--size 1600 1200]
+    KERBTRACK_ALLOW_PRIVATE_IMAGES=1 python app.py
+    python mqtt_publisher.py --image-base-url http://localhost:8060 ...
+
+The dashboard only fetches images from public addresses unless
+KERBTRACK_ALLOW_PRIVATE_IMAGES=1 is set, as it is above for localhost.
+
+Answers every GET with a PNG of --size pixels (the same image for the same
+path), after --delay seconds to act like a slow remote host, and counts the
+requests it has served at /stats. With --check it instead serves on a free
+port, thumbnails --count URLs from --threads threads twice over through a
+ThumbnailCache in a scratch directory, and prints the cold and warm times
+and how many requests reached the host; the exit status is 1 if any URL was
+fetched more than once.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+
+DEFAULT_SIZE = (1600, 1200)
+
+# Distinct images handed out, encoded once each
+IMAGE_VARIANTS = 4
+
+
+def png(width, height, seed=0):
+    """An RGB PNG with a gradient per row, so it compresses like a photo would not"""
+
+    def chunk(kind, data):
+        body = kind + data
+        return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body))
+
+    rows = []
+    for y in range(height):
+        shade = (y * 255 // max(height - 1, 1) + seed) % 256
+        rows.append(b"\x00" + bytes((shade, (shade + 85) % 256, (shade + 170) % 256)) * width)
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", header)
+        + chunk(b"IDAT", zlib.compress(b"".join(rows), 6))
+        + chunk(b"IEND", b"")
+    )
+
+
+class ImageHost:
+    """Threaded HTTP server answering every path with a PNG"""
+
+    def __init__(self, port=0, delay=0.0, size=DEFAULT_SIZE):
+        self.delay = delay
+        self.requests = 0
+        self.paths = {}
+        self._lock = threading.Lock()
+        self._images = {}
+        host = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/stats":
+                    body = json.dumps({"requests": host.requests, "paths": len(host.paths)})
+                    return self.reply(body.encode(), "application/json")
+                seed = zlib.crc32(self.path.encode()) % IMAGE_VARIANTS
+                with host._lock:
+                    host.requests += 1
+                    host.paths[self.path] = host.paths.get(self.path, 0) + 1
+                    if seed not in host._images:
+                        host._images[seed] = png(*size, seed * 50)
+                    image = host._images[seed]
+                time.sleep(host.delay)
+                self.reply(image, "image/png")
+
+            def reply(self, body, content_type):
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def check(args):
+    sys.path.insert(0, REPO_DIR)
+    from services.thumbnails import ThumbnailCache, fetch_image
+
+    host = ImageHost(delay=args.delay, size=args.size).start()
+    directory = tempfile.mkdtemp(prefix="kerbtrack-thumbs-")
+    try:
+        # The stand-in listens on 127.0.0.1, which real fetches refuse
+        cache = ThumbnailCache(
+            directory, fetch=lambda url: fetch_image(url, allow_private=True)
+        )
+        urls = [f"{host.url}/kerbside/{i}.jpg" for i in range(1, args.count + 1)]
+        # Every URL asked for by several threads at once, as many browsers would
+        wanted = urls * args.threads
+        with ThreadPoolExecutor(args.threads) as pool:
+            for label in ("cold", "warm"):
+                started = time.perf_counter()
+                list(pool.map(cache.get, wanted))
+                seconds = time.perf_counter() - started
+                print(
+                    f"{label}: {len(wanted)} thumbnails in {seconds:.3f} s "
+                    f"({len(wanted) / seconds:.0f}/s)"
+                )
+        print(
+            f"Image host served {host.requests} requests for {len(urls)} URLs; "
+            f"cache holds {cache.total_bytes} bytes"
+        )
+        return 0 if max(host.paths.values()) == 1 else 1
+    finally:
+        host.stop()
+        shutil.rmtree(directory)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8060)
+    parser.add_argument("--delay", type=float, default=0.0)
+    parser.add_argument("--size", type=int, nargs=2, default=DEFAULT_SIZE)
+    parser.add_argument("--check", action="store_true")
+    parser.add_argument("--count", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    if args.check:
+        return check(args)
+
+    host = ImageHost(args.port, args.delay, args.size)
+    print(f"Serving images on {host.url}")
+    try:
+        host.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
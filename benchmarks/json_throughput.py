@@ -0,0 +1,75 @@
+"""JSON throughput for MQTT ingest decoding and Dash callback responses
+
+Run from the repository root:
+
+    python benchmarks/json_throughput.py [--sizes 1000 10000 100000]
+
+Times the stdlib json module against the fast path in services.fast_json
+(orjson when installed) for decoding raw MQTT payloads and for encoding
+the store delta a browser one report behind is sent, built by
+ReportStore.delta_since as the report_delta callback builds it, the way
+Dash encodes it.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import fast_json  # noqa: E402
+from services.report_store import ReportStore  # noqa: E402
+from synthetic import payloads  # noqa: E402
+
+
+def stdlib_loads(payload):
+    return json.loads(payload.decode())
+
+
+def timed(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    args = parser.parse_args()
+
+    from plotly.io.json import to_json_plotly
+
+    print(f"fast engine: {fast_json.ENGINE}")
+    print(f"{'reports':>8} {'stage':<14} {'stdlib/s':>12} {'fast/s':>12} {'speed-up':>9}")
+    for n in args.sizes:
+        raw = list(payloads(n))
+        store = ReportStore(max_reports=n, eviction_path=None)
+        store.upsert_many(stdlib_loads(p) for p in raw)
+        delta = store.delta_since(store.epoch, 1)
+        stages = [
+            (
+                "decode",
+                lambda: [stdlib_loads(p) for p in raw],
+                lambda: [fast_json.loads(p) for p in raw],
+            ),
+            (
+                "dash response",
+                lambda: to_json_plotly(delta, engine="json"),
+                lambda: to_json_plotly(delta, engine=fast_json.ENGINE),
+            ),
+        ]
+        for stage, slow, fast in stages:
+            slow_seconds, fast_seconds = timed(slow), timed(fast)
+            print(
+                f"{n:>8} {stage:<14} {n / slow_seconds:>12,.0f} "
+                f"{n / fast_seconds:>12,.0f} {slow_seconds / fast_seconds:>8.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,456 @@
+"""Benchmark the dashboard hot paths against synthetic report sets
+
+Run from the repository root:
+
+    python benchmarks/run.py                      # 1k, 10k and 100k reports
+    python benchmarks/run.py --sizes 1000 1000000 --only parse_gps ingest
+    python benchmarks/run.py --update-baseline    # accept the current numbers
+
+Every benchmark is timed (best of --repeat runs) and then run once more
+under tracemalloc for its peak memory. Results are written as JSON to
+--output and compared against --baseline; the exit status is 1 when any
+benchmark is slower (or uses more memory) than the baseline by more than
+--tolerance, so it can gate a deploy.
+"""
+
+import argparse
+import atexit
+import contextlib
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+import synthetic  # noqa: E402
+from services.archive import PYARROW_AVAILABLE  # noqa: E402
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, "baseline.json")
+DEFAULT_OUTPUT = os.path.join(BENCHMARK_DIR, "results", "latest.json")
+
+# openpyxl writes roughly 10k rows/s, so the Excel paths stop here unless asked
+DEFAULT_EXCEL_LIMIT = 100000
+
+# Slower than baseline * tolerance counts as a regression, unless the difference
+# is under the noise floor (millisecond-scale timings jitter by more than 50%)
+DEFAULT_TOLERANCE = 1.5
+NOISE_FLOOR_SECONDS = 0.005
+
+# Newcastle-wide viewport and a few streets' worth for the zoomed-in map
+CITY_BOUNDS = [[-33.00, 151.60], [-32.85, 151.85]]
+STREET_BOUNDS = [[-32.935, 151.755], [-32.920, 151.785]]
+
+
+class Context:
+    """Everything a benchmark needs for one report-set size, built lazily"""
+
+    def __init__(self, n, workdir):
+        self.n = n
+        self.workdir = workdir
+        self._store = None
+        self._database = None
+        self._app = None
+
+    @property
+    def store(self):
+        if self._store is None:
+            from services.report_store import ReportStore
+
+            self._store = ReportStore(max_reports=self.n, eviction_path=None)
+            self._store.upsert_many(synthetic.reports(self.n))
+            self._store.set_descriptions(synthetic.descriptions(self.n))
+            self._store.take_dirty()
+        return self._store
+
+    @property
+    def database(self):
+        """A report database holding the store's reports and descriptions"""
+        if self._database is None:
+            from services.persistence import ReportDatabase
+
+            self._database = ReportDatabase(
+                os.path.join(self.workdir, f"bench-history-{self.n}.db")
+            )
+            self._database.upsert_reports(self.store.snapshot())
+            self._database.update_descriptions(synthetic.descriptions(self.n))
+        return self._database
+
+    @property
+    def app(self):
+        """A Dash app with the home callbacks registered over the populated store"""
+        if self._app is None:
+            import dash
+            from dash import html
+
+            from layouts.home import home_layout, register_callbacks
+            from services.archive import ReportArchive
+            from services.description_watcher import DescriptionWatcher
+            from services.persistence import PersistenceWorker, ReportDatabase
+            from services.thumbnails import ThumbnailCache
+
+            database = ReportDatabase(os.path.join(self.workdir, f"bench-{self.n}.db"))
+            watcher = DescriptionWatcher(
+                os.path.join(self.workdir, "missing.xlsx"), lambda: {}
+            )
+            self._app = dash.Dash(__name__)
+            self._app.layout = html.Div([home_layout()])
+            register_callbacks(
+                self._app,
+                self.store,
+                PersistenceWorker(database),
+                watcher,
+                ThumbnailCache(os.path.join(self.workdir, "thumbnails")),
+                ReportArchive(database, os.path.join(self.workdir, "archive")),
+            )
+        return self._app
+
+    def callback(self, outputs, inputs, state=()):
+        """Run a Dash callback the way the browser does, returns the raw response body"""
+        output = "...".join(f"{i}.{p}" for i, p in outputs)
+        body = {
+            "output": f"..{output}.." if len(outputs) > 1 else output,
+            "outputs": (
+                [{"id": i, "property": p} for i, p in outputs]
+                if len(outputs) > 1
+                else {"id": outputs[0][0], "property": outputs[0][1]}
+            ),
+            "inputs": [{"id": i, "property": p, "value": v} for i, p, v in inputs],
+            "state": [{"id": i, "property": p, "value": v} for i, p, v in state],
+            "changedPropIds": [f"{inputs[0][0]}.{inputs[0][1]}"],
+        }
+        response = self.app.server.test_client().post(
+            "/_dash-update-component", json=body
+        )
+        if response.status_code not in (200, 204):
+            raise RuntimeError(f"Callback failed ({response.status_code})")
+        return response.data
+
+
+# Each benchmark takes a Context and returns the zero-argument callable to time.
+# Callables that hit the view cache vary their inputs per call so every run misses.
+
+
+def bench_parse_gps(ctx):
+    from services.geo import parse_gps
+
+    gps = [report["GPS"] for report in synthetic.reports(ctx.n)]
+    return lambda: [parse_gps(value) for value in gps]
+
+
+def bench_parse_gps_series(ctx):
+    import pandas as pd
+
+    from services.geo import parse_gps_series
+
+    gps = pd.Series([report["GPS"] for report in synthetic.reports(ctx.n)])
+    return lambda: parse_gps_series(gps)
+
+
+def bench_ingest(ctx):
+    from services.ingest import IngestPipeline
+    from services.report_store import ReportStore
+
+    payloads = list(synthetic.payloads(ctx.n))
+
+    def run():
+        store = ReportStore(max_reports=ctx.n, eviction_path=None)
+        IngestPipeline(store).process(payloads)
+
+    return run
+
+
+def bench_update_store(ctx):
+    ctx.store
+    calls = [0]
+
+    def run():
+        # A client 100 changes behind plus a brand new client
+        calls[0] += 1
+        for seq in (ctx.store.seq - 100 - calls[0], 0):
+            ctx.callback(
+                [("mqtt-delta", "data")],
+                [("interval", "n_intervals", calls[0])],
+                [("mqtt-cursor", "data", {"epoch": ctx.store.epoch, "seq": seq})],
+            )
+
+    return run
+
+
+def bench_update_table(ctx):
+    ctx.store
+    calls = [0]
+
+    def run():
+        # Newest page, a sorted page, and a search plus filter
+        calls[0] += 1
+        for search, sort_by, filter_query in (
+            ("", [], ""),
+            ("", [{"column_id": "Address", "direction": "asc"}], ""),
+            ("hunter", [], "{Message} contains kerbside"),
+        ):
+            ctx.callback(
+                [("mqtt-table", "data"), ("mqtt-table", "page_count")],
+                [
+                    ("mqtt-cursor", "data", {}),
+                    ("search-input", "value", search),
+                    ("mqtt-table", "page_current", calls[0]),
+                    ("mqtt-table", "page_size", 10),
+                    ("mqtt-table", "sort_by", sort_by),
+                    ("mqtt-table", "filter_query", filter_query),
+                ],
+            )
+
+    return run
+
+
+def bench_update_map_markers(ctx):
+    ctx.store
+    calls = [0]
+
+    def run():
+        # Clusters for the whole city, then individual markers for a few streets
+        calls[0] += 1
+        nudge = calls[0] * 0.001
+        for bounds, zoom in ((CITY_BOUNDS, 12), (STREET_BOUNDS, 16)):
+            (south, west), (north, east) = bounds
+            ctx.callback(
+                [("map-markers", "children")],
+                [
+                    ("mqtt-cursor", "data", {}),
+                    ("map", "bounds", [[south + nudge, west], [north + nudge, east]]),
+                    ("map", "zoom", zoom),
+                ],
+            )
+
+    return run
+
+
+def bench_save_to_excel(ctx):
+    from layouts.home import save_to_excel
+    from services.report import ReportColumns
+
+    frame = ReportColumns.from_reports(
+        ctx.store.snapshot(),
+        {int(k): v for k, v in synthetic.descriptions(ctx.n).items()},
+    ).to_frame()
+    # Start from a workbook with the same IDs so the merge path runs
+    save_to_excel(frame)
+    return lambda: save_to_excel(frame)
+
+
+def bench_merge_with_existing(ctx):
+    from layouts.home import merge_with_existing
+    from services.report import ReportColumns
+
+    frame = ReportColumns.from_reports(ctx.store.snapshot(), {}).to_frame()
+    # The saved workbook shares half the IDs and carries every description
+    existing = ReportColumns.from_reports(
+        ctx.store.snapshot(),
+        {int(k): v for k, v in synthetic.descriptions(ctx.n, fraction=1.0).items()},
+    ).to_frame()
+    existing["ID"] = existing["ID"] + ctx.n // 2
+    return lambda: merge_with_existing(frame, existing)
+
+
+def bench_load_descriptions_from_excel(ctx):
+    from layouts.home import EXCEL_FILE_PATH, load_descriptions_from_excel
+
+    if not os.path.exists(EXCEL_FILE_PATH):
+        bench_save_to_excel(ctx)
+    return load_descriptions_from_excel
+
+
+def bench_archive_roll(ctx):
+    from services.archive import ReportArchive
+
+    directory = os.path.join(ctx.workdir, f"archive-roll-{ctx.n}")
+    database = ctx.database
+
+    def run():
+        shutil.rmtree(directory, ignore_errors=True)
+        ReportArchive(database, directory).roll()
+
+    return run
+
+
+def bench_archive_read(ctx):
+    from services.archive import ReportArchive
+
+    archive = ReportArchive(ctx.database, os.path.join(ctx.workdir, f"archive-{ctx.n}"))
+    archive.roll()
+    # What a description history export reads; compare load_descriptions_from_excel
+    return lambda: archive.read(["ID", "Suburb", "Image_Description"], latest=True)
+
+
+BENCHMARKS = {
+    "parse_gps": bench_parse_gps,
+    "parse_gps_series": bench_parse_gps_series,
+    "ingest": bench_ingest,
+    "update_store": bench_update_store,
+    "update_table": bench_update_table,
+    "update_map_markers": bench_update_map_markers,
+    "merge_with_existing": bench_merge_with_existing,
+    "save_to_excel": bench_save_to_excel,
+    "load_descriptions_from_excel": bench_load_descriptions_from_excel,
+    "archive_roll": bench_archive_roll,
+    "archive_read": bench_archive_read,
+}
+
+EXCEL_BENCHMARKS = {"save_to_excel", "load_descriptions_from_excel"}
+
+# Skipped when pyarrow is not installed
+ARCHIVE_BENCHMARKS = {"archive_roll", "archive_read"}
+
+
+def measure(run, repeat):
+    """(best seconds, peak traced bytes) for a callable"""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - started)
+
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+def quietly(fn, *args):
+    """Call fn with anything the code under test prints discarded"""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        return fn(*args)
+
+
+def compare(results, baseline, tolerance):
+    """Lines describing each result against the baseline, and whether any regressed"""
+    previous = {
+        (entry["benchmark"], entry["reports"]): entry
+        for entry in baseline.get("results", [])
+    }
+    lines = []
+    regressed = False
+    for entry in results:
+        old = previous.get((entry["benchmark"], entry["reports"]))
+        if old is None:
+            lines.append(f"{entry['benchmark']:<30} {entry['reports']:>8}  (no baseline)")
+            continue
+        time_ratio = entry["seconds"] / old["seconds"] if old["seconds"] else 1.0
+        memory_ratio = (
+            entry["peak_bytes"] / old["peak_bytes"] if old["peak_bytes"] else 1.0
+        )
+        slower = (
+            time_ratio > tolerance
+            and entry["seconds"] - old["seconds"] > NOISE_FLOOR_SECONDS
+        ) or memory_ratio > tolerance
+        regressed = regressed or slower
+        lines.append(
+            f"{entry['benchmark']:<30} {entry['reports']:>8}  "
+            f"time x{time_ratio:.2f}  memory x{memory_ratio:.2f}"
+            + ("  REGRESSION" if slower else "")
+        )
+    return lines, regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--excel-limit", type=int, default=DEFAULT_EXCEL_LIMIT)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="write these results as the new baseline instead of comparing",
+    )
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output)
+    baseline_path = os.path.abspath(args.baseline)
+
+    # The home layout writes its workbook (and an exit-time export) to the cwd
+    workdir = tempfile.mkdtemp(prefix="kerbtrack-bench-")
+    os.chdir(workdir)
+    atexit.register(lambda: print(f"Scratch files left in {workdir}"))
+
+    from services import fast_json
+
+    results = []
+    names = args.only or list(BENCHMARKS)
+    for n in args.sizes:
+        ctx = Context(n, workdir)
+        for name in names:
+            if name in EXCEL_BENCHMARKS and n > args.excel_limit:
+                continue
+            if name in ARCHIVE_BENCHMARKS and not PYARROW_AVAILABLE:
+                continue
+            run = quietly(BENCHMARKS[name], ctx)
+            seconds, peak = quietly(measure, run, args.repeat)
+            results.append(
+                {
+                    "benchmark": name,
+                    "reports": n,
+                    "seconds": round(seconds, 6),
+                    "per_report_us": round(seconds / n * 1e6, 3),
+                    "peak_bytes": peak,
+                }
+            )
+            print(
+                f"{name:<30} {n:>8}  {seconds * 1000:>10.1f} ms  "
+                f"{peak / 2**20:>8.1f} MiB peak",
+                flush=True,
+            )
+
+    report = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "json_engine": fast_json.ENGINE,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+
+    if args.update_baseline:
+        output = baseline_path
+        # Entries this run did not measure (other sizes, --only) are kept
+        if os.path.exists(baseline_path):
+            with open(baseline_path, encoding="utf-8") as f:
+                measured = {(entry["benchmark"], entry["reports"]) for entry in results}
+                report["results"] = [
+                    entry
+                    for entry in json.load(f).get("results", [])
+                    if (entry["benchmark"], entry["reports"]) not in measured
+                ] + results
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.update_baseline or not os.path.exists(baseline_path):
+        return 0
+
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    lines, regressed = compare(results, baseline, args.tolerance)
+    print(f"\nAgainst {baseline_path} (tolerance x{args.tolerance}):")
+    print("\n".join(lines))
+    return 1 if regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""Cold-start time of the dashboard with no MQTT broker reachable
+
+Run from the repository root:
+
+    python benchmarks/startup.py [--target 5] [--backfill 10000]
+
+Starts the dashboard in a fresh interpreter (so every import is paid for),
+pointed at a broker address that never answers, and times how long it takes
+until the home page is served. With --backfill it first writes a workbook of
+that many synthetic reports for the first-run import to load. The exit
+status is 1 if serving took longer than --target seconds.
+"""
+
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+
+DEFAULT_TARGET_SECONDS = 5.0
+
+# TEST-NET-1 (RFC 5737): connecting there hangs rather than being refused,
+# which is the slow case a blocking connect used to stall on
+UNREACHABLE_BROKER = "192.0.2.1"
+
+SERVER = """
+import app
+app.create_app(broker={broker!r}).run(port={port}, debug=False)
+"""
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def write_workbook(workdir, n):
+    sys.path.insert(0, REPO_DIR)
+    sys.path.insert(0, BENCHMARK_DIR)
+    import synthetic
+    from layouts.home import EXCEL_FILE_PATH, save_to_excel
+    from services.report import ReportColumns
+    from services.report_store import ReportStore
+
+    store = ReportStore(max_reports=n, eviction_path=None)
+    store.upsert_many(synthetic.reports(n))
+    frame = ReportColumns.from_reports(store.snapshot(), {}).to_frame()
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        save_to_excel(frame)
+    finally:
+        os.chdir(cwd)
+    return os.path.join(workdir, EXCEL_FILE_PATH)
+
+
+def wait_until_serving(url, process, timeout):
+    """Seconds until url answers 200, None if the server died or timed out"""
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        if process.poll() is not None:
+            return None
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return time.perf_counter() - started
+        except (urllib.error.URLError, ConnectionError, socket.timeout):
+            pass
+        time.sleep(0.02)
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--target", type=float, default=DEFAULT_TARGET_SECONDS)
+    parser.add_argument("--backfill", type=int, default=0)
+    parser.add_argument("--broker", default=UNREACHABLE_BROKER)
+    parser.add_argument("--timeout", type=float, default=60)
+    args = parser.parse_args()
+
+    # The dashboard writes its database and workbook to the cwd
+    workdir = tempfile.mkdtemp(prefix="kerbtrack-startup-")
+    if args.backfill:
+        path = write_workbook(workdir, args.backfill)
+        print(f"Wrote {args.backfill} reports to {path}")
+
+    port = free_port()
+    env = dict(os.environ, PYTHONPATH=REPO_DIR, KERBTRACK_LOG_LEVEL="WARNING")
+    process = subprocess.Popen(
+        [sys.executable, "-c", SERVER.format(broker=args.broker, port=port)],
+        cwd=workdir,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        seconds = wait_until_serving(f"http://127.0.0.1:{port}/", process, args.timeout)
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+    if seconds is None:
+        print(f"Dashboard did not serve within {args.timeout:.0f} s")
+        return 1
+    print(
+        f"Serving after {seconds:.2f} s with broker {args.broker} unreachable "
+        f"(target {args.target:.1f} s)"
+    )
+    print(f"Scratch files left in {workdir}")
+    return 0 if seconds <= args.target else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
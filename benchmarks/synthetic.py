@@ -0,0 +1,80 @@
+"""Deterministic synthetic reports spread across Newcastle suburbs"""
+
+import json
+import random
+
+# Suburb -> approximate centre (lat, lon)
+SUBURBS = {
+    "Newcastle": (-32.9267, 151.7789),
+    "Newcastle West": (-32.9250, 151.7620),
+    "Cooks Hill": (-32.9330, 151.7700),
+    "The Junction": (-32.9400, 151.7600),
+    "Hamilton": (-32.9230, 151.7480),
+    "Merewether": (-32.9480, 151.7430),
+    "Mayfield": (-32.8970, 151.7360),
+    "Charlestown": (-32.9650, 151.6930),
+    "Wallsend": (-32.9030, 151.6660),
+    "Lambton": (-32.9100, 151.7080),
+    "Adamstown": (-32.9380, 151.7250),
+    "Kotara": (-32.9420, 151.6980),
+    "Jesmond": (-32.9030, 151.6910),
+    "Waratah": (-32.9070, 151.7270),
+    "Stockton": (-32.9090, 151.7840),
+    "Carrington": (-32.9150, 151.7640),
+}
+
+STREETS = [
+    "Hunter St",
+    "Darby St",
+    "Glebe Rd",
+    "Beaumont St",
+    "John Parade",
+    "Industrial Dr",
+    "Pacific Hwy",
+    "Cowper St",
+    "Maitland Rd",
+    "Lambton Rd",
+    "Brunker Rd",
+    "Tudor St",
+]
+
+# Where report images point; benchmarks/image_host.py serves any path locally
+IMAGE_BASE_URL = "https://images.example.org/kerbside"
+
+DESCRIPTIONS = ["Sofa", "Mattress", "TV", "Chair, Table", "Washing Machine", "Desk"]
+
+
+def format_gps(lat, lon):
+    """(-32.9283, 151.7817) -> "32.9283° S, 151.7817° E" as the sensors send it"""
+    return f"{abs(lat):.4f}° {'S' if lat < 0 else 'N'}, {abs(lon):.4f}° {'W' if lon < 0 else 'E'}"
+
+
+def reports(n, seed=1, image_base_url=IMAGE_BASE_URL):
+    """n report payloads shaped like the MQTT messages, IDs 1..n"""
+    rng = random.Random(seed)
+    suburbs = list(SUBURBS.items())
+    for report_id in range(1, n + 1):
+        suburb, (lat, lon) = rng.choice(suburbs)
+        yield {
+            "ID": str(report_id),
+            "GPS": format_gps(rng.gauss(lat, 0.005), rng.gauss(lon, 0.005)),
+            "Address": f"{rng.choice(STREETS)}, {suburb}",
+            "Message": "Kerbside Dump Detected",
+            "ImageURL": f"{image_base_url}/{report_id}.jpg",
+        }
+
+
+def payloads(n, seed=1):
+    """The same reports as raw MQTT payload bytes"""
+    for report in reports(n, seed):
+        yield json.dumps(report).encode()
+
+
+def descriptions(n, fraction=0.3, seed=1):
+    """{ID: description} for roughly fraction of IDs 1..n"""
+    rng = random.Random(seed)
+    return {
+        str(report_id): rng.choice(DESCRIPTIONS)
+        for report_id in range(1, n + 1)
+        if rng.random() < fraction
+    }
@@ -0,0 +1,139 @@
+"""KerbTrack ingest process for multi-worker deployments
+
+Owns the MQTT subscription, the SQLite database and the Excel export, so
+the dashboard can run as any number of web workers that only read:
+
+    python ingest_worker.py &
+    export KERBTRACK_THREADS=32
+    gunicorn -w 4 -k gthread --threads $KERBTRACK_THREADS -b 0.0.0.0:8050 wsgi:server
+
+Run both from the same directory; they share kerbtrack.db, mqtt_data.xlsx
+and the archive/ Parquet history there. Every web worker follows the
+database this process writes (see services/follower.py), so they all serve
+the same reports. The workbook is refreshed every minute for entering
+image descriptions; KERBTRACK_EXCEL_EXPORT_INTERVAL=0 leaves it to
+shutdown, downloads from the web workers are built from the database.
+Prometheus metrics for ingest and persistence are served on
+--metrics-port, since this process has no web server of its own.
+"""
+
+import argparse
+import logging
+import signal
+import sys
+import threading
+from wsgiref.simple_server import WSGIRequestHandler, make_server
+
+from app import BROKER, BROKER_PORT, TOPIC, start_mqtt
+from layouts.home import (
+    EXCEL_EXPORT_INTERVAL,
+    EXCEL_FILE_PATH,
+    backfill,
+    cleanup_on_exit,
+    export_to_excel,
+    load_descriptions_from_excel,
+)
+from services.archive import ReportArchive
+from services.description_watcher import DescriptionWatcher
+from services.ingest import IngestPipeline
+from services.log import configure_logging
+from services.metrics import CONTENT_TYPE, REGISTRY
+from services.persistence import PersistenceScheduler, PersistenceWorker, ReportDatabase
+from services.report_store import ReportStore
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_METRICS_PORT = 9108
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port, registry=REGISTRY):
+    """/metrics on a daemon thread"""
+
+    def metrics_app(environ, start_response):
+        if environ.get("PATH_INFO") != "/metrics":
+            start_response("404 Not Found", [("Content-Type", "text/plain")])
+            return [b"Not found\n"]
+        start_response("200 OK", [("Content-Type", CONTENT_TYPE)])
+        return [registry.render().encode()]
+
+    server = make_server("", port, metrics_app, handler_class=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info("Serving metrics on port %d", port)
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--broker", default=BROKER)
+    parser.add_argument("--port", type=int, default=BROKER_PORT)
+    parser.add_argument("--topic", default=TOPIC)
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=DEFAULT_METRICS_PORT,
+        help="0 leaves the metrics endpoint out",
+    )
+    args = parser.parse_args()
+
+    configure_logging()
+    # Stop cleanly (final flush and export) under systemd, docker and the like
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    report_store = ReportStore()
+    report_database = ReportDatabase()
+    description_watcher = DescriptionWatcher(EXCEL_FILE_PATH, load_descriptions_from_excel)
+    persistence_worker = PersistenceWorker(
+        report_database,
+        export=lambda: export_to_excel(report_database, description_watcher),
+    )
+    persistence_worker.start()
+    backfill(report_store, report_database)
+
+    def apply_descriptions(changed):
+        persistence_worker.submit_descriptions(changed)
+        report_store.set_descriptions(changed)
+
+    description_watcher.subscribe(apply_descriptions)
+    description_watcher.start()
+
+    ingest_pipeline = IngestPipeline(report_store)
+    ingest_pipeline.start()
+    mqtt_client = start_mqtt(ingest_pipeline, args.broker, args.port, args.topic)
+
+    report_archive = ReportArchive(report_database, excel_path=EXCEL_FILE_PATH)
+    report_archive.start()
+
+    report_store.register_metrics()
+    persistence_worker.register_metrics()
+    ingest_pipeline.register_metrics()
+    report_archive.register_metrics()
+    if args.metrics_port:
+        serve_metrics(args.metrics_port)
+
+    # Changed reports go to the database every second, the export every
+    # EXCEL_EXPORT_INTERVAL seconds (or only at shutdown if that is 0)
+    scheduler = PersistenceScheduler(
+        report_store, persistence_worker, export_interval=EXCEL_EXPORT_INTERVAL
+    )
+    try:
+        scheduler.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        mqtt_client.loop_stop()
+        mqtt_client.disconnect()
+        description_watcher.stop()
+        ingest_pipeline.stop()
+        cleanup_on_exit(report_store, persistence_worker)
+        # Everything the final flush wrote goes into the archive too
+        report_archive.stop()
+        report_archive.roll()
+
+
+if __name__ == "__main__":
+    main()
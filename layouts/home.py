@@ -1,15 +1,35 @@
 import dash
-from dash import html, dcc, dash_table, Output, Input, State
-import pandas as pd
+from dash import html, dcc, dash_table, ClientsideFunction, Output, Input, State
+
+# Imported up front even though only the map uses it: Dash only serves the
+# JavaScript of component libraries imported before the first page load.
+# pandas (most of the import time) is imported where it is used, so tools
+# that only need the helpers here do not pay for it.
 import dash_leaflet as dl
+import flask
+from markupsafe import escape
 from components.navbar import navbar
 from components.footer import footer
+from services import fast_json
+from services.clustering import CLUSTER_MAX_ZOOM
+from services.log import log_stage
+from services.report import ReportColumns
+from services.metrics import REGISTRY
+from services.thumbnails import THUMBNAILS_AVAILABLE, ThumbnailError, thumbnail_url
+from services.view_cache import ViewCache
+import datetime
+import functools
+import io
+import logging
+import math
 import os
+import re
 import threading
 import time
-import hashlib
 import atexit
 
+logger = logging.getLogger(__name__)
+
 # Table columns - Added Image Description column
 DEFAULT_COLUMNS = [
     {"name": "ID", "id": "ID"},
@@ -20,34 +40,124 @@ DEFAULT_COLUMNS = [
     {"name": "Image Description", "id": "Image_Description"},  # New column
 ]
 
-# Excel file path
+# DataTable filter syntax -> operator understood by ReportStore.query. The
+# table prefixes each operator with its case setting: "scontains", "s=",
+# "ige"; "s" is case-sensitive, "i" and a bare operator are not
+FILTER_OPERATORS = {
+    "ge": ">=",
+    "le": "<=",
+    "lt": "<",
+    "gt": ">",
+    "ne": "!=",
+    "eq": "=",
+    ">=": ">=",
+    "<=": "<=",
+    "<": "<",
+    ">": ">",
+    "!=": "!=",
+    "=": "=",
+    "contains": "contains",
+    "datestartswith": "datestartswith",
+}
+FILTER_PART = re.compile(r"^\s*\{(?P<column>[^}]+)\}\s+(?P<operator>\S+)\s+(?P<value>.*?)\s*$")
+
+# Map viewport used until the browser reports real bounds, and the marker cap per view
+DEFAULT_MAP_BOUNDS = [[-33.05, 151.55], [-32.80, 152.00]]
+DEFAULT_MAP_ZOOM = 12
+MAX_VISIBLE_MARKERS = 500
+
+# Excel file path - an export of the report database, not the live store
 EXCEL_FILE_PATH = "mqtt_data.xlsx"
 
-# Global variables for tracking saves
-mqtt_data = []  # This is MQTT data source
-
-
-def parse_gps(gps_str):
+# Seconds between automatic Excel exports by the writing process, 0 for
+# exports only on download and at shutdown. Image descriptions are entered
+# in the workbook (see DescriptionWatcher), so by default new reports reach
+# it within a minute
+EXCEL_EXPORT_INTERVAL = int(os.environ.get("KERBTRACK_EXCEL_EXPORT_INTERVAL", "60"))
+
+# Live updates are pushed over /events (assets/live_updates.js); the intervals
+# only catch up browsers or proxies that cannot hold the stream open
+FALLBACK_INTERVAL_MS = 30000
+
+# /events: a comment line this often so dead connections are noticed, each
+# stream closed after a while (the browser reconnects where it left off),
+# and at least this long between events under heavy ingest
+EVENT_HEARTBEAT_SECONDS = 15
+EVENT_STREAM_SECONDS = 300
+EVENT_MIN_GAP_SECONDS = 0.25
+EVENT_RETRY_MS = 2000
+
+# Threads serving requests in this process (gunicorn --threads, see wsgi.py).
+# Every open stream holds one, so streams may take at most half and the rest
+# stay free for callbacks
+SERVER_THREADS = int(os.environ.get("KERBTRACK_THREADS", "32"))
+MAX_EVENT_STREAMS = max(1, SERVER_THREADS // 2)
+
+# Browsers and proxies may keep a thumbnail this long (seconds) without asking again
+THUMBNAIL_MAX_AGE = 365 * 24 * 3600
+excel_export_lock = threading.Lock()
+
+
+def parse_filter_query(filter_query):
+    """Turn a DataTable filter_query into (column, operator, value, ignore_case) filters"""
+    filters = []
+    if not filter_query:
+        return filters
+
+    for part in filter_query.split(" && "):
+        match = FILTER_PART.match(part)
+        if not match:
+            continue
+        operator = match["operator"].lower()
+        ignore_case = True
+        if operator not in FILTER_OPERATORS and operator[:1] in ("s", "i"):
+            ignore_case = operator[0] == "i"
+            operator = operator[1:]
+        if operator not in FILTER_OPERATORS:
+            continue
+        value = match["value"]
+        if len(value) > 1 and value[0] == value[-1] and value[0] in "'\"`":
+            value = value[1:-1].replace("\\" + value[0], value[0])
+        filters.append((match["column"], FILTER_OPERATORS[operator], value, ignore_case))
+    return filters
+
+
+def format_event_id(epoch, seq):
+    """The cursor as an SSE event id, see parse_event_id"""
+    return f"{epoch or ''}.{seq}"
+
+
+def parse_event_id(value):
+    """(epoch, seq) from an event id"""
     try:
-        lat_str, lon_str = gps_str.split(",")
-        lat_value = lat_str.strip().replace("°", "").replace(" ", "")
-        lat = float(lat_value[:-1])
-        if lat_value[-1].upper() == "S":
-            lat = -lat
-        elif lat_value[-1].upper() != "N":
-            raise ValueError(f"Invalid latitude direction in '{gps_str}'")
-
-        lon_value = lon_str.strip().replace("°", "").replace(" ", "")
-        lon = float(lon_value[:-1])
-        if lon_value[-1].upper() == "W":
-            lon = -lon
-        elif lon_value[-1].upper() != "E":
-            raise ValueError(f"Invalid longitude direction in '{gps_str}'")
-
-        return lat, lon
-    except Exception as e:
-        print(f"Error parsing GPS '{gps_str}': {e}")
-        return None, None
+        epoch, seq = value.split(".")
+        return epoch or None, int(seq)
+    except ValueError:
+        return None, 0
+
+
+def format_event(name, data, event_id):
+    return f"event: {name}\nid: {event_id}\ndata: {fast_json.dumps(data)}\n\n"
+
+
+def table_row(report, description=None):
+    """Shape a report for the DataTable"""
+    row = {col["id"]: report.get(col["id"]) for col in DEFAULT_COLUMNS}
+    image_url = report.get("ImageURL")
+    if not image_url:
+        row["Image"] = ""
+    elif THUMBNAILS_AVAILABLE:
+        # A small cached copy in the cell, linked to the full-size original
+        row["Image"] = (
+            f'<a href="{escape(image_url)}" target="_blank">'
+            f'<img src="{thumbnail_url(report.get("ID"), image_url)}" alt="View Image" '
+            f'loading="lazy" style="height: 48px; border-radius: 4px;"></a>'
+        )
+    else:
+        # Without Pillow the "thumbnail" is the full-size image, so only link to it
+        row["Image"] = f'<a href="{escape(image_url)}" target="_blank">View Image</a>'
+    row["Image_Description"] = description or "Pending..."
+    return row
 
 
 def validate_data_integrity(old_df, new_df):
@@ -59,489 +169,789 @@ def validate_data_integrity(old_df, new_df):
 
             lost_ids = old_ids - new_ids
             if lost_ids:
-                print(f"WARNING: IDs will be lost: {lost_ids}")
+                logger.warning(
+                    "%d IDs will be lost, e.g. %s", len(lost_ids), sorted(lost_ids)[:10]
+                )
                 return False
         return True
     except Exception as e:
-        print(f"Error validating data integrity: {e}")
+        logger.error("Error validating data integrity: %s", e)
         return True  # Allow save if validation fails
 
 
-def save_to_excel(mqtt_data_list, max_retries=3):
-    """Save MQTT data to Excel file with improved data preservation and retry mechanism"""
+def text_values(series):
+    """str() of every cell, vectorised - NaN becomes "nan" just as str(nan) does"""
+    return series.astype("string").fillna("nan").str.strip()
+
+
+def id_values(series):
+    """Report IDs as floats, so 4 and 4.0 (int and float columns) match"""
+    import pandas as pd
+
+    return pd.to_numeric(series, errors="coerce").astype(float)
+
+
+def merge_with_existing(new_df, existing_df):
+    """Reconcile new rows with the saved workbook, set-based
+
+    New rows win for every field except Image_Description: a saved,
+    non-pending description always survives. IDs only in the saved workbook
+    are kept. Result is sorted by ID with one row per ID.
+    """
+    import pandas as pd
+
+    # ID -> saved description, the last non-pending one per ID wins
+    saved = pd.Series(dtype=object)
+    if "Image_Description" in existing_df.columns:
+        saved_desc = text_values(existing_df["Image_Description"])
+        keep = ~saved_desc.isin(["", "nan", "None", "Pending..."])
+        saved = pd.Series(
+            saved_desc[keep].to_numpy(), index=id_values(existing_df["ID"])[keep].to_numpy()
+        )
+        saved = saved[~saved.index.duplicated(keep="last")]
+
+    # Saved descriptions first, then the new row's own, "Pending..." if it has none
+    new_df = new_df.copy()
+    if "Image_Description" not in new_df.columns:
+        new_df["Image_Description"] = "Pending..."
+    new_ids = id_values(new_df["ID"])
+    restored = new_ids.map(saved)
+    current = new_df["Image_Description"]
+    current = current.where(~(current.isna() | (current == "nan")), "Pending...")
+    new_df["Image_Description"] = restored.where(restored.notna(), current)
+
+    # Saved rows whose ID is not in the new data are kept as they were
+    existing_df = existing_df.copy()
+    existing_df["ID"] = pd.to_numeric(existing_df["ID"], errors="coerce")
+    old_only = existing_df[~id_values(existing_df["ID"]).isin(new_ids)]
+    if "Image_Description" not in old_only.columns:
+        old_only = old_only.assign(Image_Description="Pending...")
+    logger.debug(
+        "Merge: %d saved descriptions restored, %d rows kept from the existing file",
+        int(restored.notna().sum()),
+        len(old_only),
+    )
+
+    final_df = pd.concat([new_df, old_only], ignore_index=True) if len(old_only) else new_df
+    final_df["ID"] = pd.to_numeric(final_df["ID"], errors="coerce")
+    # Stable sort, so where an ID appears twice the new row stays first and wins
+    final_df = final_df.sort_values("ID", kind="stable")
+    return final_df.drop_duplicates(subset=["ID"], keep="first")
+
+
+def save_to_excel(mqtt_data_list, max_retries=1):
+    """Save MQTT data (a list of dicts or a DataFrame) to Excel file with improved data preservation and retry mechanism"""
+    import pandas as pd
+
     for attempt in range(max_retries):
+        started = time.perf_counter()
         try:
             # Create DataFrame from MQTT data
-            new_df = pd.DataFrame(mqtt_data_list)
+            if isinstance(mqtt_data_list, pd.DataFrame):
+                new_df = mqtt_data_list.copy()
+            else:
+                new_df = pd.DataFrame(mqtt_data_list)
 
             if new_df.empty:
-                print("No data to save")
+                logger.info("No data to save")
                 return True
 
-            print(f"Save attempt {attempt + 1}: Processing {len(new_df)} entries")
+            logger.debug("Save attempt %d: processing %d entries", attempt + 1, len(new_df))
 
             # Remove duplicates based on ID, keeping the latest entry
             initial_count = len(new_df)
             new_df = new_df.drop_duplicates(subset=["ID"], keep="last")
             if len(new_df) < initial_count:
-                print(f"Removed {initial_count - len(new_df)} duplicate entries")
+                logger.info("Removed %d duplicate entries", initial_count - len(new_df))
 
             # Sort by ID (convert to numeric for proper ordering)
             new_df["ID"] = pd.to_numeric(new_df["ID"], errors="coerce")
             new_df = new_df.sort_values("ID")
-            print(f"Data sorted by ID")
 
             # Check if Excel file exists and merge intelligently
             if os.path.exists(EXCEL_FILE_PATH):
                 try:
                     # Read existing Excel file
                     existing_df = pd.read_excel(EXCEL_FILE_PATH)
-                    print(f"Existing Excel has {len(existing_df)} rows")
+                    logger.debug("Existing Excel has %d rows", len(existing_df))
 
                     if not existing_df.empty and "ID" in existing_df.columns:
                         # Validate data integrity
                         validate_data_integrity(existing_df, new_df)
 
-                        # Create a mapping of ID to best Image_Description from existing file
-                        description_map = {}
-                        if "Image_Description" in existing_df.columns:
-                            for _, row in existing_df.iterrows():
-                                row_id = str(row["ID"]).strip()
-                                desc = str(row["Image_Description"]).strip()
-                                # Keep the description if it's not empty, if it is empty show "Pending..."
-                                if desc and desc != "nan" and desc != "Pending...":
-                                    description_map[row_id] = desc
-                                    print(
-                                        f"Preserving description for ID {row_id}: {desc}"
-                                    )
-
-                        # First, add existing descriptions to new data
-                        if "Image_Description" not in new_df.columns:
-                            new_df["Image_Description"] = "Pending..."
-
-                        for idx, row in new_df.iterrows():
-                            row_id = str(row["ID"]).strip()
-                            if row_id in description_map:
-                                new_df.at[idx, "Image_Description"] = description_map[
-                                    row_id
-                                ]
-                                print(
-                                    f"Applied saved description for ID {row_id}: {description_map[row_id]}"
-                                )
-                            elif (
-                                pd.isna(new_df.at[idx, "Image_Description"])
-                                or new_df.at[idx, "Image_Description"] == "nan"
-                            ):
-                                new_df.at[idx, "Image_Description"] = "Pending..."
-
-                        # Combine with existing data, prioritizing new data for most fields but keeping existing descriptions
-                        existing_df["ID"] = pd.to_numeric(
-                            existing_df["ID"], errors="coerce"
-                        )
-
-                        # For entries that exist in both, keep new data but preserve non-pending descriptions
-                        combined_data = []
-                        new_ids = set(new_df["ID"].astype(str))
-                        existing_ids = set(existing_df["ID"].astype(str))
-
-                        # Add all new entries
-                        for _, row in new_df.iterrows():
-                            combined_data.append(row.to_dict())
-
-                        # Add existing entries that are not in new data
-                        for _, row in existing_df.iterrows():
-                            if str(row["ID"]) not in new_ids:
-                                # Ensure all required columns exist
-                                row_dict = row.to_dict()
-                                if "Image_Description" not in row_dict:
-                                    row_dict["Image_Description"] = "Pending..."
-                                combined_data.append(row_dict)
-                                print(
-                                    f"Preserving existing entry ID {row['ID']} not in new data"
-                                )
-
-                        # Create final DataFrame
-                        final_df = pd.DataFrame(combined_data)
-                        final_df["ID"] = pd.to_numeric(final_df["ID"], errors="coerce")
-                        final_df = final_df.sort_values("ID")
-                        final_df = final_df.drop_duplicates(
-                            subset=["ID"], keep="first"
-                        )  # Remove any remaining duplicates
+                        final_df = merge_with_existing(new_df, existing_df)
 
                     else:
-                        print("Existing Excel missing required columns or is empty")
+                        logger.warning("Existing Excel missing required columns or is empty")
                         if "Image_Description" not in new_df.columns:
                             new_df["Image_Description"] = "Pending..."
                         final_df = new_df
 
                 except Exception as e:
-                    print(f"Error reading existing Excel file: {e}")
+                    logger.error("Error reading existing Excel file: %s", e)
                     if "Image_Description" not in new_df.columns:
                         new_df["Image_Description"] = "Pending..."
                     final_df = new_df
             else:
-                print("Excel file doesn't exist, creating new one")
+                logger.info("Excel file doesn't exist, creating new one")
                 if "Image_Description" not in new_df.columns:
                     new_df["Image_Description"] = "Pending..."
                 final_df = new_df
 
             # Save to Excel
             final_df.to_excel(EXCEL_FILE_PATH, index=False)
-            print(f"Successfully saved {len(final_df)} entries to {EXCEL_FILE_PATH}")
+            logger.info(
+                "Saved %d entries to %s in %.0f ms",
+                len(final_df),
+                EXCEL_FILE_PATH,
+                (time.perf_counter() - started) * 1000,
+            )
             return True
 
         except Exception as e:
-            print(f"Save attempt {attempt + 1} failed: {e}")
             if attempt < max_retries - 1:
-                print(f"Retrying in 1 second...")
+                logger.warning(
+                    "Save attempt %d failed, retrying in 1 second: %s", attempt + 1, e
+                )
                 time.sleep(1)
             else:
-                print("All save attempts failed!")
-                import traceback
-
-                traceback.print_exc()
+                logger.exception("All save attempts failed")
                 return False
 
 
+def export_to_excel(report_database, description_watcher=None):
+    """Generate the Excel file from the report database
+
+    Pass the process's description watcher so the rewrite is not reloaded
+    as if someone had edited the descriptions.
+    """
+    try:
+        # The persistence worker and the download route can both export
+        with excel_export_lock:
+            df = report_database.all_reports().to_frame()
+            if description_watcher is None:
+                return save_to_excel(df)
+            with description_watcher.rewriting():
+                return save_to_excel(df)
+    except Exception as e:
+        logger.error("Error exporting database to Excel: %s", e)
+        return False
+
+
 def load_descriptions_from_excel():
     """Load image descriptions from Excel file"""
+    import pandas as pd
+
+    verbose = logger.isEnabledFor(logging.DEBUG)
     try:
         if os.path.exists(EXCEL_FILE_PATH):
-            print(f"Reading Excel file: {EXCEL_FILE_PATH}")
-            df = pd.read_excel(EXCEL_FILE_PATH)
-            print(f"Excel columns: {list(df.columns)}")
-
-            if (
-                not df.empty
-                and "ID" in df.columns
-                and "Image_Description" in df.columns
-            ):
-                # Convert both ID and descriptions to strings for reliable matching
-                descriptions = {}
-                for _, row in df.iterrows():
-                    id_val = str(row["ID"]).strip()
-                    desc_val = str(row["Image_Description"]).strip()
-                    if desc_val and desc_val != "nan" and desc_val != "Pending...":
-                        descriptions[id_val] = desc_val
-                        print(f"Loaded: ID '{id_val}' -> '{desc_val}'")
-
-                print(f"Total descriptions loaded: {len(descriptions)}")
-                return descriptions
-            else:
-                print("Excel file missing required columns or is empty")
-                print(f"Required: 'ID' and 'Image_Description'")
-                print(f"Found: {list(df.columns)}")
+            with log_stage(logger, "Loaded %d descriptions from %s") as stage:
+                df = pd.read_excel(EXCEL_FILE_PATH)
+                logger.debug("Excel columns: %s", list(df.columns))
+
+                if (
+                    not df.empty
+                    and "ID" in df.columns
+                    and "Image_Description" in df.columns
+                ):
+                    # Convert both ID and descriptions to strings for reliable matching
+                    descriptions = {}
+                    for _, row in df.iterrows():
+                        id_val = str(row["ID"]).strip()
+                        desc_val = str(row["Image_Description"]).strip()
+                        if desc_val and desc_val != "nan" and desc_val != "Pending...":
+                            descriptions[id_val] = desc_val
+                            if verbose:
+                                logger.debug("Loaded: ID %r -> %r", id_val, desc_val)
+
+                    stage.done(len(descriptions), EXCEL_FILE_PATH)
+                    return descriptions
+                else:
+                    logger.warning(
+                        "Excel file missing required columns or is empty "
+                        "(required 'ID' and 'Image_Description', found %s)",
+                        list(df.columns),
+                    )
         else:
-            print(f"Excel file does not exist: {EXCEL_FILE_PATH}")
-    except Exception as e:
-        print(f"Error loading descriptions from Excel: {e}")
-        import traceback
-
-        traceback.print_exc()
+            logger.info("Excel file does not exist: %s", EXCEL_FILE_PATH)
+    except Exception:
+        logger.exception("Error loading descriptions from Excel")
     return {}
 
 
-def cleanup_on_exit():
+def import_excel(report_database, path=EXCEL_FILE_PATH):
+    """Store the Excel workbook's reports in the database, parsing GPS in bulk
+
+    For a first run only, into an empty database: the reports are stored as
+    received when the workbook last changed. Returns how many.
+    """
+    import pandas as pd
+
+    if not os.path.exists(path):
+        return 0
+    with log_stage(logger, "Imported %d reports from %s") as stage:
+        df = pd.read_excel(path)
+        if df.empty or "ID" not in df.columns:
+            return 0
+
+        # Columns are cleaned and GPS parsed in bulk, then turned straight into records
+        columns = ReportColumns.from_frame(df)
+        report_database.write(
+            list(columns.reports(os.path.getmtime(path))), columns.description_map()
+        )
+        stage.done(len(columns), path)
+    return len(columns)
+
+
+def backfill(report_store, report_database, path=EXCEL_FILE_PATH):
+    """Load the reports still within the store's limits from the database
+
+    Reports keep the time they were received, so the age limit carries on
+    across restarts. The Excel workbook is only read when the database is
+    empty, see import_excel. Returns how many reports were loaded.
+    """
+    try:
+        if report_database.history_since(0, 1)[0] == 0:
+            import_excel(report_database, path)
+
+        with log_stage(logger, "Backfilled %d reports from %s") as stage:
+            since = 0
+            if report_store.max_age_seconds:
+                since = time.time() - report_store.max_age_seconds
+            rows = report_database.recent_reports(since, report_store.max_reports or None)
+            report_store.upsert_many(
+                [report for report, _ in rows],
+                received_at=[report.timestamp for report, _ in rows],
+                mark_dirty=False,
+            )
+            report_store.set_descriptions({report.id: desc for report, desc in rows if desc})
+            stage.done(len(rows), report_database.path)
+        return len(rows)
+    except Exception as e:
+        logger.error("Error backfilling from the database: %s", e)
+        return 0
+
+
+def cleanup_on_exit(report_store, persistence_worker):
     """Save data when app shuts down"""
     try:
-        if mqtt_data:
-            print("App shutting down, saving final data...")
-            success = save_to_excel(mqtt_data.copy())
-            if success:
-                print("Final save completed successfully")
-            else:
-                print("Final save failed")
+        logger.info("App shutting down, saving final data...")
+        persistence_worker.submit(report_store.take_dirty())
+        persistence_worker.stop()
+        persistence_worker.flush()
+        success = export_to_excel(persistence_worker.database)
+        if success:
+            logger.info("Final save completed successfully")
+        else:
+            logger.error("Final save failed")
     except Exception as e:
-        print(f"Error during cleanup: {e}")
-
-
-# Register cleanup function
-atexit.register(cleanup_on_exit)
-
-# Layout
-home_layout = html.Div(
-    className="min-h-screen bg-white",
-    children=[
-        navbar,
-        html.Div(
-            id="home-page",
-            className="relative",
-            children=[
-                html.Img(
-                    src="/assets/header.jpg",
-                    className="w-full lg:max-h-[500px] max-h-[200px] object-cover",
-                ),
-                html.H1(
-                    "Welcome To KerbTrack Dashboard",
-                    className="lg:text-4xl md:text-1sm bg-black bg-opacity-30 absolute inset-0 flex items-center justify-center font-bold text-white",
-                ),
-            ],
-        ),
-        html.Div(
-            className="text-center",
-            children=[
-                html.Hr(className="mt-10 "),
-                html.H1(
-                    "Live Data Table",
-                    className="pt-2 text-emerald-700 font-bold text-2xl",
-                ),
-                html.Div(
-                    className="border-t-4 mx-auto rounded-md border-emerald-600 w-20 my-4"
-                ),
-            ],
-        ),
-        html.Div(
-            className="container justify-center mx-auto",
-            children=[
-                dcc.Store(id="mqtt-store", data=[], storage_type="memory"),
-                dcc.Store(
-                    id="description-store", data={}, storage_type="memory"
-                ),  # Store for descriptions
-                dcc.Interval(id="interval", interval=5000, n_intervals=0),
-                dcc.Interval(
-                    id="excel-check-interval", interval=3000, n_intervals=0
-                ),  # Check Excel every 3 seconds
-                html.Div(
-                    className="flex gap-2 my-2",
-                    children=[
-                        dcc.Input(
-                            id="search-input",
-                            type="text",
-                            debounce=True,
-                            placeholder="Search street or suburb",
-                            className="flex-grow p-2 border border-gray-300 rounded",
-                        )
-                    ],
-                ),
-                ## Our Table
-                dash_table.DataTable(
-                    id="mqtt-table",
-                    columns=DEFAULT_COLUMNS,
-                    data=[],
-                    page_size=10,
-                    style_cell={
-                        "textAlign": "left",
-                        "padding": "8px",
-                        "fontFamily": "Arial",
-                        "whiteSpace": "normal",
-                        "height": "auto",
-                        "backgroundColor": "#F8FAF9",
-                    },
-                    style_table={
-                        "maxHeight": "440px",
-                        "overflowY": "auto",
-                        "overflowX": "auto",
-                    },
-                    style_header={
-                        "backgroundColor": "#059669",
-                        "color": "white",
-                        "fontWeight": "bold",
-                        "position": "sticky",
-                        "top": 0,
-                        "zIndex": 1,
-                    },
-                    markdown_options={"html": True},
-                ),
-                ## Our Map
-                html.Div(
-                    className="text-center",
-                    children=[
-                        html.Hr(className="mt-10 "),
-                        html.H1(
-                            "Our Map",
-                            className="pt-2 text-emerald-700 font-bold text-2xl",
-                        ),
-                        html.Div(
-                            className="border-t-4 mx-auto rounded-md border-emerald-600 w-20 my-4"
-                        ),
-                    ],
-                ),
-                html.Div(
-                    [
-                        dl.Map(
-                            center=[-32.9267, 151.7789],
-                            zoom=12,
-                            children=[dl.TileLayer(), dl.LayerGroup(id="map-markers")],
-                            style={"width": "100%", "height": "500px"},
-                        ),
-                    ]
-                ),
-                html.Br(),
-                html.Div(footer),
-            ],
-        ),
-    ],
-)
+        logger.error("Error during cleanup: %s", e)
+
+
+# Layout, built on the first visit to the home page rather than at import
+@functools.lru_cache(maxsize=None)
+def home_layout():
+    return html.Div(
+        className="min-h-screen bg-white",
+        children=[
+            navbar,
+            html.Div(
+                id="home-page",
+                className="relative",
+                children=[
+                    html.Img(
+                        src="/assets/header.jpg",
+                        className="w-full lg:max-h-[500px] max-h-[200px] object-cover",
+                    ),
+                    html.H1(
+                        "Welcome To KerbTrack Dashboard",
+                        className="lg:text-4xl md:text-1sm bg-black bg-opacity-30 absolute inset-0 flex items-center justify-center font-bold text-white",
+                    ),
+                ],
+            ),
+            html.Div(
+                className="text-center",
+                children=[
+                    html.Hr(className="mt-10 "),
+                    html.H1(
+                        "Live Data Table",
+                        className="pt-2 text-emerald-700 font-bold text-2xl",
+                    ),
+                    html.Div(
+                        className="border-t-4 mx-auto rounded-md border-emerald-600 w-20 my-4"
+                    ),
+                ],
+            ),
+            html.Div(
+                className="container justify-center mx-auto",
+                children=[
+                    # The table and map are queried from the server; the browser only
+                    # keeps the cursor of the last report or description change it
+                    # saw, moved on by mqtt-delta
+                    dcc.Store(id="mqtt-delta", storage_type="memory"),
+                    dcc.Store(
+                        id="mqtt-cursor",
+                        data={"epoch": None, "seq": 0},
+                        storage_type="memory",
+                    ),
+                    dcc.Interval(
+                        id="interval", interval=FALLBACK_INTERVAL_MS, n_intervals=0
+                    ),
+                    dcc.Store(id="live-status", storage_type="memory"),
+                    html.Div(
+                        className="flex gap-2 my-2",
+                        children=[
+                            dcc.Input(
+                                id="search-input",
+                                type="text",
+                                debounce=True,
+                                placeholder="Search street or suburb",
+                                className="flex-grow p-2 border border-gray-300 rounded",
+                            )
+                        ],
+                    ),
+                    ## Our Table
+                    dash_table.DataTable(
+                        id="mqtt-table",
+                        columns=DEFAULT_COLUMNS,
+                        data=[],
+                        # Paging, filtering and sorting all run server-side in update_table
+                        page_action="custom",
+                        page_current=0,
+                        page_size=10,
+                        page_count=1,
+                        filter_action="custom",
+                        filter_query="",
+                        # Case-insensitive unless the column's Aa toggle is set
+                        filter_options={"case": "insensitive"},
+                        sort_action="custom",
+                        sort_mode="single",
+                        sort_by=[],
+                        style_cell={
+                            "textAlign": "left",
+                            "padding": "8px",
+                            "fontFamily": "Arial",
+                            "whiteSpace": "normal",
+                            "height": "auto",
+                            "backgroundColor": "#F8FAF9",
+                        },
+                        style_table={
+                            "maxHeight": "440px",
+                            "overflowY": "auto",
+                            "overflowX": "auto",
+                        },
+                        style_header={
+                            "backgroundColor": "#059669",
+                            "color": "white",
+                            "fontWeight": "bold",
+                            "position": "sticky",
+                            "top": 0,
+                            "zIndex": 1,
+                        },
+                        markdown_options={"html": True},
+                    ),
+                    ## Our Map
+                    html.Div(
+                        className="text-center",
+                        children=[
+                            html.Hr(className="mt-10 "),
+                            html.H1(
+                                "Our Map",
+                                className="pt-2 text-emerald-700 font-bold text-2xl",
+                            ),
+                            html.Div(
+                                className="border-t-4 mx-auto rounded-md border-emerald-600 w-20 my-4"
+                            ),
+                        ],
+                    ),
+                    html.Div(
+                        [
+                            dl.Map(
+                                id="map",
+                                trackViewport=True,  # keeps bounds current for update_map_markers
+                                center=[-32.9267, 151.7789],
+                                zoom=DEFAULT_MAP_ZOOM,
+                                children=[dl.TileLayer(), dl.LayerGroup(id="map-markers")],
+                                style={"width": "100%", "height": "500px"},
+                            ),
+                        ]
+                    ),
+                    html.Br(),
+                    html.Div(footer),
+                ],
+            ),
+        ],
+    )
 
 
 # Callbacks
-def register_callbacks(app, mqtt_data):
-    # Tracking variables for smart saving
-    last_save_time = [0]
-    last_data_size = [0]
-    last_data_hash = [""]
+def register_callbacks(
+    app, report_store, persistence_worker, description_watcher, thumbnails, report_archive
+):
+    # persistence_worker and description_watcher are None in a web worker:
+    # another process owns the database, the workbook and the Excel export,
+    # so this one only reads
+    # Register cleanup function
+    if persistence_worker is not None:
+        atexit.register(cleanup_on_exit, report_store, persistence_worker)
+
+    # Views are identical for every session at the same data version, so build each once
+    view_cache = ViewCache()
+    REGISTRY.counter(
+        "kerbtrack_view_cache_hits_total",
+        "Table/map/delta views served from the shared cache",
+        function=lambda: view_cache.hits,
+    )
+    REGISTRY.counter(
+        "kerbtrack_view_cache_misses_total",
+        "Table/map/delta views built",
+        function=lambda: view_cache.misses,
+    )
+
+    def report_delta(epoch, seq):
+        """Store changes since a browser's cursor, shared by the interval and /events"""
+        version = report_store.version
+        # Every reset is the same, whatever stale or foreign cursor asked for it
+        if report_store.needs_reset(epoch, seq):
+            key = ("delta", version, "reset")
+        else:
+            key = ("delta", version, epoch, seq)
+        return view_cache.get_or_compute(key, lambda: report_store.delta_since(epoch, seq))
+
+    def persist_changes():
+        """Hand reports changed since the last call to the persistence worker"""
+        leftover = persistence_worker.submit(report_store.take_dirty())
+        if leftover:
+            # Worker queue is full - keep them dirty (and coalescing) until the next tick
+            report_store.restore_dirty(leftover)
+
+    @app.server.route("/export/mqtt_data.xlsx")
+    def download_excel():
+        """On-demand Excel export of everything in the database"""
+        if persistence_worker is None:
+            # The workbook belongs to the ingest process; this worker sends a
+            # fresh copy of the database without touching it
+            buffer = io.BytesIO()
+            report_archive.database.all_reports().to_frame().to_excel(buffer, index=False)
+            buffer.seek(0)
+            return flask.send_file(
+                buffer, as_attachment=True, download_name="mqtt_data.xlsx"
+            )
+        else:
+            persist_changes()
+            persistence_worker.flush()
+            if not export_to_excel(persistence_worker.database, description_watcher):
+                return "Excel export failed", 500
+        return flask.send_file(
+            os.path.abspath(EXCEL_FILE_PATH),
+            as_attachment=True,
+            download_name="mqtt_data.xlsx",
+        )
+
+    @app.server.route("/export/history.csv")
+    def download_history():
+        """Report history from the Parquet archive, e.g.
+
+            /export/history.csv?start=2026-09-01&end=2026-09-30&columns=ID,Address&suburb=Mayfield
+
+        start and end are local dates (both included), latest=1 keeps only
+        the newest version of each report.
+        """
+        if not report_archive.available:
+            return "The history archive needs pyarrow installed", 503
+        args = flask.request.args
+        try:
+            start = end = None
+            if args.get("start"):
+                start = time.mktime(datetime.date.fromisoformat(args["start"]).timetuple())
+            if args.get("end"):
+                end_day = datetime.date.fromisoformat(args["end"]) + datetime.timedelta(days=1)
+                end = time.mktime(end_day.timetuple())
+            columns = [c.strip() for c in args.get("columns", "").split(",") if c.strip()]
+            equals = {"Suburb": args["suburb"]} if args.get("suburb") else None
+            df = report_archive.read(
+                columns or None, start, end, equals, latest=args.get("latest") == "1"
+            )
+        except ValueError as e:
+            return f"Bad history request: {e}", 400
+        return flask.Response(
+            df.to_csv(index=False),
+            mimetype="text/csv",
+            headers={"Content-Disposition": "attachment; filename=history.csv"},
+        )
+
+    @app.server.route("/thumbs/<report_id>")
+    def report_thumbnail(report_id):
+        """Cached thumbnail of a report's image, fetched from the camera host once"""
+        # Only URLs that came in with a report are fetched, never one from the request
+        report = report_store.get(report_id)
+        if report is None or not report.image_url:
+            return "No image for this report", 404
+        try:
+            path, mimetype = thumbnails.get(report.image_url)
+        except ThumbnailError:
+            return "Image unavailable", 502
+        response = flask.send_file(
+            os.path.abspath(path),
+            mimetype=mimetype,
+            etag=os.path.basename(path),
+            max_age=THUMBNAIL_MAX_AGE,
+            conditional=True,
+        )
+        # thumbnail_url changes with the image URL, so a cached copy never goes stale
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
 
     @app.callback(
-        Output("mqtt-store", "data"),
+        Output("mqtt-delta", "data"),
         Input("interval", "n_intervals"),
-        State("mqtt-store", "data"),
+        State("mqtt-cursor", "data"),
+    )
+    def update_store(n, cursor):
+        # Only send what this browser has not seen yet
+        cursor = cursor or {}
+        delta = report_delta(cursor.get("epoch"), cursor.get("seq", 0))
+        if delta is None:
+            return dash.no_update
+        return delta
+
+    # Move the cursor on without a server round trip; the table and map follow it
+    app.clientside_callback(
+        """
+        function(delta, cursor) {
+            // Deltas arrive over /events and the fallback interval, so one can be
+            // overtaken by a newer one it must not undo
+            if (!delta || (!delta.reset && cursor && delta.epoch === cursor.epoch
+                           && delta.seq <= cursor.seq)) {
+                return window.dash_clientside.no_update;
+            }
+            return {epoch: delta.epoch, seq: delta.seq};
+        }
+        """,
+        Output("mqtt-cursor", "data"),
+        Input("mqtt-delta", "data"),
+        State("mqtt-cursor", "data"),
+        prevent_initial_call=True,
     )
-    def update_store(n, current_data):
-        current_time = time.time()
-        current_size = len(mqtt_data) if mqtt_data else 0
-
-        should_save = False
-        save_reason = ""
-
-        if mqtt_data:
-            # Create hash of current data to detect changes
-            try:
-                data_str = str(sorted([str(item) for item in mqtt_data]))
-                current_hash = hashlib.md5(data_str.encode()).hexdigest()
-            except Exception as e:
-                print(f"Error creating data hash: {e}")
-                current_hash = str(current_time)  # Fallback
-
-            # Save immediately if new data
-            if current_size > last_data_size[0]:
-                should_save = True
-                save_reason = f" New data detected: {current_size} items (was {last_data_size[0]})"
-                last_data_size[0] = current_size
-                last_data_hash[0] = current_hash
-
-            # Save if data content changed
-            elif current_hash != last_data_hash[0]:
-                should_save = True
-                save_reason = " Data content changed"
-                last_data_hash[0] = current_hash
-
-            # Safety net: Save every 60 seconds if there's any data
-            elif current_time - last_save_time[0] > 60:
-                should_save = True
-                save_reason = "Periodic safety backup (60s interval)"
-
-            if should_save:
-
-                def save_async():
-                    print(f"Saving to Excel: {save_reason}")
-                    success = save_to_excel(mqtt_data.copy())
-                    if success:
-                        print(f"Save completed successfully")
-                    else:
-                        print(f"Save failed")
-
-                threading.Thread(target=save_async, daemon=True).start()
-                last_save_time[0] = current_time
 
-        return mqtt_data
+    def apply_descriptions(changed):
+        """Runs once per workbook change, on the watcher thread"""
+        persistence_worker.submit_descriptions(changed)
+        report_store.set_descriptions(changed)
+
+    if description_watcher is not None:
+        description_watcher.subscribe(apply_descriptions)
+
+    # Push the same deltas to the browser as soon as the store changes
+    active_streams = [0]
+    streams_lock = threading.Lock()
+    REGISTRY.gauge(
+        "kerbtrack_event_streams",
+        "Browsers connected to /events",
+        function=lambda: active_streams[0],
+    )
 
-    @app.callback(
-        Output("description-store", "data"),
-        Input("excel-check-interval", "n_intervals"),
+    def event_stream(epoch, seq):
+        yield f"retry: {EVENT_RETRY_MS}\n\n"
+        started = time.monotonic()
+        version = None
+        while time.monotonic() - started < EVENT_STREAM_SECONDS:
+            version = report_store.wait_for_change(version, EVENT_HEARTBEAT_SECONDS)
+            delta = report_delta(epoch, seq)
+            if delta is None:
+                yield ": keepalive\n\n"
+                continue
+            epoch, seq = delta["epoch"], delta["seq"]
+            yield format_event("reports", delta, format_event_id(epoch, seq))
+            # Let a burst of ingest batches coalesce into the next event
+            time.sleep(EVENT_MIN_GAP_SECONDS)
+
+    def release_stream():
+        with streams_lock:
+            active_streams[0] -= 1
+
+    @app.server.route("/events")
+    def live_events():
+        """Server-Sent Events stream of store deltas"""
+        # Checked and taken together, so a burst of connections cannot overshoot
+        with streams_lock:
+            if active_streams[0] >= MAX_EVENT_STREAMS:
+                # The browser keeps polling on the fallback interval instead
+                return "Too many live connections", 503
+            active_streams[0] += 1
+        # A reconnecting EventSource resends the id of the last event it got
+        cursor = parse_event_id(
+            flask.request.headers.get("Last-Event-ID")
+            or flask.request.args.get("cursor", "")
+        )
+        response = flask.Response(
+            event_stream(*cursor),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+        # Runs when the server is done with the response, even one whose
+        # stream never started because the client went away first
+        response.call_on_close(release_stream)
+        return response
+
+    # Opens the stream once the first delta has set the cursor, so it starts
+    # from there instead of resetting a second time
+    app.clientside_callback(
+        ClientsideFunction(namespace="live", function_name="connect"),
+        Output("live-status", "data"),
+        Input("mqtt-cursor", "data"),
+        prevent_initial_call=True,
     )
-    def update_descriptions(n):
-        """Automatically check Excel file for updated descriptions every 3 seconds"""
-        descriptions = load_descriptions_from_excel()
-        return descriptions
+
+    def build_table_page(search_value, filter_query, sort_by, page_current, page_size):
+        """One table page and the page count"""
+
+        def value_of(report, column):
+            if column == "Image_Description":
+                return report_store.description(report.id) or "Pending..."
+            if column == "Image":
+                return report.get("ImageURL")
+            return report.get(column)
+
+        filters = parse_filter_query(filter_query)
+
+        sort_column = sort_by[0]["column_id"] if sort_by else None
+        descending = bool(sort_by) and sort_by[0]["direction"] == "desc"
+
+        # Search terms are answered by the store's full-text index
+        total, page = report_store.query(
+            search=search_value,
+            filters=filters,
+            sort_column=sort_column,
+            descending=descending,
+            offset=page_current * page_size,
+            limit=page_size,
+            value_of=value_of,
+        )
+
+        rows = [
+            table_row(report, report_store.description(report.id))
+            for report in page
+        ]
+        return rows, max(1, math.ceil(total / page_size))
 
     @app.callback(
         Output("mqtt-table", "data"),
-        Output("mqtt-table", "columns"),
-        Input("interval", "n_intervals"),
+        Output("mqtt-table", "page_count"),
+        Input("mqtt-cursor", "data"),
         Input("search-input", "value"),
-        Input("description-store", "data"),
-        State("mqtt-store", "data"),
+        Input("mqtt-table", "page_current"),
+        Input("mqtt-table", "page_size"),
+        Input("mqtt-table", "sort_by"),
+        Input("mqtt-table", "filter_query"),
     )
-    def update_table(n, search_value, descriptions, mqtt_store_data):
+    def update_table(
+        cursor,
+        search_value,
+        page_current,
+        page_size,
+        sort_by,
+        filter_query,
+    ):
         try:
-            df = pd.DataFrame(mqtt_store_data)
-            if df.empty:
-                return [], DEFAULT_COLUMNS
-
-            # Add Image column from ImageURL
-            if "ImageURL" in df.columns:
-                df["Image"] = df["ImageURL"].apply(
-                    lambda url: f'<a href="{url}" target="_blank">View Image</a>'
-                )
-                df.drop(columns=["ImageURL"], inplace=True)
-
-            # Add Image_Description column with default "Pending..."
-            df["Image_Description"] = "Pending..."
-
-            # Update descriptions from Excel file
-            if descriptions:
-                for idx, row in df.iterrows():
-                    mqtt_id = str(row["ID"]).strip()
-
-                    # Try to find matching description
-                    if mqtt_id in descriptions:
-                        df.at[idx, "Image_Description"] = descriptions[mqtt_id]
-
-            # Apply search filter
-            if search_value:
-                s = search_value.lower()
-                df = df[
-                    df["ID"].astype(str).str.lower().str.contains(s, na=False)
-                    | df["GPS"].astype(str).str.lower().str.contains(s, na=False)
-                    | df["Address"].astype(str).str.lower().str.contains(s, na=False)
-                    | df["Message"].astype(str).str.lower().str.contains(s, na=False)
-                    | df["Image_Description"]
-                    .astype(str)
-                    .str.lower()
-                    .str.contains(s, na=False)
-                ]
-
-            # Create columns configuration
-            columns = []
-            for col in df.columns:
-                if col == "Image":
-                    columns.append({"name": col, "id": col, "presentation": "markdown"})
-                else:
-                    columns.append({"name": col, "id": col})
-
-            return df.to_dict("records"), columns
+            page_current = page_current or 0
+            # version moves on report, description and eviction changes alike
+            key = (
+                "table",
+                report_store.version,
+                (search_value or "").strip().lower(),
+                filter_query or "",
+                tuple((col["column_id"], col["direction"]) for col in sort_by or ()),
+                page_current,
+                page_size,
+            )
+            return view_cache.get_or_compute(
+                key,
+                lambda: build_table_page(
+                    search_value, filter_query, sort_by, page_current, page_size
+                ),
+            )
 
-        except Exception as e:
-            print("Error in update_table:", e)
-            import traceback
+        except Exception:
+            logger.exception("Error in update_table")
+            return [], 1
 
-            traceback.print_exc()
-            return [], DEFAULT_COLUMNS
+    @app.callback(
+        Output("map-markers", "children"),
+        Input("mqtt-cursor", "data"),
+        Input("map", "bounds"),
+        Input("map", "zoom"),
+    )
+    def update_map_markers(cursor, bounds, zoom):
+        # Only build markers for what is visible
+        (south, west), (north, east) = bounds or DEFAULT_MAP_BOUNDS
+        zoom = DEFAULT_MAP_ZOOM if zoom is None else zoom
+        key = (
+            "map",
+            report_store.version,
+            zoom,
+            round(south, 4),
+            round(west, 4),
+            round(north, 4),
+            round(east, 4),
+        )
+        return view_cache.get_or_compute(
+            key, lambda: build_map_markers(south, west, north, east, zoom)
+        )
+
+    def build_map_markers(south, west, north, east, zoom):
+        """Clusters or individual markers for the viewport"""
+        # Zoomed out, show one circle per cluster instead of every marker and popup
+        if zoom < CLUSTER_MAX_ZOOM:
+            return [
+                dl.CircleMarker(
+                    center=[lat, lon],
+                    radius=min(8 + 4 * math.log2(count), 30),
+                    color="#059669",
+                    fillOpacity=0.6,
+                    children=[dl.Tooltip(f"{count} report{'s' if count > 1 else ''}")],
+                )
+                for lat, lon, count in report_store.clusters(
+                    zoom, south, west, north, east
+                )
+            ]
 
-    @app.callback(Output("map-markers", "children"), Input("mqtt-store", "data"))
-    def update_map_markers(mqtt_store_data):
-        if not mqtt_store_data:
-            return []
+        visible = report_store.in_bounds(
+            south, west, north, east, limit=MAX_VISIBLE_MARKERS
+        )
 
         markers = []
-        for entry in mqtt_store_data:
-            gps_str = entry.get("GPS", "")
-            lat, lon = parse_gps(gps_str)
-            if lat is not None and lon is not None:
-                address = entry.get("Address", "N/A")
-                image_url = entry.get("ImageURL", "")
-                popup_children = [
-                    html.B(f"ID: {entry.get('ID', 'N/A')}"),
-                    html.Br(),
-                    html.Span(f"Address: {address}"),
-                ]
+        for entry, (lat, lon) in visible:
+            address = entry.get("Address", "N/A")
+            image_url = entry.get("ImageURL", "")
+            popup_children = [
+                html.B(f"ID: {entry.get('ID', 'N/A')}"),
+                html.Br(),
+                html.Span(f"Address: {address}"),
+            ]
 
-                # Popup image when click on the pin
-                if image_url:
-                    popup_children.extend(
-                        [
-                            html.Br(),
+            # Popup image when click on the pin
+            if image_url:
+                popup_children.extend(
+                    [
+                        html.Br(),
+                        # Cached thumbnail, the full-size image opens on click
+                        html.A(
                             html.Img(
-                                src=image_url,
+                                src=thumbnail_url(entry.id, image_url),
                                 style={
                                     "width": "150px",
                                     "marginTop": "5px",
                                     "borderRadius": "8px",
                                 },
                             ),
-                        ]
-                    )
-                markers.append(
-                    dl.Marker(position=[lat, lon], children=[dl.Popup(popup_children)])
+                            href=image_url,
+                            target="_blank",
+                        ),
+                    ]
                 )
+            markers.append(
+                dl.Marker(position=[lat, lon], children=[dl.Popup(popup_children)])
+            )
         return markers
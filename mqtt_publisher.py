@@ -1,41 +1,260 @@
-import paho.mqtt.client as mqtt
+"""KerbTrack load generator
+
+Publishes synthetic kerbside reports at a controlled rate, either to an MQTT
+broker (a local one by default) or straight into an in-process ingest
+pipeline and report store, so the dashboard's ingest path can be loaded
+without a network.
+
+    python mqtt_publisher.py --rate 500 --duration 60
+    python mqtt_publisher.py --in-process --rate 20000 --count 200000 --burst 1000
+    python mqtt_publisher.py --broker broker.hivemq.com --rate 1 --count 50
+
+Every payload carries SentAt (epoch seconds), so the receiving side can
+work out end-to-end latency: the ingest pipeline compares it with the time
+each report reached the store. In-process runs print those percentiles.
+"""
+
+import argparse
 import json
+import random
 import time
+from collections import Counter
+
+from benchmarks.synthetic import IMAGE_BASE_URL, STREETS, SUBURBS, format_gps
+
+TOPIC = "test/kerbtrack/json_data"
+
+# Recently sent reports that duplicates and updates are drawn from
+RECENT_REPORTS = 10000
+
+MESSAGES = ["Kerbside Dump Detected", "Kerbside Dump Still Present", "Kerbside Dump Cleared"]
+
+
+class PayloadMix:
+    """New reports, exact duplicates, updates to earlier IDs and malformed payloads"""
+
+    def __init__(
+        self,
+        duplicate_ratio=0.0,
+        update_ratio=0.0,
+        malformed_ratio=0.0,
+        seed=1,
+        image_base_url=IMAGE_BASE_URL,
+    ):
+        self.duplicate_ratio = duplicate_ratio
+        self.update_ratio = update_ratio
+        self.malformed_ratio = malformed_ratio
+        self.image_base_url = image_base_url
+        self.rng = random.Random(seed)
+        self.suburbs = list(SUBURBS.items())
+        self.next_id = 1
+        self.recent = []
+        self.kinds = Counter()
+
+    def new_report(self, report_id):
+        suburb, (lat, lon) = self.rng.choice(self.suburbs)
+        return {
+            "ID": str(report_id),
+            "GPS": format_gps(self.rng.gauss(lat, 0.005), self.rng.gauss(lon, 0.005)),
+            "Address": f"{self.rng.choice(STREETS)}, {suburb}",
+            "Message": MESSAGES[0],
+            "ImageURL": f"{self.image_base_url}/{report_id}.jpg",
+        }
+
+    def malformed(self):
+        kind = self.rng.choice(["truncated", "no_id", "bad_id", "bad_gps"])
+        self.kinds["malformed_" + kind] += 1
+        report = self.new_report(self.next_id)
+        if kind == "truncated":
+            return json.dumps(report)[: self.rng.randrange(1, 40)].encode()
+        if kind == "no_id":
+            del report["ID"]
+        elif kind == "bad_id":
+            report["ID"] = "sensor-" + report["ID"]
+        else:
+            report["GPS"] = "unknown"
+        return report
+
+    def next(self):
+        """The next report dict, or raw bytes for an undecodable payload"""
+        roll = self.rng.random()
+        if roll < self.malformed_ratio:
+            return self.malformed()
+        roll -= self.malformed_ratio
+
+        if self.recent and roll < self.duplicate_ratio:
+            self.kinds["duplicate"] += 1
+            return dict(self.rng.choice(self.recent))
+        roll -= self.duplicate_ratio
+
+        if self.recent and roll < self.update_ratio:
+            self.kinds["update"] += 1
+            report = dict(self.rng.choice(self.recent))
+            report["Message"] = self.rng.choice(MESSAGES[1:])
+        else:
+            self.kinds["new"] += 1
+            report = self.new_report(self.next_id)
+            self.next_id += 1
+
+        if len(self.recent) < RECENT_REPORTS:
+            self.recent.append(report)
+        else:
+            self.recent[self.rng.randrange(RECENT_REPORTS)] = report
+        return report
+
+
+def encode(report):
+    if isinstance(report, bytes):
+        return report
+    return json.dumps({**report, "SentAt": time.time()}).encode()
+
+
+def run(publish, mix, rate, count=None, duration=None, burst=1):
+    """Publish bursts of `burst` messages, paced so the average is `rate` per second"""
+    sent = 0
+    started = time.perf_counter()
+    next_burst = started
+    while True:
+        elapsed = time.perf_counter() - started
+        if (count is not None and sent >= count) or (
+            duration is not None and elapsed >= duration
+        ):
+            break
+
+        size = burst if count is None else min(burst, count - sent)
+        for _ in range(size):
+            publish(encode(mix.next()))
+        sent += size
+
+        next_burst += size / rate
+        delay = next_burst - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+    return sent, time.perf_counter() - started
+
+
+def positive(convert):
+    """argparse type: convert, then refuse anything not greater than 0"""
+
+    def parse(value):
+        number = convert(value)
+        if number <= 0:
+            raise argparse.ArgumentTypeError(f"must be greater than 0, got {value}")
+        return number
+
+    # argparse names the type in its "invalid float value" message
+    parse.__name__ = convert.__name__
+    return parse
+
+
+def report_in_process(pipeline):
+    store = pipeline.report_store
+    print(
+        f"Pipeline: received {pipeline.received}, accepted {pipeline.accepted}, "
+        f"dropped {pipeline.dropped}, undecodable {pipeline.decode_errors}, "
+        f"invalid {pipeline.invalid}; store holds {len(store)} reports"
+    )
+    if pipeline.latency_percentile(0.5) is not None:
+        print(
+            "End-to-end latency to the store: "
+            f"p50 {pipeline.latency_percentile(0.5) * 1000:.1f} ms, "
+            f"p95 {pipeline.latency_percentile(0.95) * 1000:.1f} ms, "
+            f"max {pipeline.latency_percentile(1.0) * 1000:.1f} ms"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="KerbTrack MQTT load generator")
+    parser.add_argument("--broker", default="localhost")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--topic", default=TOPIC)
+    parser.add_argument(
+        "--in-process",
+        action="store_true",
+        help="feed an in-process ingest pipeline and store instead of a broker",
+    )
+    parser.add_argument(
+        "--rate", type=positive(float), default=100, help="messages per second"
+    )
+    parser.add_argument("--count", type=int, help="stop after this many messages")
+    parser.add_argument("--duration", type=float, help="stop after this many seconds")
+    parser.add_argument(
+        "--burst", type=positive(int), default=1, help="messages sent back to back per burst"
+    )
+    parser.add_argument("--duplicate-ratio", type=float, default=0.0)
+    parser.add_argument("--update-ratio", type=float, default=0.0)
+    parser.add_argument("--malformed-ratio", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--image-base-url",
+        default=IMAGE_BASE_URL,
+        help="e.g. http://localhost:8060 for benchmarks/image_host.py "
+        "(run the dashboard with KERBTRACK_ALLOW_PRIVATE_IMAGES=1 for that)",
+    )
+    args = parser.parse_args()
+
+    if args.count is None and args.duration is None:
+        args.count = 1000
+
+    mix = PayloadMix(
+        args.duplicate_ratio,
+        args.update_ratio,
+        args.malformed_ratio,
+        args.seed,
+        args.image_base_url,
+    )
+
+    pipeline = client = None
+    if args.in_process:
+        from services.ingest import IngestPipeline
+        from services.report_store import ReportStore
+
+        pipeline = IngestPipeline(ReportStore(eviction_path=None))
+        pipeline.start()
+        publish = pipeline.submit
+    else:
+        import paho.mqtt.client as mqtt
+
+        client = mqtt.Client()
+        try:
+            client.connect(args.broker, args.port)
+        except OSError as e:
+            raise SystemExit(
+                f"Cannot reach MQTT broker {args.broker}:{args.port} ({e}); "
+                "start one locally or use --in-process"
+            )
+        client.loop_start()
+        last_publish = [None]
+
+        def publish(payload):
+            last_publish[0] = client.publish(args.topic, payload)
+
+    try:
+        sent, seconds = run(
+            publish, mix, args.rate, args.count, args.duration, args.burst
+        )
+    except KeyboardInterrupt:
+        print("Stopped sending")
+        sent, seconds = sum(mix.kinds.values()), None
+
+    if seconds:
+        print(
+            f"Published {sent} messages in {seconds:.2f} s "
+            f"({sent / seconds:,.0f}/s achieved, {args.rate:,.0f}/s requested)"
+        )
+    print("Payload mix: " + ", ".join(f"{k} {v}" for k, v in sorted(mix.kinds.items())))
+
+    if pipeline is not None:
+        pipeline.stop()
+        report_in_process(pipeline)
+    else:
+        # Let the network thread finish sending what is still queued
+        if last_publish[0] is not None:
+            last_publish[0].wait_for_publish(timeout=30)
+        client.loop_stop()
+        client.disconnect()
+        print("Disconnected from broker")
+
 
-broker = "broker.hivemq.com"
-topic = "test/kerbtrack/json_data"
-
-client = mqtt.Client()
-client.connect(broker, 1883)
-
-sample_data = [
-    {"ID": "1", "GPS": "32.9283° S, 151.7817° E", "Address": "Main St", "Message": "Kerbside Dump Detected", "ImageURL": "https://www.campbelltown.nsw.gov.au/files/sharedassets/public/v/2/services-and-facilities/waste-and-recycling/images/kerbsidecleanup2.jpg?dimension=pageimage&w=480"},
-    {"ID": "2", "GPS": "32.9031° S, 151.6696° E", "Address": "North St", "Message": "Kerbside Dump Detected","ImageURL": "https://images.craigslist.org/00808_7iKiQqX0sru_0CI0t2_600x450.jpg"},
-    {"ID": "3", "GPS": "32.9267° S, 151.7800° E", "Address": "Hunter St, Newcastle West", "Message": "Kerbside Dump Detected", "ImageURL": "https://images.craigslist.org/00W0W_i7ukNiwZ5VN_0CI0CI_600x450.jpg"},
-    {"ID": "4", "GPS": "32.9352° S, 151.7501° E", "Address": "Darby St, Cooks Hill", "Message": "Kerbside Dump Detected", "ImageURL": "https://images.craigslist.org/00W0W_i7ukNiwZ5VN_0CI0CI_600x450.jpg"},
-    {"ID": "5", "GPS": "32.9486° S, 151.7263° E", "Address": "Glebe Rd, The Junction", "Message": "Kerbside Dump Detected", "ImageURL": "https://live-production.wcms.abc-cdn.net.au/35bf5d7e6aeee5391a1f3ca84b68fb5a?impolicy=wcms_crop_resize&cropH=1125&cropW=2000&xPos=0&yPos=326&width=862&height=485"},
-    {"ID": "6", "GPS": "32.9205° S, 151.7352° E", "Address": "Beaumont St, Hamilton", "Message": "Kerbside Dump Detected", "ImageURL": "https://images.squarespace-cdn.com/content/v1/6338330a337f6700f6f28fc9/aa8dae6e-0e5c-41a6-9646-c8bd36f8116e/wn_hardwaste-_banner.jpg"},
-    {"ID": "7", "GPS": "32.9754° S, 151.7102° E", "Address": "John Parade, Merewether", "Message": "Kerbside Dump Detected", "ImageURL": "https://images.craigslist.org/00W0W_i7ukNiwZ5VN_0CI0CI_600x450.jpg"},
-    {"ID": "8", "GPS": "32.9025° S, 151.7820° E", "Address": "Industrial Dr, Mayfield", "Message": "Kerbside Dump Detected", "ImageURL": "https://images.craigslist.org/00W0W_i7ukNiwZ5VN_0CI0CI_600x450.jpg"},
-    {"ID": "9", "GPS": "32.9672° S, 151.6935° E", "Address": "Pacific Hwy, Charlestown", "Message": "Kerbside Dump Detected", "ImageURL": "https://images.craigslist.org/00W0W_i7ukNiwZ5VN_0CI0CI_600x450.jpg"},
-    {"ID": "10", "GPS": "32.9078° S, 151.6679° E", "Address": "Cowper St, Wallsend", "Message": "Kerbside Dump Detected", "ImageURL": "https://images.craigslist.org/00W0W_i7ukNiwZ5VN_0CI0CI_600x450.jpg"}
-
-]
-
-try:
-    for loop_num in range(5):  # Loop exactly 5 times (0-4)
-        print(f"Starting loop {loop_num + 1}/5")
-        for data in sample_data:
-            payload = json.dumps(data)       # convert dict to JSON string
-            client.publish(topic, payload)  # send to broker
-            print("Published:", payload)
-            time.sleep(1)  # send a new message every 1 second
-        print(f"Completed loop {loop_num + 1}/5")
-    
-    print("All 5 loops completed! Stopping...")
-        
-except KeyboardInterrupt:
-    print("Stopped sending")
-
-client.disconnect()
-print("Disconnected from broker")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
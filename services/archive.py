@@ -0,0 +1,395 @@
+import datetime
+import functools
+import hashlib
+import importlib.util
+import json
+import logging
+import operator
+import os
+import threading
+import time
+
+from services.log import RateLimitedLog, log_stage
+from services.metrics import REGISTRY
+from services.report import ReportColumns
+
+# The archive is off without pyarrow. It takes longer to import than the
+# rest of the app, so it is only loaded once the archive is used
+PYARROW_AVAILABLE = importlib.util.find_spec("pyarrow") is not None
+
+logger = logging.getLogger(__name__)
+
+# Parquet files live here, one directory per UTC day: archive/date=2026-10-18/
+ARCHIVE_DIR = "archive"
+
+# Seconds between rolls of newly stored reports into the archive
+DEFAULT_ROLL_INTERVAL = 300
+
+# Reports read from the database per part file written
+DEFAULT_ROLL_ROWS = 100000
+
+# Underscore files are skipped by pyarrow when it discovers the parts
+STATE_FILE = "_state.json"
+EXCEL_MIGRATED_MARKER = "_excel_migrated"
+
+# Reports the workbook import archived that the database has not shown yet,
+# ID -> fingerprint; deleted once every one of them has come by
+EXCEL_COVERED_FILE = "_excel_covered.json"
+
+# Columns of every part file, in order; ReceivedAt is epoch seconds like the
+# rest of the app, Seq the database change it came from (0 for the workbook import)
+ARCHIVE_COLUMNS = [
+    "Seq",
+    "ReceivedAt",
+    "ID",
+    "GPS",
+    "Address",
+    "Suburb",
+    "Message",
+    "ImageURL",
+    "Lat",
+    "Lon",
+    "Image_Description",
+]
+
+
+def archive_schema():
+    import pyarrow as pa
+
+    return pa.schema(
+        [
+            ("Seq", pa.int64()),
+            ("ReceivedAt", pa.float64()),
+            ("ID", pa.int64()),
+            ("GPS", pa.string()),
+            ("Address", pa.string()),
+            ("Suburb", pa.string()),
+            ("Message", pa.string()),
+            ("ImageURL", pa.string()),
+            ("Lat", pa.float64()),
+            ("Lon", pa.float64()),
+            ("Image_Description", pa.string()),
+        ]
+    )
+
+
+def archive_day(timestamp):
+    """Partition a timestamp (epoch seconds) falls in, e.g. "2026-10-18" (UTC)"""
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).date().isoformat()
+
+
+def fingerprint(report, description):
+    """Short hash of the archived fields of one report version"""
+    text = "\x1f".join(
+        (report.gps, report.address, report.message, report.image_url, description or "")
+    )
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+
+def to_table(rows):
+    """Arrow table from (seq, Report with timestamp, description) rows"""
+    import pyarrow as pa
+
+    columns = {name: [] for name in ARCHIVE_COLUMNS}
+    for seq, report, description in rows:
+        columns["Seq"].append(seq)
+        columns["ReceivedAt"].append(report.timestamp)
+        columns["ID"].append(report.id)
+        columns["GPS"].append(report.gps)
+        columns["Address"].append(report.address)
+        columns["Suburb"].append(report.suburb)
+        columns["Message"].append(report.message)
+        columns["ImageURL"].append(report.image_url)
+        columns["Lat"].append(report.lat)
+        columns["Lon"].append(report.lon)
+        columns["Image_Description"].append(description)
+    return pa.table(columns, schema=archive_schema())
+
+
+class ReportArchive:
+    """Time-partitioned Parquet history of every report version the database stored
+
+    roll() copies payloads written since the last roll (by database seq)
+    into one part file per UTC day they were received, and merges the parts
+    of earlier days into one file. The database only keeps the latest
+    version of each ID, the archive keeps every version it saw, so months
+    of detections can be read back quickly: read() loads only the columns
+    asked for and only the day directories inside the time range.
+    Descriptions are the ones known when a report was rolled.
+
+    Only the process that writes the database rolls (start()), importing
+    excel_path first if the archive has never seen it; web workers just
+    read. Without pyarrow every method is a no-op and read() raises.
+    """
+
+    def __init__(
+        self,
+        database,
+        directory=ARCHIVE_DIR,
+        excel_path=None,
+        roll_interval=DEFAULT_ROLL_INTERVAL,
+        roll_rows=DEFAULT_ROLL_ROWS,
+    ):
+        self.database = database
+        self.directory = directory
+        self.excel_path = excel_path
+        self.roll_interval = roll_interval
+        self.roll_rows = roll_rows
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._covered = None
+        self._covered_changed = False
+        self._log = RateLimitedLog(logger)
+
+        # Stats
+        self.seq = 0
+        self.rows_archived = 0
+        self.parts_written = 0
+
+        if not PYARROW_AVAILABLE:
+            logger.info("pyarrow is not installed, the Parquet archive is off")
+            return
+        os.makedirs(directory, exist_ok=True)
+        self.seq = self._load_state().get("seq", 0)
+
+    @property
+    def available(self):
+        return PYARROW_AVAILABLE
+
+    def register_metrics(self, registry=REGISTRY):
+        registry.gauge(
+            "kerbtrack_archive_seq",
+            "Last database change rolled into the archive",
+            function=lambda: self.seq,
+        )
+        registry.counter(
+            "kerbtrack_archive_rows_total",
+            "Report versions written to the archive",
+            function=lambda: self.rows_archived,
+        )
+
+    def _load_state(self):
+        try:
+            with open(os.path.join(self.directory, STATE_FILE)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _save_state(self):
+        path = os.path.join(self.directory, STATE_FILE)
+        with open(path + ".tmp", "w") as f:
+            json.dump({"seq": self.seq}, f)
+        os.replace(path + ".tmp", path)
+
+    def _load_covered(self):
+        try:
+            with open(os.path.join(self.directory, EXCEL_COVERED_FILE)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _save_covered(self):
+        path = os.path.join(self.directory, EXCEL_COVERED_FILE)
+        if not self._covered:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        with open(path + ".tmp", "w") as f:
+            json.dump(self._covered, f)
+        os.replace(path + ".tmp", path)
+
+    def _skip_covered(self, rows):
+        """Drop rows the workbook import already archived, returns the rest"""
+        if self._covered is None:
+            self._covered = self._load_covered()
+        if not self._covered:
+            return rows
+        kept = []
+        self._covered_changed = True
+        for row in rows:
+            _, report, description = row
+            # Only the first version the database shows can be the imported one
+            covered = self._covered.pop(str(report.id), None)
+            if covered is None or covered != fingerprint(report, description):
+                kept.append(row)
+        return kept
+
+    def _write_part(self, day, name, table):
+        """Write a part file under its day, appearing whole or not at all"""
+        import pyarrow.parquet as pq
+
+        directory = os.path.join(self.directory, f"date={day}")
+        os.makedirs(directory, exist_ok=True)
+        # Dot files are skipped when pyarrow discovers the parts
+        temporary = os.path.join(directory, f".{name}.tmp")
+        pq.write_table(table, temporary, compression="zstd")
+        os.replace(temporary, os.path.join(directory, name))
+        self.parts_written += 1
+
+    def _write_by_day(self, rows, name):
+        """Split rows by the UTC day they were stored and write a part for each"""
+        days = {}
+        for row in rows:
+            days.setdefault(archive_day(row[1].timestamp), []).append(row)
+        for day, day_rows in days.items():
+            self._write_part(day, name, to_table(day_rows))
+        self.rows_archived += len(rows)
+
+    def migrate_excel(self, path):
+        """Import the Excel workbook's reports once, returns how many (0 on later calls)
+
+        The rows are archived as of the workbook's last change, with Seq 0;
+        a marker file keeps this from running again, workbook or not. The
+        backfill stores the same rows in the database, so roll() skips them
+        when they come by unchanged.
+        """
+        if not PYARROW_AVAILABLE:
+            return 0
+        marker = os.path.join(self.directory, EXCEL_MIGRATED_MARKER)
+        if os.path.exists(marker):
+            return 0
+
+        count = 0
+        with self._lock:
+            if os.path.exists(path):
+                import pandas as pd
+
+                with log_stage(logger, "Archived %d reports from %s") as stage:
+                    df = pd.read_excel(path)
+                    if not df.empty and "ID" in df.columns:
+                        columns = ReportColumns.from_frame(df)
+                        rows = list(
+                            zip(
+                                [0] * len(columns),
+                                columns.reports(os.path.getmtime(path)),
+                                columns.descriptions,
+                            )
+                        )
+                        # One fixed name, so an interrupted import is simply redone
+                        self._write_by_day(rows, "excel-import.parquet")
+                        count = len(rows)
+                        self._covered = {
+                            str(report.id): fingerprint(report, description)
+                            for _, report, description in rows
+                        }
+                        self._save_covered()
+                    stage.done(count, path)
+            with open(marker, "w") as f:
+                f.write(f"{time.time()}\n")
+        return count
+
+    def roll(self):
+        """Archive everything stored since the last roll, returns how many reports"""
+        if not PYARROW_AVAILABLE:
+            return 0
+        rolled = 0
+        with self._lock:
+            while True:
+                seq, rows = self.database.history_since(self.seq, self.roll_rows)
+                if seq == self.seq:
+                    break
+                first = rows[0][0] if rows else seq
+                rows = self._skip_covered(rows)
+                # Named after the seq range, so rolling it again after a crash overwrites
+                if rows:
+                    self._write_by_day(rows, f"part-{first:012d}-{seq:012d}.parquet")
+                self.seq = seq
+                self._save_state()
+                if self._covered_changed:
+                    self._save_covered()
+                    self._covered_changed = False
+                rolled += len(rows)
+            self._compact(archive_day(time.time()))
+        if rolled:
+            logger.info("Archived %d reports up to seq %d", rolled, self.seq)
+        return rolled
+
+    def _compact(self, today):
+        """Merge the part files of each day before today into one"""
+        for entry in sorted(os.listdir(self.directory)):
+            if not entry.startswith("date=") or entry[5:] >= today:
+                continue
+            directory = os.path.join(self.directory, entry)
+            parts = sorted(
+                name for name in os.listdir(directory) if name.endswith(".parquet")
+            )
+            if len(parts) < 2:
+                continue
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            tables = [pq.read_table(os.path.join(directory, name)) for name in parts]
+            table = pa.concat_tables(tables).sort_by([("Seq", "ascending")])
+            name = f"day-{entry[5:]}-{len(table)}.parquet"
+            self._write_part(entry[5:], name, table)
+            for part in parts:
+                if part != name:
+                    os.remove(os.path.join(directory, part))
+            logger.debug("Compacted %d parts of %s", len(parts), entry[5:])
+
+    def read(self, columns=None, start=None, end=None, equals=None, latest=False):
+        """Archived reports as a DataFrame, oldest first
+
+        columns picks what to read (all by default), start/end bound
+        ReceivedAt in epoch seconds (end exclusive) and equals ({column:
+        value}, e.g. {"Suburb": "Mayfield"}) keeps only matching rows. Only
+        the day directories in range are opened and the filters are applied
+        while scanning. latest=True keeps one row per ID, its most
+        recent version.
+        """
+        if not PYARROW_AVAILABLE:
+            raise RuntimeError("The archive needs pyarrow")
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+
+        columns = list(columns or ARCHIVE_COLUMNS)
+        equals = equals or {}
+        unknown = (set(columns) | set(equals)) - set(ARCHIVE_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown archive columns: {', '.join(sorted(unknown))}")
+
+        bounds = [ds.field(column) == value for column, value in equals.items()]
+        # The day bounds select directories, the ReceivedAt bounds rows inside them
+        if start is not None:
+            bounds += [ds.field("date") >= archive_day(start), ds.field("ReceivedAt") >= start]
+        if end is not None:
+            bounds += [ds.field("date") <= archive_day(end), ds.field("ReceivedAt") < end]
+        expression = functools.reduce(operator.and_, bounds) if bounds else None
+
+        # Ordering and latest need these even when they are not asked for
+        needed = columns + [c for c in ("Seq", "ReceivedAt", "ID") if c not in columns]
+        partitioning = ds.partitioning(pa.schema([("date", pa.string())]), flavor="hive")
+        dataset = ds.dataset(
+            self.directory,
+            format="parquet",
+            partitioning=partitioning,
+            schema=archive_schema().append(pa.field("date", pa.string())),
+        )
+        df = dataset.to_table(columns=needed, filter=expression).to_pandas()
+        df = df.sort_values(["ReceivedAt", "Seq"], kind="stable")
+        if latest:
+            df = df.drop_duplicates("ID", keep="last")
+        return df[columns].reset_index(drop=True)
+
+    def start(self):
+        if PYARROW_AVAILABLE and self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        if self.excel_path:
+            try:
+                self.migrate_excel(self.excel_path)
+            except Exception as e:
+                logger.error("Error importing %s into the archive: %s", self.excel_path, e)
+        while True:
+            try:
+                self.roll()
+            except Exception as e:
+                self._log(logging.ERROR, "roll", "Error rolling reports into the archive: %s", e)
+            if self._stop.wait(self.roll_interval):
+                break
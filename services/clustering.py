@@ -0,0 +1,73 @@
+import math
+
+# Below this zoom level the map shows clusters instead of individual markers
+CLUSTER_MAX_ZOOM = 15
+
+# Approximate on-screen size of one cluster cell in pixels
+CLUSTER_CELL_PIXELS = 80
+
+
+def cell_size(zoom):
+    """Degrees covered by one cluster cell at a zoom level (256 px world tiles)"""
+    return CLUSTER_CELL_PIXELS * 360.0 / (256 * 2**zoom)
+
+
+class ClusterIndex:
+    """Per-zoom grid clusters with counts and centroids, updated point by point"""
+
+    def __init__(self, max_zoom=CLUSTER_MAX_ZOOM):
+        self.max_zoom = max_zoom
+        # zoom -> (row, col) -> [count, lat sum, lon sum]
+        self._levels = {zoom: {} for zoom in range(max_zoom)}
+
+    def add(self, lat, lon):
+        for zoom, cells in self._levels.items():
+            size = cell_size(zoom)
+            cell = cells.setdefault(
+                (math.floor(lat / size), math.floor(lon / size)), [0, 0.0, 0.0]
+            )
+            cell[0] += 1
+            cell[1] += lat
+            cell[2] += lon
+
+    def remove(self, lat, lon):
+        for zoom, cells in self._levels.items():
+            size = cell_size(zoom)
+            key = (math.floor(lat / size), math.floor(lon / size))
+            cell = cells.get(key)
+            if cell is None:
+                continue
+            cell[0] -= 1
+            if cell[0] <= 0:
+                del cells[key]
+            else:
+                cell[1] -= lat
+                cell[2] -= lon
+
+    def clusters(self, zoom, south, west, north, east):
+        """(lat, lon, count) for every cluster cell overlapping the box"""
+        zoom = max(0, min(int(zoom), self.max_zoom - 1))
+        cells = self._levels[zoom]
+        size = cell_size(zoom)
+        min_row, min_col = math.floor(south / size), math.floor(west / size)
+        max_row, max_col = math.floor(north / size), math.floor(east / size)
+
+        if (max_row - min_row + 1) * (max_col - min_col + 1) > len(cells):
+            keys = [
+                (row, col)
+                for row, col in cells
+                if min_row <= row <= max_row and min_col <= col <= max_col
+            ]
+        else:
+            keys = [
+                (row, col)
+                for row in range(min_row, max_row + 1)
+                for col in range(min_col, max_col + 1)
+                if (row, col) in cells
+            ]
+
+        found = []
+        for key in keys:
+            count, lat_sum, lon_sum = cells[key]
+            found.append((lat_sum / count, lon_sum / count, count))
+        return found
@@ -0,0 +1,129 @@
+import logging
+import os
+import threading
+from contextlib import contextmanager
+
+from services.log import RateLimitedLog
+
+logger = logging.getLogger(__name__)
+
+# Seconds between mtime checks of the watched file
+DEFAULT_POLL_INTERVAL = 3
+
+
+class DescriptionWatcher:
+    """One background thread that reloads descriptions only when the file changes
+
+    Keeps the parsed ID -> description map and a version number that moves
+    on every change, and hands each reload's changes to the subscribers.
+    Only the process that writes the database runs one; web workers get the
+    descriptions from the database.
+    """
+
+    def __init__(self, path, load, poll_interval=DEFAULT_POLL_INTERVAL):
+        self.path = path
+        self.poll_interval = poll_interval
+        self._load = load
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._descriptions = {}
+        self._version = 0
+        self._signature = None
+        # Held while checking, and while the app rewrites the file itself
+        self._check_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._log = RateLimitedLog(logger)
+
+    @property
+    def version(self):
+        return self._version
+
+    def descriptions(self):
+        with self._lock:
+            return dict(self._descriptions)
+
+    def subscribe(self, listener):
+        """listener(changed) gets {ID: description or None} after every reload"""
+        self._listeners.append(listener)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.check()
+            except Exception as e:
+                self._log(
+                    logging.ERROR, "check", "Error checking descriptions file: %s", e
+                )
+            self._stop.wait(self.poll_interval)
+
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    @contextmanager
+    def rewriting(self):
+        """Wrap the app's own rewrites of the file, e.g. the Excel export
+
+        Edits made before the rewrite are loaded first; the rewritten file
+        itself is then taken as already seen instead of being parsed again.
+        """
+        with self._check_lock:
+            self._check()
+            try:
+                yield
+            finally:
+                self._signature = self._file_signature()
+
+    def check(self):
+        """Reload if the file changed since the last check, returns the changed descriptions"""
+        with self._check_lock:
+            return self._check()
+
+    def _check(self):
+        signature = self._file_signature()
+        if signature is None or signature == self._signature:
+            return {}
+        self._signature = signature
+
+        loaded = self._load()
+        if not loaded and self._descriptions:
+            # Most likely a half-written file - try again on the next poll
+            self._signature = None
+            return {}
+
+        with self._lock:
+            changed = {
+                report_id: desc
+                for report_id, desc in loaded.items()
+                if self._descriptions.get(report_id) != desc
+            }
+            for report_id in self._descriptions.keys() - loaded.keys():
+                changed[report_id] = None
+            if not changed:
+                return {}
+
+            self._version += 1
+            self._descriptions = loaded
+
+        logger.info(
+            "%s changed: %d descriptions updated (version %d)",
+            self.path,
+            len(changed),
+            self._version,
+        )
+
+        for listener in self._listeners:
+            listener(changed)
+        return changed
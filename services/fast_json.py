@@ -0,0 +1,36 @@
+import json
+
+try:
+    import orjson
+except ImportError:  # optional speed-up, the stdlib json module is the fallback
+    orjson = None
+
+# Which encoder loads/dumps use in this process. Dash callback responses go
+# through plotly, whose "auto" engine already picks orjson when it is installed
+ENGINE = "json" if orjson is None else "orjson"
+
+
+def loads(data):
+    """Decode JSON from str or bytes; errors are ValueErrors either way"""
+    if orjson is not None:
+        return orjson.loads(data)
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        data = bytes(data).decode()
+    return json.loads(data)
+
+
+def dumps(value, sort_keys=False):
+    """Compact JSON text, identical whichever engine produced it"""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(value, option=option).decode()
+        except TypeError:
+            # e.g. integers beyond 64 bits - let the stdlib have a go
+            pass
+    return json.dumps(
+        value, sort_keys=sort_keys, separators=(",", ":"), ensure_ascii=False
+    )
+
@@ -0,0 +1,101 @@
+import logging
+import threading
+import time
+
+from services.log import RateLimitedLog
+from services.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Seconds between polls of the database for newly written reports (an indexed
+# "seq > ?" query, cheap enough to run often)
+DEFAULT_POLL_INTERVAL = 0.25
+
+
+class DatabaseFollower:
+    """Keeps a ReportStore in step with a database another process writes
+
+    Web workers in multi-worker mode each run one: a background thread asks
+    the database for rows with a higher seq than it has applied and puts
+    their reports and descriptions into the local store, numbered with the
+    database's seqs and stamped with their stored receive times, so every
+    worker serves the same reports, cursors and ages without subscribing to MQTT or watching the workbook itself. Applied
+    reports are not marked dirty, this process never writes them back.
+    """
+
+    def __init__(self, database, report_store, poll_interval=DEFAULT_POLL_INTERVAL):
+        self.database = database
+        self.report_store = report_store
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._log = RateLimitedLog(logger)
+
+        # Stats
+        self.seq = 0
+        self.applied = 0
+        self.polls = 0
+
+    def register_metrics(self, registry=REGISTRY):
+        registry.gauge(
+            "kerbtrack_follower_seq",
+            "Last database change applied to this worker's store",
+            function=lambda: self.seq,
+        )
+        registry.counter(
+            "kerbtrack_follower_reports_total",
+            "Database rows read into this worker's store",
+            function=lambda: self.applied,
+        )
+
+    def poll(self):
+        """Apply everything written since the last poll, returns how many rows"""
+        applied = 0
+        store = self.report_store
+        while True:
+            seq, rows = self.database.history_since(self.seq)
+            if seq == self.seq:
+                break
+            now = time.time()
+            reports, seqs, received_at, descriptions = [], [], [], {}
+            for row_seq, report, description in rows:
+                held = store.get(report.id)
+                if held is None:
+                    # An old report whose description changed stays evicted
+                    age = now - (report.timestamp or now)
+                    if store.max_age_seconds and age > store.max_age_seconds:
+                        continue
+                if held is None or held.to_dict() != report.to_dict():
+                    reports.append(report)
+                    seqs.append(row_seq)
+                    received_at.append(report.timestamp or now)
+                if description != store.description(report.id):
+                    descriptions[report.id] = description
+            # Stored receive times, so ages here agree with the ingest process
+            store.upsert_many(
+                reports, received_at=received_at, mark_dirty=False, seqs=seqs
+            )
+            store.set_descriptions(descriptions, seq)
+            self.seq = seq
+            applied += len(rows)
+        self.applied += applied
+        self.polls += 1
+        if applied:
+            logger.debug("Applied %d rows up to seq %d", applied, self.seq)
+        return applied
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                self._log(logging.ERROR, "poll", "Error reading reports from the database: %s", e)
+            self._stop.wait(self.poll_interval)
@@ -0,0 +1,56 @@
+import re
+import threading
+
+# Malformed GPS strings seen so far; counted instead of printed per call
+_gps_parse_errors = [0]
+_gps_lock = threading.Lock()
+
+# "32.9283° S, 151.7817° E" -> value and hemisphere for each axis
+GPS_PATTERN = (
+    r"^\s*(?P<lat>[-+]?\d+(?:\.\d*)?)\s*°?\s*(?P<lat_dir>[NSns])\s*,"
+    r"\s*(?P<lon>[-+]?\d+(?:\.\d*)?)\s*°?\s*(?P<lon_dir>[EWew])\s*$"
+)
+GPS_REGEX = re.compile(GPS_PATTERN)
+
+
+def _count_gps_errors(count=1):
+    with _gps_lock:
+        _gps_parse_errors[0] += count
+
+
+def gps_parse_error_count():
+    """Number of malformed GPS strings seen since startup"""
+    return _gps_parse_errors[0]
+
+
+def parse_gps(gps_str):
+    """Parse "32.9283° S, 151.7817° E" into signed (lat, lon), (None, None) if malformed"""
+    match = GPS_REGEX.match(gps_str) if isinstance(gps_str, str) else None
+    if match is None:
+        _count_gps_errors()
+        return None, None
+
+    lat = float(match["lat"])
+    if match["lat_dir"].upper() == "S":
+        lat = -lat
+    lon = float(match["lon"])
+    if match["lon_dir"].upper() == "W":
+        lon = -lon
+    return lat, lon
+
+
+def parse_gps_series(gps_series):
+    """Vectorised parse_gps for a pandas Series, returns a Lat/Lon DataFrame (NaN if malformed)"""
+    import pandas as pd
+
+    parts = gps_series.astype("string").str.extract(GPS_PATTERN)
+    lat = pd.to_numeric(parts["lat"], errors="coerce").astype("float64")
+    lon = pd.to_numeric(parts["lon"], errors="coerce").astype("float64")
+    lat = lat.where(parts["lat_dir"].str.upper() != "S", -lat)
+    lon = lon.where(parts["lon_dir"].str.upper() != "W", -lon)
+
+    coords = pd.DataFrame({"Lat": lat, "Lon": lon}, index=gps_series.index)
+    malformed = int(coords.isna().any(axis=1).sum())
+    if malformed:
+        _count_gps_errors(malformed)
+    return coords
@@ -0,0 +1,218 @@
+import logging
+import queue
+import threading
+import time
+from collections import deque
+
+from services import fast_json
+from services.log import RateLimitedLog
+from services.metrics import REGISTRY
+from services.report import Report
+
+logger = logging.getLogger(__name__)
+
+# Ingest defaults: raw payloads waiting to be decoded, and how many to decode per batch
+DEFAULT_QUEUE_SIZE = 50000
+DEFAULT_BATCH_SIZE = 500
+
+# Seconds of history behind the messages/s figure
+RATE_WINDOW_SECONDS = 10
+
+# Seconds between ingest summary lines
+SUMMARY_INTERVAL_SECONDS = 60
+
+# Recent end-to-end latencies kept for percentiles (payloads that carry SentAt)
+LATENCY_SAMPLES = 10000
+
+BATCH_SECONDS = REGISTRY.histogram(
+    "kerbtrack_ingest_batch_seconds", "Time to decode and store one ingest batch"
+)
+LATENCY_SECONDS = REGISTRY.histogram(
+    "kerbtrack_ingest_latency_seconds",
+    "Publish (SentAt) to store latency of payloads that carry SentAt",
+)
+
+
+class IngestPipeline:
+    """Takes raw MQTT payloads off the network thread and upserts them in batches
+
+    on_message only enqueues the payload, so the paho loop never waits on
+    decoding or the store. A worker thread decodes and validates batches of
+    payloads and hands the valid reports to the store in one call. When the
+    bounded queue is full new payloads are dropped and counted.
+    """
+
+    def __init__(
+        self,
+        report_store,
+        max_queue=DEFAULT_QUEUE_SIZE,
+        batch_size=DEFAULT_BATCH_SIZE,
+    ):
+        self.report_store = report_store
+        self.batch_size = batch_size
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._log = RateLimitedLog(logger)
+        self._stop = threading.Event()
+        self._thread = None
+
+        # Stats
+        self.received = 0
+        self.dropped = 0
+        self.accepted = 0
+        self.decode_errors = 0
+        self.invalid = 0
+        self._rate_samples = deque()
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    @property
+    def ingest_rate(self):
+        """Reports accepted per second over the last RATE_WINDOW_SECONDS"""
+        now = time.monotonic()
+        samples = self._rate_samples
+        while samples and now - samples[0][0] > RATE_WINDOW_SECONDS:
+            samples.popleft()
+        return sum(count for _, count in samples) / RATE_WINDOW_SECONDS
+
+    def latency_percentile(self, fraction):
+        """Seconds from SentAt to reaching the store for recent reports, None without samples"""
+        latencies = sorted(self._latencies)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))]
+
+    def register_metrics(self, registry=REGISTRY):
+        """Expose the stats above; read at scrape time, so ingest pays nothing"""
+        for name, help_text in (
+            ("received", "MQTT payloads received"),
+            ("dropped", "Payloads dropped because the ingest queue was full"),
+            ("accepted", "Reports decoded and stored"),
+            ("decode_errors", "Payloads that were not valid JSON"),
+            ("invalid", "Decoded payloads that were not valid reports"),
+        ):
+            registry.counter(
+                f"kerbtrack_ingest_{name}_total",
+                help_text,
+                function=lambda name=name: getattr(self, name),
+            )
+        registry.gauge(
+            "kerbtrack_ingest_queue_depth",
+            "Payloads waiting to be decoded",
+            function=lambda: self.queue_depth,
+        )
+        registry.gauge(
+            "kerbtrack_ingest_rate",
+            f"Reports stored per second over the last {RATE_WINDOW_SECONDS} s",
+            function=lambda: self.ingest_rate,
+        )
+
+    def on_message(self, client, userdata, msg):
+        """paho callback - must stay cheap"""
+        self.submit(msg.payload)
+
+    def submit(self, payload):
+        self.received += 1
+        try:
+            self._queue.put_nowait(payload)
+        except queue.Full:
+            self.dropped += 1
+            self._log(
+                logging.WARNING,
+                "dropped",
+                "Ingest queue full (%d), dropping messages (%d dropped so far)",
+                self._queue.maxsize,
+                self.dropped,
+            )
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=10):
+        """Decode whatever is already queued, then stop"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _next_batch(self):
+        try:
+            batch = [self._queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def decode(self, payload):
+        """Decode and validate one payload into a Report, None if it is unusable"""
+        try:
+            # Bytes go straight to the decoder, no intermediate str
+            data = fast_json.loads(payload)
+        except (UnicodeDecodeError, ValueError) as e:
+            self.decode_errors += 1
+            self._log(logging.WARNING, "decode", "Undecodable MQTT payload: %s", e)
+            return None
+
+        try:
+            return Report.from_payload(data)
+        except ValueError as e:
+            self.invalid += 1
+            self._log(logging.WARNING, "invalid", "Invalid MQTT payload: %.200s", e)
+            return None
+
+    def process(self, payloads):
+        """Decode a batch of payloads and upsert the valid ones, returns how many were accepted"""
+        reports = [
+            report
+            for report in (self.decode(payload) for payload in payloads)
+            if report is not None
+        ]
+        if reports:
+            self.report_store.upsert_many(reports)
+            self.accepted += len(reports)
+            # Load-test payloads carry their publish time; timestamp is the store's receive time
+            for report in reports:
+                sent_at = report.extra.get("SentAt") if report.extra else None
+                if isinstance(sent_at, (int, float)):
+                    self._latencies.append(report.timestamp - sent_at)
+                    LATENCY_SECONDS.observe(report.timestamp - sent_at)
+            self._rate_samples.append((time.monotonic(), len(reports)))
+            logger.debug("Ingested batch of %d reports", len(reports))
+        return len(reports)
+
+    def log_summary(self):
+        logger.info(
+            "Ingest: %d received, %d stored, %d dropped, %d undecodable, %d invalid, "
+            "%.0f reports/s, queue %d",
+            self.received,
+            self.accepted,
+            self.dropped,
+            self.decode_errors,
+            self.invalid,
+            self.ingest_rate,
+            self.queue_depth,
+        )
+
+    def _run(self):
+        last_summary = time.monotonic()
+        while not (self._stop.is_set() and self._queue.empty()):
+            if time.monotonic() - last_summary >= SUMMARY_INTERVAL_SECONDS:
+                last_summary = time.monotonic()
+                if self.received:
+                    self.log_summary()
+            batch = self._next_batch()
+            if not batch:
+                continue
+            try:
+                with BATCH_SECONDS.time():
+                    self.process(batch)
+            except Exception:
+                logger.exception("Error ingesting batch of %d payloads", len(batch))
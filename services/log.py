@@ -0,0 +1,77 @@
+import logging
+import os
+import time
+
+# KERBTRACK_LOG_LEVEL=DEBUG turns on per-row diagnostics (quiet and free otherwise)
+DEFAULT_LOG_LEVEL = "INFO"
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+# At most one line per key in this many seconds
+DEFAULT_LOG_INTERVAL = 10
+
+
+def configure_logging(level=None):
+    """Root logging setup for the dashboard process"""
+    level = level or os.environ.get("KERBTRACK_LOG_LEVEL", DEFAULT_LOG_LEVEL)
+    logging.basicConfig(level=str(level).upper(), format=LOG_FORMAT)
+
+
+class RateLimitedLog:
+    """Emit at most one line per key per interval, reporting how many were suppressed
+
+    Calls at a level the logger has disabled return straight away.
+    """
+
+    def __init__(self, log, interval=DEFAULT_LOG_INTERVAL):
+        self.log = log
+        self.interval = interval
+        self._last = {}
+        self._suppressed = {}
+
+    def __call__(self, level, key, message, *args):
+        if not self.log.isEnabledFor(level):
+            return
+        now = time.monotonic()
+        if now - self._last.get(key, float("-inf")) < self.interval:
+            self._suppressed[key] = self._suppressed.get(key, 0) + 1
+            return
+        suppressed = self._suppressed.pop(key, 0)
+        self._last[key] = now
+        if suppressed:
+            message += " (%d similar suppressed)"
+            args += (suppressed,)
+        self.log.log(level, message, *args)
+
+
+class log_stage:
+    """Time a block and log one summary line for it, e.g.
+
+        with log_stage(logger, "Loaded %d descriptions from %s") as stage:
+            ...
+            stage.done(len(descriptions), path)
+
+    logs "Loaded 12304 descriptions from mqtt_data.xlsx in 84 ms". Nothing
+    is logged if the block raises or never calls done().
+    """
+
+    def __init__(self, log, message, level=logging.INFO):
+        self.log = log
+        self.message = message
+        self.level = level
+        self.args = None
+
+    def done(self, *args):
+        self.args = args
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None and self.args is not None:
+            self.log.log(
+                self.level,
+                self.message + " in %.0f ms",
+                *self.args,
+                (time.perf_counter() - self.started) * 1000,
+            )
@@ -0,0 +1,242 @@
+import math
+import os
+import threading
+import time
+from bisect import bisect_left
+
+# Set KERBTRACK_METRICS=0 to leave out the /metrics route and the callback hooks
+METRICS_ENABLED = os.environ.get("KERBTRACK_METRICS", "1") != "0"
+
+# Seconds buckets for timings, byte buckets for callback responses
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def format_value(value):
+    if isinstance(value, int):
+        return str(value)
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    return repr(float(value))
+
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Metric:
+    """A named metric, either updated in place or read from function() at scrape time"""
+
+    kind = "untyped"
+
+    def __init__(self, name, help_text, labels=(), function=None):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.function = function
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if not self.labels:
+            return ()
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def samples(self):
+        """(suffix, label values, value) tuples"""
+        if self.function is not None:
+            value = self.function()
+            if value is not None:
+                yield "", (), value
+            return
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield "", key, value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, key, value in self.samples():
+            names = self.labels + (("le",) if suffix == "_bucket" else ())
+            lines.append(
+                f"{self.name}{suffix}{format_labels(names, key)} {format_value(value)}"
+            )
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        position = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # Per-bucket counts (the last one is +Inf), sum, count
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][position] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def samples(self):
+        with self._lock:
+            values = [
+                (key, list(counts), total, count)
+                for key, (counts, total, count) in self._values.items()
+            ]
+        for key, counts, total, count in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                yield "_bucket", key + (format_value(bound),), cumulative
+            yield "_sum", key, total
+            yield "_count", key, count
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+class Registry:
+    """Metrics by name, rendered in the Prometheus text exposition format"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _add(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            # Function metrics follow the latest object registered under the name
+            if existing is not None and metric.function is None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, help_text, labels=(), function=None):
+        return self._add(Counter(name, help_text, labels, function))
+
+    def gauge(self, name, help_text, labels=(), function=None):
+        return self._add(Gauge(name, help_text, labels, function))
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help_text, labels, buckets))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        blocks = []
+        for metric in metrics:
+            try:
+                blocks.append(metric.render())
+            except Exception as e:
+                blocks.append(f"# {metric.name} unavailable: {e}")
+        return "\n".join(blocks) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def resident_memory_bytes():
+    """Current RSS from /proc, or the peak from getrusage where /proc is missing"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        import resource
+
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def register_metrics_route(app, registry=REGISTRY):
+    """Serve /metrics and time every Dash callback request on app.server"""
+    import flask
+
+    from services.geo import gps_parse_error_count
+
+    registry.gauge(
+        "kerbtrack_process_resident_memory_bytes",
+        "Resident memory of the dashboard process",
+        function=resident_memory_bytes,
+    )
+    registry.counter(
+        "kerbtrack_gps_parse_errors_total",
+        "Malformed GPS strings seen since startup",
+        function=gps_parse_error_count,
+    )
+    if not METRICS_ENABLED:
+        return
+
+    callback_seconds = registry.histogram(
+        "kerbtrack_callback_seconds", "Dash callback latency", labels=("output",)
+    )
+    callback_bytes = registry.histogram(
+        "kerbtrack_callback_response_bytes",
+        "Dash callback response size",
+        labels=("output",),
+        buckets=BYTES_BUCKETS,
+    )
+    server = app.server
+
+    @server.route("/metrics")
+    def metrics():
+        return flask.Response(registry.render(), content_type=CONTENT_TYPE)
+
+    @server.before_request
+    def start_callback_timer():
+        if flask.request.path.endswith("/_dash-update-component"):
+            flask.g.callback_started = time.perf_counter()
+
+    @server.after_request
+    def record_callback(response):
+        started = flask.g.pop("callback_started", None)
+        if started is not None:
+            body = flask.request.get_json(silent=True) or {}
+            output = body.get("output", "") if isinstance(body, dict) else ""
+            callback_seconds.observe(time.perf_counter() - started, output=output)
+            callback_bytes.observe(response.content_length or 0, output=output)
+        return response
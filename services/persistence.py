@@ -0,0 +1,545 @@
+import logging
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing
+
+from services import fast_json
+from services.log import RateLimitedLog, log_stage
+from services.metrics import REGISTRY
+from services.report import PENDING_DESCRIPTION, Report, ReportColumns, parse_id
+
+logger = logging.getLogger(__name__)
+
+# SQLite database that holds every report ever received
+DATABASE_PATH = "kerbtrack.db"
+
+# Persistence worker defaults: flush at least this often, in batches of up to this many
+DEFAULT_FLUSH_INTERVAL = 1.0
+DEFAULT_FLUSH_SIZE = 1000
+DEFAULT_QUEUE_SIZE = 20000
+
+# Seconds between handing the store's changed reports to the worker
+DEFAULT_PERSIST_INTERVAL = 1.0
+
+FLUSH_SECONDS = REGISTRY.histogram(
+    "kerbtrack_persistence_flush_seconds", "Time to write one coalesced batch"
+)
+FLUSH_SIZE = REGISTRY.histogram(
+    "kerbtrack_persistence_flush_reports",
+    "Reports in one coalesced batch",
+    buckets=(1, 10, 50, 100, 250, 500, 1000, 5000),
+)
+
+# Followers and the archive read changes in batches of up to this many rows
+DEFAULT_CHANGES_LIMIT = 10000
+
+# Bound parameters per statement, under SQLite's default limit
+SQL_VARIABLE_LIMIT = 900
+
+# seq numbers payload and description changes in write order, so other processes
+# can follow them; received_at is when the current payload arrived, updated_at
+# the row's last change
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    id TEXT PRIMARY KEY,
+    payload TEXT NOT NULL,
+    image_description TEXT,
+    updated_at REAL NOT NULL,
+    seq INTEGER NOT NULL DEFAULT 0,
+    received_at REAL
+)
+"""
+
+# Facts about the database itself, e.g. its epoch
+META_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+)
+"""
+
+# Latest payload wins, but a real description is never replaced by a pending one
+UPSERT_SQL = """
+INSERT INTO reports (id, payload, image_description, updated_at, received_at, seq)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT(id) DO UPDATE SET
+    payload = excluded.payload,
+    image_description = COALESCE(
+        excluded.image_description, reports.image_description
+    ),
+    updated_at = excluded.updated_at,
+    received_at = CASE
+        WHEN reports.payload IS NOT excluded.payload THEN excluded.received_at
+        ELSE reports.received_at
+    END,
+    seq = excluded.seq
+WHERE reports.payload IS NOT excluded.payload
+    OR (
+        excluded.image_description IS NOT NULL
+        AND reports.image_description IS NOT excluded.image_description
+    )
+"""
+
+
+def clean_description(value):
+    """Return the description text, or None if it is empty/pending"""
+    if value is None:
+        return None
+    value = str(value).strip()
+    if not value or value == "nan" or value == PENDING_DESCRIPTION:
+        return None
+    return value
+
+
+class ReportDatabase:
+    """Append/upsert-only report persistence backed by SQLite in WAL mode"""
+
+    def __init__(self, path=DATABASE_PATH):
+        self.path = path
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Several processes may open the database at once, so check and
+            # migrate under the write lock
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(SCHEMA)
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(reports)")]
+            if "seq" not in columns:
+                conn.execute("ALTER TABLE reports ADD COLUMN seq INTEGER NOT NULL DEFAULT 0")
+                conn.execute("UPDATE reports SET seq = rowid")
+            if "received_at" not in columns:
+                conn.execute("ALTER TABLE reports ADD COLUMN received_at REAL")
+                conn.execute("UPDATE reports SET received_at = updated_at")
+            conn.execute("CREATE INDEX IF NOT EXISTS reports_seq ON reports (seq)")
+            # Names this database's seq numbering, for processes that follow it
+            conn.execute(META_SCHEMA)
+            conn.execute(
+                "INSERT OR IGNORE INTO meta (key, value) VALUES ('epoch', ?)",
+                (uuid.uuid4().hex,),
+            )
+            self.epoch = conn.execute(
+                "SELECT value FROM meta WHERE key = 'epoch'"
+            ).fetchone()[0]
+            conn.commit()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def upsert_reports(self, reports):
+        """Write only the given new or changed reports, returns rows touched"""
+        return self.write(reports)[0]
+
+    def update_descriptions(self, descriptions):
+        """Store descriptions keyed by ID (None clears one), skipping rows that already match"""
+        return self.write((), descriptions)[0]
+
+    def write(self, reports=(), descriptions=None):
+        """Upsert reports, then store descriptions, in one transaction
+
+        Returns (rows touched, {ID: description} for IDs that have no row
+        yet). Descriptions can be read before their reports are stored, so
+        the caller keeps those and writes them again with the report.
+        """
+        now = time.time()
+        rows = []
+        for report in reports:
+            # Descriptions only ever come from the descriptions argument
+            rows.append(
+                (
+                    str(report.id),
+                    fast_json.dumps(report.to_dict(), sort_keys=True),
+                    None,
+                    now,
+                    report.timestamp or now,
+                )
+            )
+        described = {}
+        for report_id, desc in (descriptions or {}).items():
+            try:
+                described[parse_id(report_id)] = clean_description(desc)
+            except ValueError:
+                logger.warning("Skipping description for invalid report ID %r", report_id)
+        if not rows and not described:
+            return 0, {}
+
+        with closing(self._connect()) as conn, conn:
+            # The write lock is taken first so the seq range cannot be handed out twice
+            conn.execute("BEGIN IMMEDIATE")
+            before = conn.total_changes
+            last = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM reports").fetchone()[0]
+            if rows:
+                rows = [row + (last + n,) for n, row in enumerate(rows, 1)]
+                last += len(rows)
+                conn.executemany(UPSERT_SQL, rows)
+            unmatched = {}
+            if described:
+                # A new seq too, so followers pick up description changes
+                conn.executemany(
+                    "UPDATE reports SET image_description = ?, updated_at = ?, seq = ? "
+                    "WHERE id = ? AND image_description IS NOT ?",
+                    [
+                        (desc, now, last + n, str(key), desc)
+                        for n, (key, desc) in enumerate(described.items(), 1)
+                    ],
+                )
+                unmatched = dict(described)
+                keys = [str(key) for key in described]
+                for start in range(0, len(keys), SQL_VARIABLE_LIMIT):
+                    chunk = keys[start : start + SQL_VARIABLE_LIMIT]
+                    marks = ",".join("?" * len(chunk))
+                    for (found,) in conn.execute(
+                        f"SELECT id FROM reports WHERE id IN ({marks})", chunk
+                    ):
+                        unmatched.pop(int(found), None)
+            return conn.total_changes - before, unmatched
+
+    def history_since(self, seq, limit=DEFAULT_CHANGES_LIMIT):
+        """(last seq read, [(seq, Report, description)]) for rows changed after seq
+
+        Each report's timestamp is when its payload was received; a row whose
+        description changed comes again with the same timestamp.
+        """
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT seq, payload, image_description, received_at FROM reports "
+                "WHERE seq > ? ORDER BY seq LIMIT ?",
+                (seq, limit),
+            ).fetchall()
+        history = []
+        for seq, payload, description, received_at in rows:
+            try:
+                report = Report.from_payload(fast_json.loads(payload), received_at)
+            except ValueError as e:
+                logger.warning("Skipping unreadable stored report: %s", e)
+                continue
+            history.append((seq, report, description))
+        return seq, history
+
+    def recent_reports(self, since=0, limit=None):
+        """[(Report, description)] received at or after since, oldest first
+
+        Each report's timestamp is when its payload was received; limit
+        keeps only the newest that many.
+        """
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT payload, image_description, received_at FROM reports "
+                "WHERE received_at >= ? ORDER BY received_at DESC, seq DESC LIMIT ?",
+                (since, -1 if limit is None else limit),
+            ).fetchall()
+        recent = []
+        for payload, description, received_at in reversed(rows):
+            try:
+                report = Report.from_payload(fast_json.loads(payload), received_at)
+            except ValueError as e:
+                logger.warning("Skipping unreadable stored report: %s", e)
+                continue
+            recent.append((report, description))
+        return recent
+
+    def all_reports(self):
+        """Every stored report and its description as ReportColumns"""
+        columns = ReportColumns()
+        with closing(self._connect()) as conn:
+            for payload, description in conn.execute(
+                "SELECT payload, image_description FROM reports"
+            ):
+                try:
+                    report = Report.from_payload(fast_json.loads(payload))
+                except ValueError as e:
+                    logger.warning("Skipping unreadable stored report: %s", e)
+                    continue
+                columns.append(report, description)
+        return columns
+
+
+class PersistenceWorker:
+    """The only thread that writes reports to the database
+
+    Producers submit() reports into a bounded queue. The worker coalesces
+    everything queued within flush_interval (or up to flush_size reports)
+    into one upsert, keeping only the latest version of each ID. Excel
+    exports asked for with request_export() run on a second thread.
+    """
+
+    def __init__(
+        self,
+        database,
+        export=None,
+        flush_interval=DEFAULT_FLUSH_INTERVAL,
+        flush_size=DEFAULT_FLUSH_SIZE,
+        max_queue=DEFAULT_QUEUE_SIZE,
+    ):
+        self.database = database
+        self.export = export
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._export_requested = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._export_thread = None
+        self._pending_tasks = 0
+        self._retry = {}
+        self._descriptions = {}
+        self._descriptions_lock = threading.Lock()
+        # Descriptions whose report has no row yet, by ID
+        self._unmatched = {}
+        self._exported_rows = None
+        # A broken database fails every flush, so say so once per interval
+        self._log = RateLimitedLog(logger)
+
+        # Stats
+        self.flushes = 0
+        self.rows_written = 0
+        self.rejected = 0
+        self.last_flush_seconds = 0.0
+        self.last_flush_size = 0
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def register_metrics(self, registry=REGISTRY):
+        """Expose the stats above, read at scrape time"""
+        for name, help_text in (
+            ("flushes", "Batches written"),
+            ("rows_written", "Database rows inserted or changed"),
+            ("rejected", "Reports turned away because the queue was full"),
+        ):
+            registry.counter(
+                f"kerbtrack_persistence_{name}_total",
+                help_text,
+                function=lambda name=name: getattr(self, name),
+            )
+        registry.gauge(
+            "kerbtrack_persistence_queue_depth",
+            "Reports waiting to be written",
+            function=lambda: self.queue_depth,
+        )
+        registry.gauge(
+            "kerbtrack_persistence_unmatched_descriptions",
+            "Descriptions waiting for their report to be written",
+            function=lambda: len(self._unmatched),
+        )
+
+    def submit(self, reports):
+        """Queue reports for writing, returns the ones that did not fit
+
+        The queue is bounded, so a caller that gets reports back should hold
+        on to them and resubmit later rather than pile up more work.
+        """
+        for position, report in enumerate(reports):
+            try:
+                self._queue.put_nowait(report)
+            except queue.Full:
+                leftover = reports[position:]
+                self.rejected += len(leftover)
+                return leftover
+        return []
+
+    def submit_descriptions(self, descriptions):
+        """Queue description changes ({ID: description or None}) for the next flush
+
+        A description whose report is not in the database yet is kept and
+        written along with the report once it is flushed.
+        """
+        parsed = {}
+        for report_id, desc in descriptions.items():
+            try:
+                parsed[parse_id(report_id)] = desc
+            except ValueError:
+                logger.warning("Skipping description for invalid report ID %r", report_id)
+        with self._descriptions_lock:
+            self._descriptions.update(parsed)
+
+    def request_export(self):
+        """Regenerate the Excel export in the background, if anything was written since the last one"""
+        self._export_requested.set()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        if self._export_thread is None and self.export is not None:
+            self._export_thread = threading.Thread(target=self._run_exports, daemon=True)
+            self._export_thread.start()
+
+    def stop(self, timeout=30):
+        """Flush whatever is queued and stop the worker"""
+        self._stop.set()
+        # Wakes the export thread; an export under way is left to finish
+        self._export_requested.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            # Still busy (e.g. a slow disk): it stays the only writer, and
+            # flush() keeps waiting on it rather than writing from this thread
+            if not self._thread.is_alive():
+                self._thread = None
+
+    def flush(self, timeout=30):
+        """Block until everything submitted so far has been written"""
+        if self._thread is None:
+            self._write(self._drain(block=False))
+            while not self._queue.empty():
+                self._write(self._drain(block=False))
+            return
+        deadline = time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._queue.all_tasks_done.wait(remaining)
+
+    def _drain(self, block=True):
+        """Collect reports for up to flush_interval or flush_size, latest version per ID"""
+        batch = {}
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.flush_size:
+            timeout = deadline - time.monotonic()
+            try:
+                if block and timeout > 0:
+                    report = self._queue.get(timeout=timeout)
+                else:
+                    report = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch[report.id] = report
+            self._pending_tasks += 1
+        return batch
+
+    def _write(self, batch):
+        # A batch that failed last time goes out again, overridden by anything newer
+        if self._retry:
+            batch = {**self._retry, **batch}
+            self._retry = {}
+        with self._descriptions_lock:
+            descriptions, self._descriptions = self._descriptions, {}
+        # Descriptions that arrived before their report are written with it
+        for report_id in batch:
+            if report_id in self._unmatched:
+                descriptions.setdefault(report_id, self._unmatched.pop(report_id))
+
+        if batch or descriptions:
+            started = time.perf_counter()
+            try:
+                written, unmatched = self.database.write(list(batch.values()), descriptions)
+                self.rows_written += written
+                self._unmatched.update(unmatched)
+            except Exception as e:
+                self._log(
+                    logging.ERROR,
+                    "write",
+                    "Error writing %d reports and %d descriptions, will retry: %s",
+                    len(batch),
+                    len(descriptions),
+                    e,
+                )
+                self._retry = batch
+                with self._descriptions_lock:
+                    self._descriptions = {**descriptions, **self._descriptions}
+            if batch:
+                self.last_flush_seconds = time.perf_counter() - started
+                self.last_flush_size = len(batch)
+                self.flushes += 1
+                FLUSH_SECONDS.observe(self.last_flush_seconds)
+                FLUSH_SIZE.observe(self.last_flush_size)
+                logger.debug(
+                    "Flushed %d reports in %.1f ms",
+                    self.last_flush_size,
+                    self.last_flush_seconds * 1000,
+                )
+
+        for _ in range(self._pending_tasks):
+            self._queue.task_done()
+        self._pending_tasks = 0
+
+    def _run(self):
+        while True:
+            stopping = self._stop.is_set()
+            self._write(self._drain(block=not stopping))
+            if stopping and self._queue.empty():
+                break
+
+    def _run_exports(self):
+        # A full export takes seconds to minutes, so it has its own thread
+        # and flushes keep going meanwhile; it only reads the database
+        while True:
+            self._export_requested.wait()
+            if self._stop.is_set():
+                break
+            self._export_requested.clear()
+            rows_written = self.rows_written
+            if rows_written == self._exported_rows:
+                continue
+            self._exported_rows = rows_written
+            try:
+                with log_stage(logger, "Exported after %d rows written") as stage:
+                    self.export()
+                    stage.done(rows_written)
+            except Exception as e:
+                logger.error("Error exporting to Excel: %s", e)
+
+
+class PersistenceScheduler:
+    """Background thread that keeps the store and the database in step
+
+    Every interval it applies the store's age limit and hands the reports
+    changed since the last tick to the persistence worker, and every
+    export_interval (if set) it asks for a fresh Excel export. Without a worker (a
+    web worker, which never writes) it only applies the age limit.
+    """
+
+    def __init__(
+        self,
+        report_store,
+        persistence_worker=None,
+        export_interval=None,
+        interval=DEFAULT_PERSIST_INTERVAL,
+    ):
+        self.report_store = report_store
+        self.persistence_worker = persistence_worker
+        self.export_interval = export_interval
+        self.interval = interval
+        self._last_export = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def tick(self, now=None):
+        now = time.time() if now is None else now
+        self.report_store.evict_expired(now)
+        if self.persistence_worker is None:
+            return
+
+        # The dirty set is maintained on ingest, so this check is O(1)
+        if self.report_store.dirty_count:
+            leftover = self.persistence_worker.submit(self.report_store.take_dirty())
+            if leftover:
+                # Worker queue is full - keep them dirty (and coalescing) until the next tick
+                self.report_store.restore_dirty(leftover)
+
+        # The worker skips the export if nothing was written since the last one
+        if self.export_interval and now - self._last_export > self.export_interval:
+            self._last_export = now
+            self.persistence_worker.request_export()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        """Tick until stop(), on the calling thread"""
+        while not self._stop.wait(self.interval):
+            try:
+                self.tick()
+            except Exception as e:
+                logger.error("Error persisting store changes: %s", e)
@@ -0,0 +1,289 @@
+import math
+import sys
+from array import array
+from dataclasses import dataclass
+from itertools import repeat
+
+from services.geo import parse_gps, parse_gps_series
+
+PENDING_DESCRIPTION = "Pending..."
+
+# Payload/Excel column -> Report attribute
+COLUMN_FIELDS = {
+    "ID": "id",
+    "GPS": "gps",
+    "Address": "address",
+    "Message": "message",
+    "ImageURL": "image_url",
+    "Lat": "lat",
+    "Lon": "lon",
+}
+
+
+def parse_id(value):
+    """Report IDs are integers; accepts 7, "7", " 7 " and 7.0, raises ValueError otherwise"""
+    if value is None or isinstance(value, bool):
+        raise ValueError(f"Invalid report ID {value!r}")
+    if isinstance(value, int):
+        return value
+    try:
+        number = value if isinstance(value, float) else float(str(value).strip())
+    except ValueError:
+        raise ValueError(f"Invalid report ID {value!r}") from None
+    if not number.is_integer():
+        raise ValueError(f"Invalid report ID {value!r}")
+    return int(number)
+
+
+def split_address(address):
+    """Split "Hunter St, Newcastle West" into ("Hunter St", "Newcastle West")"""
+    if not address:
+        return "", ""
+    street, _, suburb = str(address).partition(",")
+    return street.strip(), suburb.strip()
+
+
+def clean_text(value):
+    """Payload/Excel cell as a stripped string, "" for missing or NaN"""
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return ""
+    return str(value).strip()
+
+
+def clean_coordinate(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(value) else value
+
+
+@dataclass(slots=True)
+class Report:
+    """One validated detection; street, suburb and message strings are interned"""
+
+    id: int
+    gps: str = ""
+    address: str = ""
+    message: str = ""
+    image_url: str = ""
+    lat: float | None = None
+    lon: float | None = None
+    street: str = ""
+    suburb: str = ""
+    timestamp: float = 0.0
+    extra: dict | None = None
+
+    @classmethod
+    def from_payload(cls, payload, timestamp=0.0):
+        """Validate a decoded MQTT/Excel/database payload, raises ValueError if unusable"""
+        if not isinstance(payload, dict):
+            raise ValueError(f"Report payload is not an object: {payload!r}")
+
+        report_id = parse_id(payload.get("ID"))
+        gps = clean_text(payload.get("GPS"))
+        lat = clean_coordinate(payload.get("Lat"))
+        lon = clean_coordinate(payload.get("Lon"))
+        if lat is None or lon is None:
+            lat, lon = parse_gps(gps)
+
+        extra = {
+            key: value
+            for key, value in payload.items()
+            if key not in COLUMN_FIELDS and key != "Image_Description"
+        }
+        return cls.build(
+            report_id,
+            gps,
+            clean_text(payload.get("Address")),
+            clean_text(payload.get("Message")),
+            clean_text(payload.get("ImageURL")),
+            lat,
+            lon,
+            timestamp,
+            extra or None,
+        )
+
+    @classmethod
+    def build(
+        cls, report_id, gps, address, message, image_url, lat, lon, timestamp, extra=None
+    ):
+        street, suburb = split_address(address)
+        return cls(
+            id=report_id,
+            gps=gps,
+            address=sys.intern(address),
+            message=sys.intern(message),
+            image_url=image_url,
+            lat=lat,
+            lon=lon,
+            street=sys.intern(street),
+            suburb=sys.intern(suburb),
+            timestamp=timestamp,
+            extra=extra,
+        )
+
+    def get(self, column, default=None):
+        """Dict-style access by payload column name, e.g. report.get("Address")"""
+        field = COLUMN_FIELDS.get(column)
+        if field is not None:
+            return getattr(self, field)
+        if self.extra:
+            return self.extra.get(column, default)
+        return default
+
+    def to_dict(self):
+        """Payload-shaped dict, as sent to browsers and stored in the database"""
+        payload = {column: getattr(self, field) for column, field in COLUMN_FIELDS.items()}
+        if self.extra:
+            payload.update(self.extra)
+        return payload
+
+
+class ReportColumns:
+    """Array-backed columns of many reports, for bulk exports and backfills
+
+    Goes straight between DataFrames and Report records without building a
+    dict per row. Extra payload fields (Confidence, a sender Timestamp, ...)
+    get a column each, None where a report has no such field.
+    """
+
+    def __init__(self):
+        self.ids = array("q")
+        self.gps = []
+        self.addresses = []
+        self.messages = []
+        self.image_urls = []
+        self.lats = array("d")
+        self.lons = array("d")
+        self.descriptions = []
+        # Extra payload field -> one value per row
+        self.extra = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def append(self, report, description=None):
+        self.ids.append(report.id)
+        self.gps.append(report.gps)
+        self.addresses.append(report.address)
+        self.messages.append(report.message)
+        self.image_urls.append(report.image_url)
+        self.lats.append(math.nan if report.lat is None else report.lat)
+        self.lons.append(math.nan if report.lon is None else report.lon)
+        self.descriptions.append(description)
+
+        row = len(self.ids)
+        if report.extra:
+            for key, value in report.extra.items():
+                values = self.extra.get(key)
+                if values is None:
+                    values = self.extra[key] = [None] * (row - 1)
+                values.append(value)
+        for values in self.extra.values():
+            if len(values) < row:
+                values.append(None)
+
+    @classmethod
+    def from_reports(cls, reports, descriptions=None):
+        columns = cls()
+        descriptions = descriptions or {}
+        for report in reports:
+            columns.append(report, descriptions.get(report.id))
+        return columns
+
+    @classmethod
+    def from_frame(cls, df):
+        """Columns from an Excel-shaped DataFrame; rows without a usable integer ID are dropped"""
+        import pandas as pd
+
+        ids = pd.to_numeric(df["ID"], errors="coerce")
+        df = df[ids.notna() & (ids % 1 == 0)]
+        ids = ids[df.index].astype("int64")
+
+        def text(column):
+            if column not in df.columns:
+                return [""] * len(df)
+            return df[column].fillna("").astype(str).str.strip().tolist()
+
+        # Exported sheets already carry Lat/Lon; only rows without them parse GPS
+        coords = pd.DataFrame({"Lat": math.nan, "Lon": math.nan}, index=df.index)
+        if "Lat" in df.columns and "Lon" in df.columns:
+            coords = df[["Lat", "Lon"]].apply(pd.to_numeric, errors="coerce")
+        missing = coords.isna().any(axis=1)
+        if "GPS" in df.columns and missing.any():
+            coords[missing] = parse_gps_series(df.loc[missing, "GPS"])
+
+        columns = cls()
+        columns.ids = array("q", ids.tolist())
+        columns.gps = text("GPS")
+        columns.addresses = text("Address")
+        columns.messages = text("Message")
+        columns.image_urls = text("ImageURL")
+        columns.lats = array("d", coords["Lat"].astype("float64").tolist())
+        columns.lons = array("d", coords["Lon"].astype("float64").tolist())
+        if "Image_Description" in df.columns:
+            columns.descriptions = [
+                None if desc in ("", "nan", PENDING_DESCRIPTION) else desc
+                for desc in text("Image_Description")
+            ]
+        else:
+            columns.descriptions = [None] * len(df)
+        for column in df.columns:
+            if column not in COLUMN_FIELDS and column != "Image_Description":
+                values = df[column].astype(object)
+                columns.extra[column] = values.where(values.notna(), None).tolist()
+        return columns
+
+    def reports(self, timestamp=0.0):
+        """Report records for every row"""
+        keys = list(self.extra)
+        extras = zip(*self.extra.values()) if keys else repeat(())
+        for report_id, gps, address, message, image_url, lat, lon, values in zip(
+            self.ids,
+            self.gps,
+            self.addresses,
+            self.messages,
+            self.image_urls,
+            self.lats,
+            self.lons,
+            extras,
+        ):
+            extra = {key: value for key, value in zip(keys, values) if value is not None}
+            yield Report.build(
+                report_id,
+                gps,
+                address,
+                message,
+                image_url,
+                None if math.isnan(lat) else lat,
+                None if math.isnan(lon) else lon,
+                timestamp,
+                extra or None,
+            )
+
+    def description_map(self):
+        return {
+            report_id: desc
+            for report_id, desc in zip(self.ids, self.descriptions)
+            if desc
+        }
+
+    def to_frame(self):
+        """Excel-shaped DataFrame"""
+        import pandas as pd
+
+        data = {
+            "ID": self.ids,
+            "GPS": self.gps,
+            "Address": self.addresses,
+            "Message": self.messages,
+            "ImageURL": self.image_urls,
+            "Lat": self.lats,
+            "Lon": self.lons,
+        }
+        data.update(self.extra)
+        data["Image_Description"] = [
+            desc or PENDING_DESCRIPTION for desc in self.descriptions
+        ]
+        return pd.DataFrame(data)
@@ -0,0 +1,523 @@
+import heapq
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from itertools import islice
+
+from services import fast_json
+from services.clustering import ClusterIndex
+from services.log import RateLimitedLog
+from services.metrics import REGISTRY
+from services.report import Report, parse_id, split_address
+from services.search_index import SearchIndex
+from services.spatial_index import GridIndex
+
+logger = logging.getLogger(__name__)
+
+# Retention defaults - oldest reports are evicted to disk past these limits
+DEFAULT_MAX_REPORTS = 50000
+DEFAULT_MAX_AGE_SECONDS = 7 * 24 * 60 * 60
+
+# Evicted reports are appended here as JSON lines
+EVICTION_FILE_PATH = "mqtt_evicted.jsonl"
+
+# Report fields covered by the full-text search index
+SEARCH_FIELDS = ["ID", "Address", "Message"]
+
+# How many removals clients can catch up on before they need a full reset
+REMOVAL_LOG_SIZE = 10000
+
+
+def report_id_or_none(report_id):
+    """Integer report ID, None if it cannot be one"""
+    try:
+        return parse_id(report_id)
+    except ValueError:
+        return None
+
+
+def sort_key(value, ignore_case=True):
+    """Order numbers numerically and everything else as text, by default case-insensitively"""
+    try:
+        return (0, float(value), "")
+    except (TypeError, ValueError):
+        text = "" if value is None else str(value)
+        return (1, 0, text.lower() if ignore_case else text)
+
+
+def matches(value, operator, operand, ignore_case=True):
+    """Evaluate one filter term such as ("Hunter St", "contains", "hunter")"""
+    if operator == "contains":
+        text = "" if value is None else str(value)
+        if ignore_case:
+            return str(operand).lower() in text.lower()
+        return str(operand) in text
+    if operator == "datestartswith":
+        return str(value).startswith(str(operand))
+
+    left, right = sort_key(value, ignore_case), sort_key(operand, ignore_case)
+    if operator == "=":
+        return left == right
+    if operator == "!=":
+        return left != right
+    if operator == "<":
+        return left < right
+    if operator == "<=":
+        return left <= right
+    if operator == ">":
+        return left > right
+    if operator == ">=":
+        return left >= right
+    raise ValueError(f"Unsupported filter operator '{operator}'")
+
+
+class ReportStore:
+    """Latest-wins report store keyed by ID with retention and secondary indexes
+
+    Every change gets a sequence number, and (epoch, seq) is the cursor
+    browsers keep. A store that follows a database another process writes
+    takes that database's epoch and is numbered with its seqs (see
+    DatabaseFollower), so every web worker hands out the same cursors.
+    """
+
+    def __init__(
+        self,
+        max_reports=DEFAULT_MAX_REPORTS,
+        max_age_seconds=DEFAULT_MAX_AGE_SECONDS,
+        eviction_path=EVICTION_FILE_PATH,
+        epoch=None,
+    ):
+        self.max_reports = max_reports
+        self.max_age_seconds = max_age_seconds
+        self.eviction_path = eviction_path
+
+        self._lock = threading.RLock()
+        # Notified on every change, for callers waiting to push updates
+        self._changed = threading.Condition(self._lock)
+        self._changes = 0
+        # ID -> Report, ordered oldest update first (this doubles as the time index)
+        self._reports = OrderedDict()
+        # Every change gets the next sequence number; epoch changes per process
+        # unless the seqs come from a database
+        self.epoch = epoch or uuid.uuid4().hex
+        self._follows = epoch is not None
+        self._seq = 0
+        self._seqs = {}
+        # ID -> seq its description last changed at, oldest change first
+        self._described = OrderedDict()
+        self._removed = deque(maxlen=REMOVAL_LOG_SIZE)
+        self._removed_floor = 0
+        # ID -> latest report not yet handed to persistence
+        self._dirty = {}
+        # Lower-cased suburb/street -> set of IDs
+        self._by_suburb = {}
+        self._by_street = {}
+        # Full-text index over address, message and image description
+        self.search_index = SearchIndex()
+        self._descriptions = {}
+        # Report coordinates, parsed once on upsert, plus per-zoom clusters of them
+        self.spatial_index = GridIndex()
+        self.cluster_index = ClusterIndex()
+        self._log = RateLimitedLog(logger)
+
+    def __len__(self):
+        return len(self._reports)
+
+    @property
+    def seq(self):
+        """Cursor position, moved on by upserts, descriptions and (unless following) evictions"""
+        return self._seq
+
+    @property
+    def version(self):
+        """Moves on every change to reports or descriptions, see wait_for_change"""
+        return self._changes
+
+    def wait_for_change(self, version, timeout=None):
+        """Block until version differs from the one given (or timeout), returns the current one"""
+        with self._changed:
+            self._changed.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+    @property
+    def dirty_count(self):
+        return len(self._dirty)
+
+    def register_metrics(self, registry=REGISTRY):
+        """Store size and index gauges, read at scrape time"""
+        registry.gauge(
+            "kerbtrack_store_reports",
+            "Reports held in memory",
+            function=lambda: len(self._reports),
+        )
+        registry.gauge(
+            "kerbtrack_store_dirty_reports",
+            "Reports changed but not yet handed to persistence",
+            function=lambda: len(self._dirty),
+        )
+        registry.gauge(
+            "kerbtrack_store_seq", "Store version number", function=lambda: self._seq
+        )
+        registry.gauge(
+            "kerbtrack_store_search_terms",
+            "Distinct terms in the full-text index",
+            function=lambda: self.search_index.term_count,
+        )
+
+    def upsert(self, report, received_at=None):
+        """Insert or replace a report, returns False if it has no usable ID"""
+        return self.upsert_many([report], received_at) == 1
+
+    def upsert_many(self, reports, received_at=None, mark_dirty=True, seqs=None):
+        """Insert or replace a batch of Reports (or raw payloads) under one lock, returns how many were stored
+
+        mark_dirty=False is for reports that are already persisted, e.g. ones
+        read back from the database another process writes; seqs then gives
+        each one's database seq instead of numbering them here. received_at
+        is one receive time for the batch (now by default) or, for reports
+        that were received earlier, a list with one per report, oldest first.
+        """
+        per_report = isinstance(received_at, (list, tuple))
+        prepared = []
+        for position, report in enumerate(reports):
+            if not isinstance(report, Report):
+                # Coordinates are parsed once here and travel with the record from then on
+                try:
+                    report = Report.from_payload(report)
+                except ValueError as e:
+                    self._log(logging.WARNING, "invalid", "Ignoring invalid report: %s", e)
+                    continue
+            prepared.append(
+                (
+                    report,
+                    None if seqs is None else seqs[position],
+                    received_at[position] if per_report else None,
+                )
+            )
+
+        with self._lock:
+            # Stamped under the lock so receive times follow insertion order
+            now = time.time() if received_at is None or per_report else received_at
+
+            for report, seq, stamp in prepared:
+                key = report.id
+                previous = self._reports.pop(key, None)
+                if previous is not None:
+                    self._unindex(key, previous)
+
+                self._seq = self._seq + 1 if seq is None else max(self._seq, seq)
+                self._changes += 1
+                report.timestamp = now if stamp is None else stamp
+                self._reports[key] = report
+                self._seqs[key] = self._seq
+                if mark_dirty:
+                    self._dirty[key] = report
+                self._index(key, report)
+
+            self._evict(now)
+            self._changed.notify_all()
+        return len(prepared)
+
+    def get(self, report_id):
+        with self._lock:
+            return self._reports.get(report_id_or_none(report_id))
+
+    def snapshot(self):
+        """All retained reports, oldest update first"""
+        with self._lock:
+            return list(self._reports.values())
+
+    def description(self, report_id):
+        return self._descriptions.get(report_id_or_none(report_id))
+
+    def set_descriptions(self, descriptions, seq=None):
+        """Record image descriptions by ID (None clears one), reindexing only changes
+
+        The changes share one seq, the next one here or the database seq
+        they were read up to (seq).
+        """
+        changed = 0
+        with self._lock:
+            seq = self._seq + 1 if seq is None else max(self._seq, seq)
+            for report_id, desc in descriptions.items():
+                key = report_id_or_none(report_id)
+                if key is None or self._descriptions.get(key) == desc:
+                    continue
+                if desc is None:
+                    self._descriptions.pop(key, None)
+                else:
+                    self._descriptions[key] = desc
+                if key in self._reports:
+                    self.search_index.update(key, "description", desc)
+                self._described[key] = seq
+                self._described.move_to_end(key)
+                changed += 1
+            if changed:
+                self._seq = seq
+                self._changes += changed
+                self._changed.notify_all()
+        return changed
+
+    def in_bounds(self, south, west, north, east, limit=None):
+        """(report, (lat, lon)) pairs inside the box, newest first"""
+        with self._lock:
+            ids = self.spatial_index.query(south, west, north, east)
+            ids.sort(key=self._seqs.get, reverse=True)
+            if limit is not None:
+                ids = ids[:limit]
+            return [
+                (self._reports[key], self.spatial_index.position(key)) for key in ids
+            ]
+
+    def clusters(self, zoom, south, west, north, east):
+        """(lat, lon, count) clusters inside the box at a zoom level"""
+        with self._lock:
+            return self.cluster_index.clusters(zoom, south, west, north, east)
+
+    def by_suburb(self, suburb):
+        with self._lock:
+            ids = self._by_suburb.get(suburb.strip().lower(), ())
+            return [self._reports[key] for key in ids]
+
+    def by_street(self, street):
+        with self._lock:
+            ids = self._by_street.get(street.strip().lower(), ())
+            return [self._reports[key] for key in ids]
+
+    def take_dirty(self):
+        """Reports changed since the last call, clearing the dirty set"""
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+        return list(dirty.values())
+
+    def restore_dirty(self, reports):
+        """Put back reports whose write failed, unless a newer version is already dirty"""
+        with self._lock:
+            for report in reports:
+                self._dirty.setdefault(report.id, report)
+
+    def query(
+        self,
+        search=None,
+        filters=(),
+        sort_column=None,
+        descending=False,
+        offset=0,
+        limit=10,
+        value_of=None,
+    ):
+        """One page of reports matching the search text and every filter
+
+        Filters are (column, operator, value, ignore_case) tuples, see
+        parse_filter_query in layouts.home. Returns (total matches,
+        page). Without a sort column the newest reports come first.
+        value_of(report, column) lets callers filter and sort on derived
+        columns.
+        """
+        if value_of is None:
+            value_of = lambda report, column: report.get(column)
+
+        with self._lock:
+            candidates = self._candidates(filters)
+            if search and search.strip():
+                ids = self.search_index.search(search) or set()
+                if candidates is not None:
+                    ids &= {report.id for report in candidates}
+                candidates = [
+                    self._reports[key]
+                    for key in sorted(ids, key=self._seqs.get, reverse=True)
+                ]
+            elif candidates is None:
+                candidates = (self._reports[key] for key in reversed(self._reports))
+                if not filters and sort_column is None:
+                    page = list(islice(candidates, offset, offset + limit))
+                    return len(self._reports), page
+
+            matching = [
+                report
+                for report in candidates
+                if all(
+                    matches(value_of(report, column), operator, operand, ignore_case)
+                    for column, operator, operand, ignore_case in filters
+                )
+            ]
+
+        if sort_column is None:
+            return len(matching), matching[offset : offset + limit]
+
+        select = heapq.nlargest if descending else heapq.nsmallest
+        top = select(
+            offset + limit,
+            matching,
+            key=lambda report: sort_key(value_of(report, sort_column)),
+        )
+        return len(matching), top[offset:]
+
+    def _candidates(self, filters):
+        """Narrow a query through the ID/address indexes, None means scan all
+
+        The address indexes are lower-cased, so they narrow case-sensitive
+        filters too; query still checks every filter on what they return.
+        """
+        for column, operator, operand, _ in filters:
+            if operator != "=":
+                continue
+            if column == "ID":
+                report = self._reports.get(report_id_or_none(operand))
+                return [report] if report is not None else []
+            if column == "Address":
+                street, suburb = split_address(operand)
+                ids = self._by_street.get(street.lower(), set())
+                if suburb:
+                    ids = ids & self._by_suburb.get(suburb.lower(), set())
+                return [
+                    self._reports[key]
+                    for key in sorted(ids, key=self._seqs.get, reverse=True)
+                ]
+        return None
+
+    def needs_reset(self, epoch, seq):
+        """Whether delta_since(epoch, seq) would be a reset
+
+        A client already at this store's cursor is up to date, even at seq 0
+        (an empty store).
+        """
+        if epoch == self.epoch and seq == self._seq:
+            return False
+        return epoch != self.epoch or not seq or seq < self._removed_floor
+
+    def delta_since(self, epoch, seq):
+        """What a client at (epoch, seq) has not seen, None if it is up to date
+
+        Browsers query the table and map from the server, so a delta is just
+        the new cursor and the IDs whose report or description changed, or
+        that were removed, since seq. Clients from another epoch, new clients
+        and clients that fell behind the removal log get a reset instead:
+        refresh everything. A client ahead of this store (another worker's
+        follower got further) has nothing new yet.
+        """
+        with self._lock:
+            if epoch == self.epoch and seq >= self._seq:
+                return None
+
+            reset = self.needs_reset(epoch, seq)
+            ids = []
+            removed = []
+            if not reset:
+                for key in reversed(self._reports):
+                    if self._seqs[key] <= seq:
+                        break
+                    ids.append(key)
+                ids.reverse()
+                for key in reversed(self._described):
+                    if self._described[key] <= seq:
+                        break
+                    ids.append(key)
+                ids = list(dict.fromkeys(ids))
+                for removed_seq, key in reversed(self._removed):
+                    if removed_seq <= seq:
+                        break
+                    removed.append(key)
+
+            return {
+                "epoch": self.epoch,
+                "seq": self._seq,
+                "reset": reset,
+                "ids": ids,
+                "removed": removed,
+            }
+
+    def evict_expired(self, now=None):
+        """Apply the age limit without waiting for the next upsert"""
+        with self._lock:
+            evicted = self._evict(time.time() if now is None else now)
+            if evicted:
+                self._changed.notify_all()
+            return evicted
+
+    def _index(self, key, report):
+        if report.street:
+            self._by_street.setdefault(report.street.lower(), set()).add(key)
+        if report.suburb:
+            self._by_suburb.setdefault(report.suburb.lower(), set()).add(key)
+
+        self._unplace(key)
+        lat, lon = report.lat, report.lon
+        if lat is not None and lon is not None:
+            self.spatial_index.insert(key, lat, lon)
+            self.cluster_index.add(lat, lon)
+
+        for field in SEARCH_FIELDS:
+            self.search_index.update(key, field, report.get(field))
+        if key in self._descriptions:
+            self.search_index.update(key, "description", self._descriptions[key])
+
+    def _unindex(self, key, report):
+        for index, value in (
+            (self._by_street, report.street),
+            (self._by_suburb, report.suburb),
+        ):
+            ids = index.get(value.lower())
+            if ids is not None:
+                ids.discard(key)
+                if not ids:
+                    del index[value.lower()]
+
+    def _unplace(self, key):
+        """Take a report off the spatial and cluster indexes"""
+        position = self.spatial_index.position(key)
+        if position is not None:
+            self.spatial_index.remove(key)
+            self.cluster_index.remove(*position)
+
+    def _evict(self, now):
+        """Drop reports past the count or age limit, oldest first"""
+        evicted = []
+        while self._reports:
+            oldest_key = next(iter(self._reports))
+            too_many = self.max_reports and len(self._reports) > self.max_reports
+            too_old = (
+                self.max_age_seconds
+                and now - self._reports[oldest_key].timestamp > self.max_age_seconds
+            )
+            if not (too_many or too_old):
+                break
+            report = self._reports.pop(oldest_key)
+            del self._seqs[oldest_key]
+            self._descriptions.pop(oldest_key, None)
+            self._described.pop(oldest_key, None)
+            self._unindex(oldest_key, report)
+            self.search_index.remove(oldest_key)
+            self._unplace(oldest_key)
+            evicted.append(report)
+
+            # A follower's seqs belong to the database, where nothing is removed;
+            # its browsers see the removal with the next database change
+            if not self._follows:
+                self._seq += 1
+            self._changes += 1
+            if len(self._removed) == self._removed.maxlen:
+                self._removed_floor = self._removed[0][0]
+            self._removed.append((self._seq, oldest_key))
+
+        if evicted:
+            logger.debug("Evicted %d reports, %d retained", len(evicted), len(self._reports))
+            self._write_evicted(evicted)
+        return len(evicted)
+
+    def _write_evicted(self, evicted):
+        if not self.eviction_path:
+            return
+        try:
+            with open(self.eviction_path, "a", encoding="utf-8") as f:
+                for report in evicted:
+                    f.write(
+                        fast_json.dumps(
+                            {"received_at": report.timestamp, "report": report.to_dict()}
+                        )
+                        + "\n"
+                    )
+        except Exception as e:
+            self._log(logging.ERROR, "evict", "Error writing evicted reports: %s", e)
@@ -0,0 +1,90 @@
+import re
+from bisect import bisect_left, insort
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    """Lower-cased alphanumeric tokens, so "Hunter St, Newcastle" -> hunter, st, newcastle"""
+    if text is None:
+        return []
+    return TOKEN_PATTERN.findall(str(text).lower())
+
+
+class SearchIndex:
+    """Incrementally maintained inverted index with prefix and multi-term search"""
+
+    def __init__(self):
+        # token -> set of document IDs
+        self._postings = {}
+        # Sorted vocabulary, so every token sharing a prefix sits in one slice
+        self._vocabulary = []
+        # document ID -> field -> set of tokens
+        self._documents = {}
+
+    def __len__(self):
+        return len(self._documents)
+
+    @property
+    def term_count(self):
+        """Distinct tokens across all documents"""
+        return len(self._vocabulary)
+
+    def update(self, doc_id, field, text):
+        """(Re)index one field of a document"""
+        fields = self._documents.setdefault(doc_id, {})
+        old_tokens = self._tokens_of(fields)
+        fields[field] = set(tokenize(text))
+        self._apply(doc_id, old_tokens, self._tokens_of(fields))
+
+    def remove(self, doc_id):
+        fields = self._documents.pop(doc_id, None)
+        if fields:
+            self._apply(doc_id, self._tokens_of(fields), set())
+
+    def search(self, query):
+        """IDs matching every term of the query as a token prefix, None if the query is blank"""
+        terms = sorted(set(tokenize(query)), key=len, reverse=True)
+        if not terms:
+            return None
+
+        result = None
+        # Longest terms first - they are the most selective
+        for term in terms:
+            ids = self._prefix_ids(term)
+            result = ids if result is None else result & ids
+            if not result:
+                return set()
+        return result
+
+    def _prefix_ids(self, prefix):
+        ids = set()
+        position = bisect_left(self._vocabulary, prefix)
+        while position < len(self._vocabulary):
+            token = self._vocabulary[position]
+            if not token.startswith(prefix):
+                break
+            ids |= self._postings[token]
+            position += 1
+        return ids
+
+    @staticmethod
+    def _tokens_of(fields):
+        tokens = set()
+        for field_tokens in fields.values():
+            tokens |= field_tokens
+        return tokens
+
+    def _apply(self, doc_id, old_tokens, new_tokens):
+        for token in old_tokens - new_tokens:
+            ids = self._postings[token]
+            ids.discard(doc_id)
+            if not ids:
+                del self._postings[token]
+                del self._vocabulary[bisect_left(self._vocabulary, token)]
+        for token in new_tokens - old_tokens:
+            ids = self._postings.get(token)
+            if ids is None:
+                ids = self._postings[token] = set()
+                insort(self._vocabulary, token)
+            ids.add(doc_id)
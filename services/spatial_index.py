@@ -0,0 +1,67 @@
+import math
+
+# Roughly 1.1 km of latitude per cell - a few suburb blocks around Newcastle
+DEFAULT_CELL_SIZE = 0.01
+
+
+class GridIndex:
+    """Uniform lat/lon grid mapping cells to the IDs of the points inside them"""
+
+    def __init__(self, cell_size=DEFAULT_CELL_SIZE):
+        self.cell_size = cell_size
+        self._cells = {}
+        self._points = {}
+
+    def __len__(self):
+        return len(self._points)
+
+    def _cell(self, lat, lon):
+        return math.floor(lat / self.cell_size), math.floor(lon / self.cell_size)
+
+    def position(self, point_id):
+        return self._points.get(point_id)
+
+    def insert(self, point_id, lat, lon):
+        """Add or move a point"""
+        self.remove(point_id)
+        self._points[point_id] = (lat, lon)
+        self._cells.setdefault(self._cell(lat, lon), set()).add(point_id)
+
+    def remove(self, point_id):
+        point = self._points.pop(point_id, None)
+        if point is None:
+            return
+        cell = self._cell(*point)
+        ids = self._cells[cell]
+        ids.discard(point_id)
+        if not ids:
+            del self._cells[cell]
+
+    def query(self, south, west, north, east):
+        """IDs of the points inside the bounding box"""
+        min_row, min_col = self._cell(south, west)
+        max_row, max_col = self._cell(north, east)
+
+        # Zoomed far out the box covers more cells than are occupied, so walk those instead
+        box_cells = (max_row - min_row + 1) * (max_col - min_col + 1)
+        if box_cells > len(self._cells):
+            cells = [
+                ids
+                for (row, col), ids in self._cells.items()
+                if min_row <= row <= max_row and min_col <= col <= max_col
+            ]
+        else:
+            cells = [
+                self._cells[(row, col)]
+                for row in range(min_row, max_row + 1)
+                for col in range(min_col, max_col + 1)
+                if (row, col) in self._cells
+            ]
+
+        found = []
+        for ids in cells:
+            for point_id in ids:
+                lat, lon = self._points[point_id]
+                if south <= lat <= north and west <= lon <= east:
+                    found.append(point_id)
+        return found
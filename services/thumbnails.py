@@ -0,0 +1,411 @@
+import hashlib
+import http.client
+import io
+import ipaddress
+import logging
+import os
+import socket
+import threading
+import time
+import urllib.parse
+import urllib.request
+from collections import OrderedDict
+
+from services.log import RateLimitedLog
+from services.metrics import REGISTRY
+
+try:
+    from PIL import Image
+except ImportError:  # Thumbnails are kept as fetched without Pillow
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Thumbnails live here, relative to the working directory like the database
+THUMBNAIL_DIR = "thumbnails"
+
+# Bounding box of a thumbnail, and the most disk the directory may use
+THUMBNAIL_SIZE = (320, 240)
+DEFAULT_MAX_CACHE_BYTES = 200 * 2**20
+
+# Remote images larger than this are refused, slower hosts time out
+MAX_IMAGE_BYTES = 10 * 2**20
+FETCH_TIMEOUT_SECONDS = 10
+
+# A URL that failed is not fetched again for this long; at most this many
+# failures are remembered, oldest forgotten first
+FAILURE_RETRY_SECONDS = 60
+MAX_FAILED_URLS = 10000
+
+# Image URLs come from MQTT messages anyone can publish, so only public
+# addresses are fetched (never loopback, private or link-local ones), and
+# when KERBTRACK_IMAGE_HOSTS lists hosts (e.g. "images.example.com,cdn.example.org")
+# only those and their subdomains
+IMAGE_HOSTS = [
+    host.strip().lower().rstrip(".")
+    for host in os.environ.get("KERBTRACK_IMAGE_HOSTS", "").split(",")
+    if host.strip()
+]
+
+# Development only: KERBTRACK_ALLOW_PRIVATE_IMAGES=1 lets image URLs point at
+# loopback and private addresses, e.g. benchmarks/image_host.py on localhost
+ALLOW_PRIVATE_IMAGES = os.environ.get("KERBTRACK_ALLOW_PRIVATE_IMAGES") == "1"
+
+# Other processes may share the directory; its real size is read back this often
+RESCAN_SECONDS = 30
+
+# Without Pillow images are stored as fetched, so they are not small enough
+# to show inline
+THUMBNAILS_AVAILABLE = Image is not None
+
+# Magic numbers of the formats browsers show, fetched data must be one of them
+IMAGE_SIGNATURES = [
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+]
+
+
+class ThumbnailError(Exception):
+    """The image could not be fetched or is not an image"""
+
+
+def image_mimetype(data):
+    """Content type from the first bytes of an image, None if it is not one"""
+    for signature, mimetype in IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return mimetype
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+def check_url(url, hosts=IMAGE_HOSTS):
+    """Raise ValueError unless url is http(s) on an allowed host"""
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise ValueError(f"Not an http(s) URL: {url!r}")
+    host = parts.hostname.lower().rstrip(".")
+    if hosts and not any(host == allowed or host.endswith("." + allowed) for allowed in hosts):
+        raise ValueError(f"Image host {host} is not in KERBTRACK_IMAGE_HOSTS")
+
+
+def check_address(address):
+    """Raise ValueError unless address is a public IP address (or private ones are allowed)"""
+    if ALLOW_PRIVATE_IMAGES:
+        return
+    ip = ipaddress.ip_address(address.split("%")[0])
+    if ip.version == 6 and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    if not ip.is_global or ip.is_multicast:
+        raise ValueError(f"Refusing to fetch from non-public address {address}")
+
+
+def connect_public(address, timeout=socket._GLOBAL_DEFAULT_TIMEOUT, source_address=None):
+    """socket.create_connection, refusing hosts that resolve to a non-public address
+
+    Every address is checked before anything is connected to, and the
+    connection goes to a checked address rather than resolving again, so a
+    DNS answer that changes after the check cannot reach an internal host.
+    """
+    host, port = address
+    infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    for *_, sockaddr in infos:
+        check_address(sockaddr[0])
+    error = OSError(f"No addresses for {host}")
+    for *_, sockaddr in infos:
+        try:
+            return socket.create_connection((sockaddr[0], port), timeout, source_address)
+        except OSError as e:
+            error = e
+    raise error
+
+
+class _PublicHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = connect_public
+
+
+class _PublicHTTPSConnection(http.client.HTTPSConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = connect_public
+
+
+class _PublicHTTPHandler(urllib.request.HTTPHandler):
+    def do_open(self, http_class, request, **kwargs):
+        return super().do_open(_PublicHTTPConnection, request, **kwargs)
+
+
+class _PublicHTTPSHandler(urllib.request.HTTPSHandler):
+    def do_open(self, http_class, request, **kwargs):
+        return super().do_open(_PublicHTTPSConnection, request, **kwargs)
+
+
+class _CheckedRedirectHandler(urllib.request.HTTPRedirectHandler):
+    """Follows redirects only to URLs fetch_image would accept itself"""
+
+    def redirect_request(self, request, fp, code, msg, headers, new_url):
+        check_url(new_url)
+        return super().redirect_request(request, fp, code, msg, headers, new_url)
+
+
+# Straight to the image host, not through a proxy from the environment
+_public_opener = urllib.request.build_opener(
+    urllib.request.ProxyHandler({}),
+    _PublicHTTPHandler,
+    _PublicHTTPSHandler,
+    _CheckedRedirectHandler,
+)
+_any_opener = urllib.request.build_opener(_CheckedRedirectHandler)
+
+
+def fetch_image(
+    url, timeout=FETCH_TIMEOUT_SECONDS, max_bytes=MAX_IMAGE_BYTES, allow_private=False
+):
+    """The bytes at an http(s) URL on a public address (any address with allow_private)"""
+    check_url(url)
+    opener = _any_opener if allow_private else _public_opener
+    request = urllib.request.Request(url, headers={"User-Agent": "KerbTrack thumbnailer"})
+    with opener.open(request, timeout=timeout) as response:
+        data = response.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise ValueError(f"Image larger than {max_bytes} bytes")
+    return data
+
+
+def make_thumbnail(data, size=THUMBNAIL_SIZE):
+    """A JPEG that fits in size, or the image unchanged when Pillow is missing"""
+    if Image is None:
+        return data
+    with Image.open(io.BytesIO(data)) as image:
+        image.thumbnail(size)
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        out = io.BytesIO()
+        image.save(out, "JPEG", quality=80, optimize=True)
+    return out.getvalue()
+
+
+def thumbnail_key(url):
+    """File name (and ETag) for the thumbnail of url"""
+    return hashlib.sha256(url.encode()).hexdigest()[:32]
+
+
+def thumbnail_url(report_id, image_url):
+    """Where the dashboard loads a report's thumbnail from
+
+    The key of the image URL is part of the address, so a report whose
+    image changes gets a new URL and browsers can cache each one forever.
+    """
+    return f"/thumbs/{report_id}?v={thumbnail_key(image_url)[:12]}"
+
+
+class ThumbnailCache:
+    """Downscaled copies of remote images on disk, least recently served evicted first
+
+    get(url) fetches an image the first time it is asked for and stores a
+    thumbnail named after the URL; after that it is served from disk, across
+    restarts too. Concurrent misses for one URL share a single fetch. Once
+    the directory holds more than max_bytes the least recently served
+    thumbnails are deleted; every RESCAN_SECONDS the directory is read back,
+    so workers sharing it keep to one max_bytes between them. fetch(url) ->
+    bytes can be swapped out, e.g. for a local stand-in for the image host.
+    """
+
+    def __init__(
+        self,
+        directory=THUMBNAIL_DIR,
+        max_bytes=DEFAULT_MAX_CACHE_BYTES,
+        size=THUMBNAIL_SIZE,
+        fetch=fetch_image,
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.size = size
+        self._fetch = fetch
+        self._lock = threading.Lock()
+        # name -> (bytes, content type), least recently served first
+        self._entries = OrderedDict()
+        self._total = 0
+        self._scanned_at = 0.0
+        self._fetching = {}
+        # name -> when its fetch failed, oldest first
+        self._failed = OrderedDict()
+        self._log = RateLimitedLog(logger)
+
+        # Stats
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.evictions = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+        if ALLOW_PRIVATE_IMAGES:
+            logger.warning(
+                "KERBTRACK_ALLOW_PRIVATE_IMAGES is set, image URLs may reach internal hosts"
+            )
+        if Image is None:
+            logger.info(
+                "Pillow is not installed, images are cached at full size "
+                "and the table links to them instead of showing them"
+            )
+
+    @property
+    def total_bytes(self):
+        return self._total
+
+    def register_metrics(self, registry=REGISTRY):
+        for name, help_text in (
+            ("hits", "Thumbnails served from disk"),
+            ("misses", "Images fetched and thumbnailed"),
+            ("errors", "Images that could not be fetched or read"),
+            ("evictions", "Thumbnails deleted to stay under the size limit"),
+        ):
+            registry.counter(
+                f"kerbtrack_thumbnail_{name}_total",
+                help_text,
+                function=lambda name=name: getattr(self, name),
+            )
+        registry.gauge(
+            "kerbtrack_thumbnail_cache_bytes",
+            "Disk used by cached thumbnails",
+            function=lambda: self._total,
+        )
+
+    def _scan(self, known=None):
+        """(name, (bytes, content type)) of every thumbnail on disk, least recently served first
+
+        Serving a thumbnail touches its mtime, in every process, so the
+        mtimes order them for all processes sharing the directory.
+        """
+        known = known or {}
+        found = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".tmp") or not entry.is_file():
+                continue
+            try:
+                stat = entry.stat()
+                mimetype = known.get(entry.name, (None, None))[1]
+                if mimetype is None:
+                    with open(entry.path, "rb") as f:
+                        mimetype = image_mimetype(f.read(16))
+            except FileNotFoundError:
+                continue
+            if mimetype is not None:
+                found.append((stat.st_mtime, entry.name, stat.st_size, mimetype))
+        found.sort()
+        return [(name, (size, mimetype)) for _, name, size, mimetype in found]
+
+    def _load(self):
+        """Index thumbnails left by an earlier run, oldest served first"""
+        self._entries = OrderedDict(self._scan())
+        self._total = sum(size for size, _ in self._entries.values())
+        self._scanned_at = time.monotonic()
+        if self._entries:
+            logger.info(
+                "Found %d cached thumbnails (%d bytes)", len(self._entries), self._total
+            )
+        self._evict()
+
+    def _rescan(self):
+        """Re-read the directory, so thumbnails other processes stored count towards max_bytes"""
+        with self._lock:
+            known = dict(self._entries)
+        entries = OrderedDict(self._scan(known))
+        with self._lock:
+            # Stored here while scanning, so missed by it
+            for name, entry in self._entries.items():
+                if name not in known and name not in entries:
+                    entries[name] = entry
+            self._entries = entries
+            self._total = sum(size for size, _ in entries.values())
+            self._evict()
+
+    def get(self, url):
+        """(path, content type) of the thumbnail for url, fetching it on a miss"""
+        name = thumbnail_key(url)
+        path = os.path.join(self.directory, name)
+        while True:
+            with self._lock:
+                entry = self._entries.get(name)
+                if entry is not None:
+                    self._entries.move_to_end(name)
+                    self.hits += 1
+                    break
+                failed_at = self._failed.get(name)
+                if failed_at is not None and time.monotonic() - failed_at < FAILURE_RETRY_SECONDS:
+                    raise ThumbnailError(f"{url} failed recently, not retrying yet")
+                fetching = self._fetching.get(name)
+                waiting = fetching is not None
+                if not waiting:
+                    fetching = self._fetching[name] = threading.Event()
+            if not waiting:
+                return self._create(url, name, path, fetching)
+            # Another thread is fetching this URL - use its result
+            fetching.wait()
+
+        try:
+            # The mtime records serving order for the next run; another
+            # process sharing the directory may have deleted the file
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                if self._entries.pop(name, None) is not None:
+                    self._total -= entry[0]
+            return self.get(url)
+        return path, entry[1]
+
+    def _create(self, url, name, path, fetching):
+        try:
+            try:
+                data = self._fetch(url)
+                if image_mimetype(data) is None:
+                    raise ValueError("response is not an image")
+                data = make_thumbnail(data, self.size)
+            except Exception as e:
+                with self._lock:
+                    self._failed[name] = time.monotonic()
+                    self._failed.move_to_end(name)
+                    if len(self._failed) > MAX_FAILED_URLS:
+                        self._failed.popitem(last=False)
+                    self.errors += 1
+                self._log(logging.WARNING, "fetch", "Could not thumbnail %s: %s", url, e)
+                raise ThumbnailError(f"Could not thumbnail {url}: {e}") from e
+
+            temporary = path + ".tmp"
+            with open(temporary, "wb") as f:
+                f.write(data)
+            os.replace(temporary, path)
+
+            mimetype = image_mimetype(data)
+            with self._lock:
+                self.misses += 1
+                self._failed.pop(name, None)
+                self._entries[name] = (len(data), mimetype)
+                self._total += len(data)
+                self._evict()
+                rescan = time.monotonic() - self._scanned_at > RESCAN_SECONDS
+                if rescan:
+                    self._scanned_at = time.monotonic()
+            if rescan:
+                self._rescan()
+            return path, mimetype
+        finally:
+            with self._lock:
+                del self._fetching[name]
+            fetching.set()
+
+    def _evict(self):
+        """Delete least recently served thumbnails until under max_bytes (lock held)"""
+        while self._total > self.max_bytes and len(self._entries) > 1:
+            name, (size, _) = self._entries.popitem(last=False)
+            self._total -= size
+            self.evictions += 1
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
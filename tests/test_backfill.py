@@ -0,0 +1,69 @@
+"""Startup backfill from the database, with the workbook as a first-run import"""
+
+import os
+import sqlite3
+import time
+
+from layouts.home import backfill
+from services.persistence import ReportDatabase
+from services.report import Report, ReportColumns
+from services.report_store import ReportStore
+
+DAY = 24 * 3600
+
+
+def write_workbook(path, ids, descriptions=None):
+    reports = [Report.from_payload({"ID": i, "Message": "Pothole", "Confidence": 0.5}) for i in ids]
+    ReportColumns.from_reports(reports, descriptions).to_frame().to_excel(path, index=False)
+
+
+def test_first_run_imports_the_workbook(tmp_path):
+    workbook = tmp_path / "mqtt_data.xlsx"
+    write_workbook(workbook, [1, 2, 3], {2: "Cracked kerb"})
+    modified = time.time() - 3600
+    os.utime(workbook, (modified, modified))
+    database = ReportDatabase(str(tmp_path / "kerbtrack.db"))
+    store = ReportStore(eviction_path=None)
+
+    assert backfill(store, database, workbook) == 3
+    assert store.description(2) == "Cracked kerb"
+    assert store.get(1).get("Confidence") == 0.5
+    assert abs(store.get(1).timestamp - modified) < 1
+    assert store.dirty_count == 0
+
+
+def test_restart_keeps_receive_times_and_skips_the_workbook(tmp_path):
+    database = ReportDatabase(str(tmp_path / "kerbtrack.db"))
+    now = time.time()
+    database.upsert_reports(
+        [
+            Report.from_payload({"ID": 1, "Message": "Old"}, now - 8 * DAY),
+            Report.from_payload({"ID": 2, "Message": "Recent"}, now - DAY),
+            Report.from_payload({"ID": 3, "Message": "New"}, now - 60),
+        ]
+    )
+    workbook = tmp_path / "mqtt_data.xlsx"
+    write_workbook(workbook, [4, 5])
+    with sqlite3.connect(database.path) as conn:
+        before = conn.execute("SELECT * FROM reports ORDER BY id").fetchall()
+
+    store = ReportStore(eviction_path=None)
+    assert backfill(store, database, workbook) == 2
+    assert sorted(report.id for report in store.snapshot()) == [2, 3]
+    assert abs(store.get(2).timestamp - (now - DAY)) < 1
+
+    # Nothing is written back, so seq and received_at stay as they were
+    with sqlite3.connect(database.path) as conn:
+        assert conn.execute("SELECT * FROM reports ORDER BY id").fetchall() == before
+
+
+def test_backfill_keeps_the_newest_up_to_the_cap(tmp_path):
+    database = ReportDatabase(str(tmp_path / "kerbtrack.db"))
+    now = time.time()
+    database.upsert_reports(
+        [Report.from_payload({"ID": i, "Message": "m"}, now - 100 + i) for i in range(10)]
+    )
+    store = ReportStore(max_reports=4, eviction_path=None)
+
+    assert backfill(store, database, tmp_path / "missing.xlsx") == 4
+    assert [report.id for report in store.snapshot()] == [6, 7, 8, 9]
@@ -0,0 +1,73 @@
+"""Column filters as the DataTable filter row sends them, through ReportStore.query"""
+
+from layouts.home import parse_filter_query
+from services.report import Report
+from services.report_store import ReportStore
+
+
+def store():
+    store = ReportStore(eviction_path=None)
+    store.upsert_many(
+        [
+            Report.from_payload({"ID": 1, "Address": "Hunter St, Newcastle", "Message": "Pothole"}),
+            Report.from_payload({"ID": 2, "Address": "King St, Newcastle", "Message": "Graffiti"}),
+            Report.from_payload({"ID": 3, "Address": "hunter st, Mayfield", "Message": "pothole"}),
+            Report.from_payload({"ID": 4, "Address": "Darby St, Cooks Hill", "Message": "Sign"}),
+        ]
+    )
+    return store
+
+
+def matching_ids(filter_query):
+    total, page = store().query(filters=parse_filter_query(filter_query), limit=100)
+    return sorted(report.id for report in page)
+
+
+def test_parses_case_prefixed_operators():
+    assert parse_filter_query("{Address} scontains hunter") == [
+        ("Address", "contains", "hunter", False)
+    ]
+    assert parse_filter_query("{Address} icontains hunter") == [
+        ("Address", "contains", "hunter", True)
+    ]
+    assert parse_filter_query("{ID} s= 3 && {ID} s> 1") == [
+        ("ID", "=", "3", False),
+        ("ID", ">", "1", False),
+    ]
+    assert parse_filter_query("{ID} ige 2") == [("ID", ">=", "2", True)]
+
+
+def test_bare_operators_ignore_case():
+    assert parse_filter_query("{Message} contains pot") == [
+        ("Message", "contains", "pot", True)
+    ]
+    assert parse_filter_query('{Address} = "King St, Newcastle"') == [
+        ("Address", "=", "King St, Newcastle", True)
+    ]
+
+
+def test_unknown_operators_are_skipped():
+    assert parse_filter_query("{Address} sfoo hunter") == []
+    assert parse_filter_query("{Address} is blank") == []
+
+
+def test_case_sensitive_contains():
+    assert matching_ids("{Address} scontains hunter") == [3]
+    assert matching_ids("{Address} scontains Hunter") == [1]
+
+
+def test_case_insensitive_contains():
+    assert matching_ids("{Address} icontains hunter") == [1, 3]
+    assert matching_ids("{Message} icontains POTHOLE") == [1, 3]
+
+
+def test_numeric_comparisons():
+    assert matching_ids("{ID} s= 3") == [3]
+    assert matching_ids("{ID} s> 3") == [4]
+    assert matching_ids("{ID} s> 1 && {ID} i< 4") == [2, 3]
+
+
+def test_case_sensitive_equals_on_indexed_address():
+    assert matching_ids('{Address} s= "hunter st, Mayfield"') == [3]
+    assert matching_ids('{Address} s= "Hunter St, Mayfield"') == []
+    assert matching_ids('{Address} i= "Hunter St, Mayfield"') == [3]
@@ -0,0 +1,39 @@
+"""DatabaseFollower keeps the database's seqs and receive times"""
+
+import time
+
+from services.follower import DatabaseFollower
+from services.persistence import ReportDatabase
+from services.report import Report
+from services.report_store import ReportStore
+
+DAY = 24 * 3600
+
+
+def test_followed_reports_keep_their_receive_times(tmp_path):
+    database = ReportDatabase(str(tmp_path / "kerbtrack.db"))
+    now = time.time()
+    database.upsert_reports(
+        [
+            Report.from_payload({"ID": 1, "Message": "Old"}, now - 8 * DAY),
+            Report.from_payload({"ID": 2, "Message": "Recent"}, now - DAY),
+        ]
+    )
+    store = ReportStore(eviction_path=None, epoch=database.epoch)
+
+    DatabaseFollower(database, store).poll()
+
+    assert [report.id for report in store.snapshot()] == [2]
+    assert abs(store.get(2).timestamp - (now - DAY)) < 1
+    assert store.seq == 2
+
+
+def test_stored_age_decides_eviction(tmp_path):
+    database = ReportDatabase(str(tmp_path / "kerbtrack.db"))
+    now = time.time()
+    database.upsert_reports([Report.from_payload({"ID": 1, "Message": "m"}, now - 100)])
+    store = ReportStore(max_age_seconds=150, eviction_path=None, epoch=database.epoch)
+    DatabaseFollower(database, store).poll()
+
+    assert store.evict_expired(now + 30) == 0
+    assert store.evict_expired(now + 60) == 1
@@ -0,0 +1,163 @@
+"""merge_with_existing against the iterrows merge it replaced in save_to_excel"""
+
+import numpy as np
+import pandas as pd
+
+from layouts.home import merge_with_existing
+
+
+def legacy_merge(new_df, existing_df):
+    """The original row-by-row merge from save_to_excel, logging removed"""
+    new_df = new_df.copy()
+    existing_df = existing_df.copy()
+
+    description_map = {}
+    if "Image_Description" in existing_df.columns:
+        for _, row in existing_df.iterrows():
+            row_id = str(row["ID"]).strip()
+            desc = str(row["Image_Description"]).strip()
+            if desc and desc != "nan" and desc != "Pending...":
+                description_map[row_id] = desc
+
+    if "Image_Description" not in new_df.columns:
+        new_df["Image_Description"] = "Pending..."
+
+    for idx, row in new_df.iterrows():
+        row_id = str(row["ID"]).strip()
+        if row_id in description_map:
+            new_df.at[idx, "Image_Description"] = description_map[row_id]
+        elif (
+            pd.isna(new_df.at[idx, "Image_Description"])
+            or new_df.at[idx, "Image_Description"] == "nan"
+        ):
+            new_df.at[idx, "Image_Description"] = "Pending..."
+
+    existing_df["ID"] = pd.to_numeric(existing_df["ID"], errors="coerce")
+
+    combined_data = []
+    new_ids = set(new_df["ID"].astype(str))
+    for _, row in new_df.iterrows():
+        combined_data.append(row.to_dict())
+    for _, row in existing_df.iterrows():
+        if str(row["ID"]) not in new_ids:
+            row_dict = row.to_dict()
+            if "Image_Description" not in row_dict:
+                row_dict["Image_Description"] = "Pending..."
+            combined_data.append(row_dict)
+
+    final_df = pd.DataFrame(combined_data)
+    final_df["ID"] = pd.to_numeric(final_df["ID"], errors="coerce")
+    final_df = final_df.sort_values("ID")
+    return final_df.drop_duplicates(subset=["ID"], keep="first")
+
+
+def prepared(df):
+    """New data as save_to_excel hands it over: one row per ID, numeric, sorted"""
+    df = df.drop_duplicates(subset=["ID"], keep="last")
+    df["ID"] = pd.to_numeric(df["ID"], errors="coerce")
+    return df.sort_values("ID")
+
+
+def rows(df):
+    """Rows as plain tuples, so frames built differently compare by value"""
+    df = df[["ID", "GPS", "Address", "Message", "Image_Description"]]
+    return [tuple(value(v) for v in row) for row in df.itertuples(index=False)]
+
+
+def value(v):
+    if pd.isna(v):
+        return None
+    return float(v) if isinstance(v, (int, float, np.number)) else v
+
+
+def frame(ids, descriptions=None, message="new"):
+    data = {
+        "ID": ids,
+        "GPS": [f"-32.9{i}, 151.7{i}" for i in ids],
+        "Address": [f"{i} Hunter St" for i in ids],
+        "Message": [f"{message} {i}" for i in ids],
+    }
+    if descriptions is not None:
+        data["Image_Description"] = descriptions
+    return pd.DataFrame(data)
+
+
+def test_matches_legacy_merge():
+    new_df = prepared(
+        frame(
+            [5, 1, 3, 7, 2],
+            ["Pothole", "nan", np.nan, "Pending...", "Graffiti"],
+        )
+    )
+    existing_df = frame(
+        [1, 2, 3, 4, 6],
+        ["Cracked kerb", "Old text", "", "Pending...", "Broken sign"],
+        message="old",
+    )
+
+    merged = merge_with_existing(new_df, existing_df)
+
+    assert rows(merged) == rows(legacy_merge(new_df, existing_df))
+
+
+def test_matches_legacy_merge_without_descriptions():
+    new_df = prepared(frame([3, 1, 2]))
+    existing_df = frame([2, 4, 5], message="old")
+
+    merged = merge_with_existing(new_df, existing_df)
+
+    assert rows(merged) == rows(legacy_merge(new_df, existing_df))
+    assert list(merged["Image_Description"]) == ["Pending..."] * 5
+
+
+def test_matches_legacy_merge_on_larger_frames():
+    rng = np.random.default_rng(7)
+    choices = np.array(["Pothole", "Graffiti", "Pending...", "nan", ""], dtype=object)
+    new_ids = rng.choice(np.arange(1, 400), size=150, replace=False)
+    old_ids = rng.choice(np.arange(1, 400), size=200, replace=False)
+    new_df = prepared(frame(list(new_ids), list(rng.choice(choices, size=150))))
+    existing_df = frame(list(old_ids), list(rng.choice(choices, size=200)), message="old")
+
+    merged = merge_with_existing(new_df, existing_df)
+
+    assert rows(merged) == rows(legacy_merge(new_df, existing_df))
+
+
+def test_int_and_float_ids_match():
+    # Difference 1: 4 and 4.0 are the same report, the saved description is found
+    new_df = prepared(frame([4, 5], ["Pending...", "Pending..."]))
+    existing_df = frame([4.0, 6.0], ["Cracked kerb", "Broken sign"], message="old")
+
+    merged = merge_with_existing(new_df, existing_df)
+    legacy = legacy_merge(new_df, existing_df)
+
+    assert list(merged["ID"]) == [4, 5, 6]
+    assert merged.set_index("ID").at[4, "Image_Description"] == "Cracked kerb"
+    assert legacy.set_index("ID").at[4, "Image_Description"] == "Pending..."
+
+
+def test_new_row_wins_for_shared_ids():
+    # Difference 2: a stable sort keeps the new row where an ID is in both frames.
+    # Float IDs in the saved file make every ID look new to the legacy merge,
+    # and its default sort then keeps whichever duplicate lands first.
+    ids = list(range(1, 101))
+    new_df = prepared(frame(ids, ["Pending..."] * 100))
+    existing_df = frame([float(i) for i in ids], ["Pending..."] * 100, message="old")
+
+    merged = merge_with_existing(new_df, existing_df)
+    legacy = legacy_merge(new_df, existing_df)
+
+    assert list(merged["Message"]) == [f"new {i}" for i in ids]
+    assert any(message.startswith("old") for message in legacy["Message"])
+
+
+def test_saved_none_is_not_written_back():
+    # Difference 3: a saved None is a missing description, not the string "None"
+    new_df = prepared(frame([1, 2], ["Pending...", "Pothole"]))
+    existing_df = frame([1, 2], [None, None], message="old")
+
+    merged = merge_with_existing(new_df, existing_df)
+    legacy = legacy_merge(new_df, existing_df)
+
+    assert list(merged["Image_Description"]) == ["Pending...", "Pothole"]
+    assert list(legacy["Image_Description"]) == ["None", "None"]
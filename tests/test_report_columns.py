@@ -0,0 +1,51 @@
+"""ReportColumns keeps extra payload fields through frames and back to reports"""
+
+from services.report import Report, ReportColumns
+
+
+def reports():
+    return [
+        Report.from_payload(
+            {
+                "ID": 1,
+                "GPS": "32.92° S, 151.77° E",
+                "Address": "Hunter St, Newcastle",
+                "Message": "Pothole",
+                "Confidence": 0.92,
+                "Timestamp": "2026-09-01T10:00:00",
+            }
+        ),
+        Report.from_payload({"ID": 2, "Address": "King St, Newcastle", "Message": "Sign"}),
+        Report.from_payload({"ID": 3, "Message": "Graffiti", "Confidence": 0.5}),
+    ]
+
+
+def test_extra_fields_in_frame():
+    df = ReportColumns.from_reports(reports(), {1: "Cracked kerb"}).to_frame()
+
+    assert list(df.columns) == [
+        "ID", "GPS", "Address", "Message", "ImageURL", "Lat", "Lon",
+        "Confidence", "Timestamp", "Image_Description",
+    ]
+    assert df["Confidence"].tolist()[0] == 0.92
+    assert df["Timestamp"][0] == "2026-09-01T10:00:00"
+    assert df["Timestamp"][1:].isna().all()
+    assert df["Image_Description"].tolist() == ["Cracked kerb", "Pending...", "Pending..."]
+
+
+def test_reports_round_trip_through_frame():
+    originals = reports()
+    columns = ReportColumns.from_frame(ReportColumns.from_reports(originals).to_frame())
+
+    assert [report.to_dict() for report in columns.reports()] == [
+        report.to_dict() for report in originals
+    ]
+
+
+def test_reports_without_extra_fields():
+    originals = [Report.from_payload({"ID": 7, "Message": "Sign"})]
+    columns = ReportColumns.from_reports(originals)
+
+    assert columns.extra == {}
+    assert [report.extra for report in columns.reports()] == [None]
+    assert list(columns.to_frame().columns)[-1] == "Image_Description"
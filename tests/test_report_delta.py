@@ -0,0 +1,42 @@
+"""Cursor deltas: resets only for clients that need one"""
+
+from services.report import Report
+from services.report_store import ReportStore
+
+
+def test_empty_store_client_at_seq_zero_is_up_to_date():
+    store = ReportStore(eviction_path=None)
+
+    assert not store.needs_reset(store.epoch, 0)
+    assert store.delta_since(store.epoch, 0) is None
+
+
+def test_new_and_foreign_clients_get_a_reset():
+    store = ReportStore(eviction_path=None)
+
+    assert store.needs_reset(None, 0)
+    assert store.needs_reset("another-epoch", 0)
+    assert store.delta_since(None, 0)["reset"]
+
+
+def test_client_behind_gets_the_changed_ids():
+    store = ReportStore(eviction_path=None)
+    store.upsert_many([Report.from_payload({"ID": 1}), Report.from_payload({"ID": 2})])
+    seq = store.seq
+    store.upsert_many([Report.from_payload({"ID": 3})])
+    store.set_descriptions({1: "Pothole"})
+
+    assert not store.needs_reset(store.epoch, seq)
+    delta = store.delta_since(store.epoch, seq)
+    assert not delta["reset"]
+    assert delta["ids"] == [3, 1]
+    assert delta["seq"] == store.seq
+    assert store.delta_since(store.epoch, store.seq) is None
+
+
+def test_client_at_seq_zero_of_a_filled_store_gets_a_reset():
+    store = ReportStore(eviction_path=None)
+    store.upsert_many([Report.from_payload({"ID": 1})])
+
+    assert store.needs_reset(store.epoch, 0)
+    assert store.delta_since(store.epoch, 0)["reset"]
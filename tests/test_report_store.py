@@ -0,0 +1,26 @@
+"""ReportStore retention"""
+
+from services.report import Report
+from services.report_store import ReportStore
+
+
+def test_eviction_drops_descriptions():
+    store = ReportStore(max_reports=2, eviction_path=None)
+    store.upsert_many([Report.from_payload({"ID": 1}), Report.from_payload({"ID": 2})])
+    store.set_descriptions({1: "Pothole", 2: "Sign"})
+    seq = store.seq
+    store.upsert_many([Report.from_payload({"ID": 3})])
+
+    assert store.description(1) is None
+    assert store.description(2) == "Sign"
+    assert 1 not in store._descriptions and 1 not in store._described
+    assert store.delta_since(store.epoch, seq)["removed"] == [1]
+
+
+def test_age_eviction_drops_descriptions():
+    store = ReportStore(max_age_seconds=60, eviction_path=None)
+    store.upsert_many([Report.from_payload({"ID": 1})], received_at=1000.0)
+    store.set_descriptions({1: "Pothole"})
+
+    assert store.evict_expired(now=1100.0) == 1
+    assert store._descriptions == {} and not store._described
@@ -0,0 +1,21 @@
+"""WSGI entry point for running the dashboard under several workers
+
+    python ingest_worker.py &
+    export KERBTRACK_THREADS=32
+    gunicorn -w 4 -k gthread --threads $KERBTRACK_THREADS -b 0.0.0.0:8050 wsgi:server
+
+Each worker is a web worker (KERBTRACK_ROLE, "web" unless set): it serves
+reports from the database ingest_worker.py writes, with no MQTT
+subscription of its own. Do not use gunicorn --preload, the thread that
+follows the database has to start in every worker, not in the master.
+Use threaded workers: every open /events stream holds a thread, and
+KERBTRACK_THREADS tells the app how many there are so streams can take at
+most half of them.
+"""
+
+import os
+
+from app import create_app
+
+app = create_app(role=os.environ.get("KERBTRACK_ROLE", "web"))
+server = app.server